@@ -0,0 +1,56 @@
+"""add media_info table
+
+Revision ID: media_info_001
+Revises: oauth_tokens_001
+Create Date: 2026-10-19 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = 'media_info_001'
+down_revision = 'oauth_tokens_001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'media_info',
+        sa.Column('id', sa.Uuid(), primary_key=True),
+        sa.Column('original_file_id', sa.Uuid(), sa.ForeignKey('original_files.id'), nullable=False, unique=True),
+        sa.Column('probe_version', sa.Integer(), nullable=False, server_default='1'),
+        sa.Column('format_name', sa.String(), nullable=False),
+        sa.Column('duration_ms', sa.Integer(), nullable=False),
+        sa.Column('size_bytes', sa.BigInteger(), nullable=False),
+        sa.Column('bit_rate', sa.BigInteger(), nullable=False),
+        sa.Column('creation_time', sa.String(), nullable=True),
+        sa.Column('video_codec', sa.String(), nullable=True),
+        sa.Column('video_profile', sa.String(), nullable=True),
+        sa.Column('pix_fmt', sa.String(), nullable=True),
+        sa.Column('level', sa.Integer(), nullable=True),
+        sa.Column('width', sa.Integer(), nullable=False),
+        sa.Column('height', sa.Integer(), nullable=False),
+        sa.Column('fps', sa.Float(), nullable=False),
+        sa.Column('video_bit_rate', sa.BigInteger(), nullable=False),
+        sa.Column('rotation', sa.Integer(), nullable=False),
+        sa.Column('has_audio', sa.Boolean(), nullable=False),
+        sa.Column('audio_codec', sa.String(), nullable=True),
+        sa.Column('audio_channels', sa.Integer(), nullable=False),
+        sa.Column('audio_sample_rate', sa.Integer(), nullable=False),
+        sa.Column('frame_count', sa.Integer(), nullable=False),
+        sa.Column('keyframe_count', sa.Integer(), nullable=False),
+        sa.Column('mean_gop_frames', sa.Float(), nullable=False),
+        sa.Column('max_gop_frames', sa.Integer(), nullable=False),
+        sa.Column('streams_json', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now()),
+    )
+    op.create_index('ix_media_info_original_file_id', 'media_info', ['original_file_id'])
+
+
+def downgrade():
+    op.drop_index('ix_media_info_original_file_id', 'media_info')
+    op.drop_table('media_info')
@@ -0,0 +1,40 @@
+"""add filename_versions counters
+
+Revision ID: filename_versions_001
+Revises: media_info_001
+Create Date: 2026-10-19 00:00:00
+
+"""
+import re
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'filename_versions_001'
+down_revision = 'media_info_001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'filename_versions',
+        sa.Column('base', sa.String(), primary_key=True),
+        sa.Column('last_version', sa.Integer(), nullable=False, server_default='0'),
+    )
+
+    # seed the counters with the highest version each base already has
+    last = {}
+    for (filename,) in op.get_bind().execute(sa.text("SELECT filename FROM final_clips")):
+        match = re.search(r'^(.*)__v(\d+)\.mp4$', filename)
+        if match:
+            last[match.group(1)] = max(last.get(match.group(1), 0), int(match.group(2)))
+
+    if last:
+        table = sa.table('filename_versions', sa.column('base', sa.String()), sa.column('last_version', sa.Integer()))
+        op.bulk_insert(table, [{"base": base, "last_version": v} for base, v in last.items()])
+
+
+def downgrade():
+    op.drop_table('filename_versions')
@@ -0,0 +1,64 @@
+"""add per-video review counters and sort navigation indexes
+
+Revision ID: review_counts_001
+Revises: filename_versions_001
+Create Date: 2026-10-19 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'review_counts_001'
+down_revision = 'filename_versions_001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_candidate_segments_file_status_start', 'candidate_segments',
+        ['original_file_id', 'status', 'start_ms']
+    )
+    op.create_index(
+        'ix_candidate_segments_status_confidence', 'candidate_segments',
+        ['status', 'confidence_score']
+    )
+
+    op.create_table(
+        'video_review_counts',
+        sa.Column('original_file_id', sa.Uuid(), sa.ForeignKey('original_files.id'), primary_key=True),
+        sa.Column('total', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('unreviewed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('accepted', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('trashed', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.create_table(
+        'sort_counters',
+        sa.Column('name', sa.String(), primary_key=True),
+        sa.Column('value', sa.Integer(), nullable=False, server_default='0'),
+    )
+
+    # backfill from the segments already there
+    op.execute("""
+        INSERT INTO video_review_counts (original_file_id, total, unreviewed, accepted, trashed)
+        SELECT original_file_id,
+               COUNT(*),
+               SUM(CASE WHEN status = 'UNREVIEWED' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN status = 'ACCEPTED' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN status = 'TRASHED' THEN 1 ELSE 0 END)
+        FROM candidate_segments
+        GROUP BY original_file_id
+    """)
+    op.execute("""
+        INSERT INTO sort_counters (name, value)
+        SELECT 'videos_remaining', COUNT(*) FROM video_review_counts WHERE unreviewed > 0
+    """)
+
+
+def downgrade():
+    op.drop_table('sort_counters')
+    op.drop_table('video_review_counts')
+    op.drop_index('ix_candidate_segments_status_confidence', 'candidate_segments')
+    op.drop_index('ix_candidate_segments_file_status_start', 'candidate_segments')
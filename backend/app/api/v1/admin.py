@@ -4,6 +4,7 @@ from app.core.db import get_session, engine
 from app.services.storage_manager import storage_manager
 from app.services.drive_sync import drive_sync
 from app.services.queue import enqueue_job
+from app.worker import generate_proxy_for_file  # kept importable here for jobs queued under the old path
 from pydantic import BaseModel
 from typing import Optional
 from uuid import UUID
@@ -31,17 +32,42 @@ def trigger_cleanup(request: CleanupRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/admission")
+def get_admission():
+    """what the workers are admitting right now and why the rest is held"""
+    from app.services.admission import admission
+    from app.services.queue import QUEUE_NAMES
+    
+    snap = admission.snapshot(max_age=0)
+    return {
+        **snap,
+        "held": {name: reason for name in QUEUE_NAMES if (reason := admission.queue_blocked(name, snap))}
+    }
+
+@router.post("/review-counts/rebuild")
+def rebuild_review_counts(session: Session = Depends(get_session)):
+    """recount the per-video sort counters from the segments table"""
+    from app.services import review_counts
+    return review_counts.rebuild(session)
+
 @router.post("/reprocess/{file_id}")
 def reprocess_file(file_id: str):
     """manually trigger reprocessing of a file"""
-    from app.worker import analyze_original_file
+    from app.services.analysis_pipeline import enqueue_analysis
     
     try:
         file_uuid = UUID(file_id)
-        job = enqueue_job(analyze_original_file, file_uuid, file_id=file_uuid)
+        queued = enqueue_analysis(file_uuid)
+        if queued is None:
+            return {
+                "success": True,
+                "already_queued": True
+            }
         return {
             "success": True,
-            "job_id": job.id
+            "position": queued["position"],
+            "eta_seconds": queued["eta_seconds"],
+            "predicted_seconds": round(queued["predicted"]["total_seconds"])
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -91,6 +117,8 @@ def get_detection_debug(file_id: UUID, session: Session = Depends(get_session)):
     from app.detection.stage1_audio import compute_audio_energy_timeseries
     from app.detection.stage1_candidates import find_candidate_windows
     from app.detection.config import DetectionConfig
+    from app.detection.signal_pyramid import load_signal_pyramid, save_signal_pyramids, query_pyramid
+    import numpy as np
     
     try:
         # get file
@@ -98,12 +126,28 @@ def get_detection_debug(file_id: UUID, session: Session = Depends(get_session)):
         if not file:
             raise HTTPException(status_code=404, detail="file not found")
         
-        # generate proxy
-        proxy_path = generate_proxy_video(file.stored_path)
+        # reuse the signals stored at analysis time; only recompute if missing
+        # (audio may legitimately be absent for files without an audio track)
+        motion_levels = load_signal_pyramid(file_id, "motion")
+        audio_levels = load_signal_pyramid(file_id, "audio") or []
         
-        # compute timeseries
-        motion_times, motion_energy = compute_motion_energy_timeseries(proxy_path)
-        audio_times, audio_energy = compute_audio_energy_timeseries(proxy_path)
+        if motion_levels is None:
+            proxy_path = generate_proxy_video(file.stored_path)
+            motion_times, motion_energy = compute_motion_energy_timeseries(proxy_path)
+            audio_times, audio_energy = compute_audio_energy_timeseries(proxy_path)
+            save_signal_pyramids(file_id, {
+                "motion": (motion_times, motion_energy),
+                "audio": (audio_times, audio_energy),
+            })
+            motion_levels = load_signal_pyramid(file_id, "motion") or []
+            audio_levels = load_signal_pyramid(file_id, "audio") or []
+        
+        # level 0 of a pyramid is the raw signal
+        empty = np.array([])
+        motion_times = motion_levels[0]["t0"] if motion_levels else empty
+        motion_energy = motion_levels[0]["mean"] if motion_levels else empty
+        audio_times = audio_levels[0]["t0"] if audio_levels else empty
+        audio_energy = audio_levels[0]["mean"] if audio_levels else empty
         
         # get candidate windows
         config = DetectionConfig()
@@ -120,16 +164,20 @@ def get_detection_debug(file_id: UUID, session: Session = Depends(get_session)):
             .order_by(CandidateSegment.start_ms)
         ).all()
         
-        # downsample timeseries for response (every 10th sample)
-        motion_downsampled = {
-            "times": motion_times[::10].tolist() if len(motion_times) > 0 else [],
-            "energy": motion_energy[::10].tolist() if len(motion_energy) > 0 else []
-        }
+        # downsample with the min/max/mean pyramid so peaks survive
+        # (energy is the bucket max; use /api/signals to zoom in)
+        def downsample(levels):
+            buckets = query_pyramid(levels, max_points=1000)
+            return {
+                "times": buckets["t0"],
+                "energy": buckets["max"],
+                "min": buckets["min"],
+                "mean": buckets["mean"],
+                "level": buckets["level"]
+            }
         
-        audio_downsampled = {
-            "times": audio_times[::10].tolist() if len(audio_times) > 0 else [],
-            "energy": audio_energy[::10].tolist() if len(audio_energy) > 0 else []
-        }
+        motion_downsampled = downsample(motion_levels)
+        audio_downsampled = downsample(audio_levels)
         
         return {
             "file_id": str(file_id),
@@ -230,7 +278,8 @@ def test_drive_access():
 def sync_from_drive_dump():
     """poll drive dump folder and download new videos for processing (respecting disk space)"""
     from app.worker import download_and_process_from_drive
-    from app.services.queue import queue
+    from app.services.queue import enqueue_unique
+    from app.services.admission import download_bytes
     from app.models import OriginalFile
     
     try:
@@ -254,29 +303,24 @@ def sync_from_drive_dump():
             }
         
         # queue download jobs for each video with extended timeout
-        # prevent duplicate jobs by checking both RQ queue and database
+        # get_download_queue skips files already in the DB, the unique marker
+        # skips downloads already queued or running
         jobs_queued = []
         for video in videos:
             drive_file_id = video['id']
             
-            # check if job already queued or running
-            existing_job_queued = False
-            for job in queue.jobs:
-                if job.args and len(job.args) > 0 and job.args[0] == drive_file_id:
-                    print(f"DEBUG: job already queued for {video['name']}, skipping")
-                    existing_job_queued = True
-                    break
-            
-            if existing_job_queued:
-                continue
-            
-            job = enqueue_job(
+            job = enqueue_unique(
                 download_and_process_from_drive,
                 drive_file_id,
+                drive_file_id,
                 video['name'],
                 int(video.get('size', 0)),
-                timeout='2h'
+                timeout='2h',
+                reserve_bytes=download_bytes(int(video.get('size', 0)))
             )
+            if job is None:
+                print(f"DEBUG: job already queued for {video['name']}, skipping")
+                continue
             jobs_queued.append(job.id)
             print(f"DEBUG: queued job {job.id} for {video['name']}")
         
@@ -293,14 +337,22 @@ def sync_from_drive_dump():
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/generate-proxies")
-def generate_missing_proxies(session: Session = Depends(get_session)):
+def generate_missing_proxies(bulk: bool = False, lookahead: Optional[int] = None, session: Session = Depends(get_session)):
     """
-    Queue background jobs to generate playback proxies for all videos that don't have them.
-    Returns immediately with job IDs.
+    Queue playback proxy builds. By default only the next `lookahead` videos in
+    sort order get proxies (and fully reviewed videos lose theirs); bulk=true
+    queues every video that doesn't have one.
+    Returns immediately; builds already queued or running are not queued again.
     """
     from app.models import OriginalFile
-    from pathlib import Path
-    import os
+    from app.services.proxy_coordinator import proxy_coordinator
+    from app.services.proxy_scheduler import proxy_scheduler
+    
+    if not bulk:
+        try:
+            return proxy_scheduler.schedule(lookahead=lookahead)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
     
     try:
         # Get all original files
@@ -310,6 +362,7 @@ def generate_missing_proxies(session: Session = Depends(get_session)):
             "total_videos": len(files),
             "jobs_queued": 0,
             "proxies_exist": 0,
+            "already_pending": 0,
             "skipped": []
         }
         
@@ -321,25 +374,18 @@ def generate_missing_proxies(session: Session = Depends(get_session)):
                 })
                 continue
             
-            # Check if proxy already exists
-            input_path_obj = Path(file.stored_path)
-            proxy_filename = input_path_obj.stem + "_web.mp4"
-            proxy_dir = Path(os.getenv("DATA_DIR", "/data")) / "playback_proxies"
-            proxy_path = proxy_dir / proxy_filename
-            
-            if proxy_path.exists():
+            before = proxy_coordinator.get_status(file.id, file.stored_path)
+            if before["status"] == "ready":
                 results["proxies_exist"] += 1
                 continue
+            if before["status"] in ("queued", "generating"):
+                results["already_pending"] += 1
+                continue
             
-            # Queue background job to generate proxy
-            job = enqueue_job(
-                generate_proxy_for_file,
-                str(file.id),
-                file_id=file.id,
-                timeout='1h'
-            )
+            # single-flight: queues a build only if none is pending for this file
+            status = proxy_coordinator.request_proxy(file.id, file.stored_path)
             results["jobs_queued"] += 1
-            print(f"Queued proxy generation for {file.original_filename} (job {job.id})")
+            print(f"Queued proxy generation for {file.original_filename} (job {status.get('job_id')})")
         
         return results
         
@@ -347,34 +393,6 @@ def generate_missing_proxies(session: Session = Depends(get_session)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def generate_proxy_for_file(file_id_str: str):
-    """Background worker job to generate a playback proxy for a single file"""
-    from app.models import OriginalFile
-    from app.video.proxy_utils import generate_playback_proxy
-    from uuid import UUID
-    import os
-    
-    with Session(engine) as session:
-        file = session.get(OriginalFile, UUID(file_id_str))
-        if not file:
-            print(f"File {file_id_str} not found")
-            return
-        
-        if not os.path.exists(file.stored_path):
-            print(f"Original file not found: {file.stored_path}")
-            return
-        
-        try:
-            print(f"[PROXY] Generating playback proxy for: {file.original_filename}")
-            proxy_path = generate_playback_proxy(file.stored_path, max_height=1080)
-            print(f"[PROXY] ✅ Success: {proxy_path}")
-        except Exception as e:
-            print(f"[PROXY] ❌ Failed for {file.original_filename}: {e}")
-            import traceback
-            traceback.print_exc()
-            raise
-
-
 @router.get("/system-stats")
 def get_system_stats():
     """Get real-time system statistics"""
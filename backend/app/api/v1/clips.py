@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, Query
 from sqlmodel import Session, select, or_, and_
 from app.core.db import get_session
 from app.models import FinalClip, Person, Trick, OriginalFile
+from app.services.thumbnail_service import thumbnail_service
 from typing import Optional, List
 from uuid import UUID
 
@@ -92,6 +93,7 @@ def list_clips(
             "fps": clip.fps_label,
             "camera": clip.camera_id,
             "drive_url": clip.drive_url,
+            "poster_url": thumbnail_service.poster_url_for_clip(clip, original) if original else None,
             "is_uploaded": clip.is_uploaded_to_drive,
             "original_file_id": clip.original_file_id,
             "start_ms": clip.start_ms,
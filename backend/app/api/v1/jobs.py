@@ -1,15 +1,20 @@
-from fastapi import APIRouter, Depends, Query
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, Query, HTTPException
+from sqlmodel import Session, select, func
 from app.core.db import get_session
 from app.models import Job as JobModel
-from app.services.queue import queue, redis_conn
+from app.services.queue import queues, redis_conn
+from app.services.job_tracker import get_job_states
 from rq.job import Job
 from rq.registry import StartedJobRegistry, FinishedJobRegistry, FailedJobRegistry
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
+from pydantic import BaseModel
 
 router = APIRouter()
 
+class DeadLetterRequest(BaseModel):
+    ids: Optional[List[str]] = None  # None = every dead-lettered job
+
 @router.get("/")
 def get_jobs(
     session: Session = Depends(get_session),
@@ -21,9 +26,12 @@ def get_jobs(
     # sync job statuses with RQ registries before returning
     # this catches jobs that were killed or failed without updating the DB
     try:
-        failed_registry = FailedJobRegistry(queue=queue)
-        finished_registry = FinishedJobRegistry(queue=queue)
-        started_registry = StartedJobRegistry(queue=queue)
+        # jobs are spread over one queue per job type, check all of them
+        failed_ids, finished_ids, started_ids = set(), set(), set()
+        for q in queues.values():
+            failed_ids.update(FailedJobRegistry(queue=q).get_job_ids())
+            finished_ids.update(FinishedJobRegistry(queue=q).get_job_ids())
+            started_ids.update(StartedJobRegistry(queue=q).get_job_ids())
         
         # get all "running" jobs from DB and check if they're actually still running
         running_db_jobs = session.exec(select(JobModel).where(JobModel.status == "running")).all()
@@ -31,7 +39,7 @@ def get_jobs(
             rq_job_id = db_job.rq_job_id
             
             # check if this job is actually in the failed registry
-            if rq_job_id in failed_registry.get_job_ids():
+            if rq_job_id in failed_ids:
                 try:
                     rq_job = Job.fetch(rq_job_id, connection=redis_conn)
                     error_msg = str(rq_job.exc_info) if rq_job.exc_info else "job failed unexpectedly"
@@ -44,7 +52,7 @@ def get_jobs(
                     pass
             
             # check if it's in the finished registry but DB still says running
-            elif rq_job_id in finished_registry.get_job_ids():
+            elif rq_job_id in finished_ids:
                 db_job.status = "completed"
                 db_job.finished_at = datetime.utcnow()
                 db_job.progress_percent = 100
@@ -52,7 +60,7 @@ def get_jobs(
                 print(f"synced completed job: {rq_job_id}")
             
             # check if it's not in started registry anymore (killed/lost)
-            elif rq_job_id not in started_registry.get_job_ids():
+            elif rq_job_id not in started_ids:
                 try:
                     rq_job = Job.fetch(rq_job_id, connection=redis_conn)
                     # if we can fetch it but it's not in any registry, it was likely killed
@@ -82,6 +90,14 @@ def get_jobs(
     
     db_jobs = session.exec(query).all()
     
+    # workers write progress/state to redis, postgres catches up in batches;
+    # overlay whatever hasn't been flushed yet
+    try:
+        live_states = get_job_states([job.rq_job_id for job in db_jobs])
+    except Exception as e:
+        print(f"error reading live job states: {e}")
+        live_states = {}
+    
     # organize by status
     running_jobs = []
     queued_jobs = []
@@ -103,20 +119,24 @@ def get_jobs(
             "created_at": job.created_at.isoformat() if job.created_at else None,
         }
         
-        if job.status == "running":
+        live = live_states.get(job.rq_job_id, {})
+        for field in ("status", "error_message", "started_at", "finished_at"):
+            if field in live:
+                job_dict[field] = live[field]
+        if "progress_percent" in live:
+            job_dict["progress_percent"] = int(live["progress_percent"])
+        
+        if job_dict["status"] == "running":
             running_jobs.append(job_dict)
-        elif job.status == "queued":
+        elif job_dict["status"] == "queued":
             queued_jobs.append(job_dict)
-        elif job.status == "completed":
+        elif job_dict["status"] == "completed":
             completed_jobs.append(job_dict)
-        elif job.status == "failed":
+        elif job_dict["status"] in ("failed", "cancelled"):
             failed_jobs.append(job_dict)
     
     # get total counts (all time)
-    total_running = session.exec(select(JobModel).where(JobModel.status == "running")).all()
-    total_queued = session.exec(select(JobModel).where(JobModel.status == "queued")).all()
-    total_completed = session.exec(select(JobModel).where(JobModel.status == "completed")).all()
-    total_failed = session.exec(select(JobModel).where(JobModel.status == "failed")).all()
+    counts = dict(session.exec(select(JobModel.status, func.count(JobModel.id)).group_by(JobModel.status)).all())
     
     return {
         "running": running_jobs,
@@ -124,10 +144,108 @@ def get_jobs(
         "completed": completed_jobs[:20],  # last 20
         "failed": failed_jobs[:20],  # last 20
         "summary": {
-            "running_count": len(total_running),
-            "queued_count": len(total_queued),
-            "completed_count": len(total_completed),
-            "failed_count": len(total_failed),
+            "running_count": counts.get("running", 0),
+            "queued_count": counts.get("queued", 0),
+            "completed_count": counts.get("completed", 0),
+            "failed_count": counts.get("failed", 0),
+            "cancelled_count": counts.get("cancelled", 0),
         }
     }
 
+
+
+@router.get("/analysis-queue")
+def get_analysis_queue(session: Session = Depends(get_session)):
+    """analyses running and waiting (shortest predicted first), with ETAs"""
+    from app.services.analysis_pipeline import analysis_queue_status
+    from app.models import OriginalFile
+    from uuid import UUID
+    
+    entries = analysis_queue_status()
+    files = {}
+    if entries:
+        ids = [UUID(e["file_id"]) for e in entries]
+        files = {str(f.id): f for f in session.exec(select(OriginalFile).where(OriginalFile.id.in_(ids))).all()}
+    
+    for entry in entries:
+        file = files.get(entry["file_id"])
+        entry["filename"] = file.original_filename if file else None
+        entry["duration_ms"] = file.duration_ms if file else None
+        entry["analysis_progress_percent"] = file.analysis_progress_percent if file else 0
+    return entries
+
+
+@router.get("/dead-letter")
+def get_dead_letters(limit: int = Query(default=100, le=500)):
+    """jobs that failed for good, newest first, with error, attempts and artifacts"""
+    from app.services.dead_letter import dead_letters
+    return {"count": dead_letters.count(), "entries": dead_letters.entries(limit)}
+
+
+@router.post("/dead-letter/replay")
+def replay_dead_letters(request: DeadLetterRequest):
+    """requeue dead-lettered jobs (all of them when no ids are given)"""
+    from app.services.dead_letter import dead_letters
+    return {"success": True, **dead_letters.replay(request.ids)}
+
+
+@router.post("/dead-letter/discard")
+def discard_dead_letters(request: DeadLetterRequest):
+    """drop dead-lettered jobs without running them again"""
+    from app.services.dead_letter import dead_letters
+    if not request.ids:
+        raise HTTPException(status_code=400, detail="ids required")
+    return {"success": True, "discarded": dead_letters.discard(request.ids)}
+
+
+@router.post("/analysis-queue/cancel-waiting")
+def cancel_waiting_analyses():
+    """drop every analysis that hasn't started yet (running ones keep going)"""
+    from app.services.analysis_pipeline import cancel_waiting_analyses
+    return {"success": True, "cancelled": cancel_waiting_analyses()}
+
+
+@router.post("/analysis-queue/{file_id}/cancel")
+def cancel_file_analysis(file_id: str):
+    """cancel a file's analysis, waiting or running"""
+    from app.services.analysis_pipeline import cancel_analysis
+    from uuid import UUID
+    
+    try:
+        file_uuid = UUID(file_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid file id")
+    
+    result = cancel_analysis(file_uuid)
+    if result is None:
+        raise HTTPException(status_code=409, detail="no analysis queued or running for this file")
+    return {"success": True, "file_id": file_id, **result}
+
+
+@router.post("/{job_id}/cancel")
+def cancel_job(job_id: str, session: Session = Depends(get_session)):
+    """
+    cancel a queued job or stop a running one (its ffmpeg is killed and
+    partial output removed); an analysis stage cancels the file's whole graph
+    """
+    from app.services.queue import cancel_rq_job
+    from uuid import UUID
+    
+    try:
+        job = session.get(JobModel, UUID(job_id))
+    except ValueError:
+        job = None
+    if not job:
+        raise HTTPException(status_code=404, detail="job not found")
+    
+    if job.job_type.startswith("analysis_") and job.file_id:
+        from app.services.analysis_pipeline import cancel_analysis
+        result = cancel_analysis(job.file_id)
+        if result is None:
+            raise HTTPException(status_code=409, detail="job already finished")
+        return {"success": True, "file_id": str(job.file_id), **result}
+    
+    status = cancel_rq_job(job.rq_job_id)
+    if status is None:
+        raise HTTPException(status_code=409, detail="job already finished")
+    return {"success": True, "was": status, "jobs": [job.rq_job_id]}
@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlmodel import Session
+from app.core.db import get_session
+from app.models import OriginalFile
+from app.detection.signal_pyramid import load_signal_pyramid, list_signals, query_pyramid
+from typing import Optional
+from uuid import UUID
+
+router = APIRouter()
+
+@router.get("/{file_id}")
+def get_available_signals(file_id: UUID, session: Session = Depends(get_session)):
+    """list the precomputed signal pyramids for a file"""
+    file = session.get(OriginalFile, file_id)
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    return {
+        "file_id": str(file_id),
+        "duration_sec": file.duration_ms / 1000.0,
+        "signals": list_signals(file_id)
+    }
+
+@router.get("/{file_id}/{signal}")
+def get_signal(
+    file_id: UUID,
+    signal: str,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    max_points: int = Query(default=500, ge=1, le=5000),
+    level: Optional[int] = Query(default=None, ge=0)
+):
+    """
+    min/max/mean buckets of a motion, audio or ml signal over [start, end]
+
+    returns the finest pyramid level with at most max_points buckets in the
+    range (or the explicit level), so a sparkline for an hour-long file is a
+    few KB and zooming in just asks for a narrower range
+    """
+    levels = load_signal_pyramid(file_id, signal)
+    if levels is None:
+        raise HTTPException(status_code=404, detail=f"signal '{signal}' not available for this file")
+
+    return {
+        "file_id": str(file_id),
+        "signal": signal,
+        **query_pyramid(levels, start_sec=start, end_sec=end, max_points=max_points, level=level)
+    }
@@ -0,0 +1,62 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse, JSONResponse
+from sqlmodel import Session
+from app.core.db import get_session
+from app.models import OriginalFile, FinalClip
+from app.services.thumbnail_service import thumbnail_service
+from app.video.thumbnails import get_thumbnail_dir
+from uuid import UUID
+import re
+
+router = APIRouter()
+
+# entries are content-addressed, so a given URL never changes content
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+_KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+_NAME_RE = re.compile(r"^(poster\.jpg|sprites\.vtt|sprite_\d{3}\.jpg)$")
+
+MEDIA_TYPES = {
+    ".jpg": "image/jpeg",
+    ".vtt": "text/vtt",
+}
+
+def _status_response(status: dict):
+    """200 with URLs when ready, 202 while a build is queued, 404 if it can't be built"""
+    if status["status"] == "ready":
+        return status
+    if status["status"] == "unavailable":
+        raise HTTPException(status_code=404, detail="source video not available locally")
+    return JSONResponse(status_code=202, content=status, headers={"Retry-After": "10"})
+
+@router.get("/video/{file_id}")
+def get_video_thumbnails(file_id: UUID, session: Session = Depends(get_session)):
+    """poster + scrub sprite URLs for an original, queueing a build if missing"""
+    file = session.get(OriginalFile, file_id)
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+    return _status_response(thumbnail_service.request_video_thumbnails(file))
+
+@router.get("/clip/{clip_id}")
+def get_clip_thumbnail(clip_id: UUID, session: Session = Depends(get_session)):
+    """poster URL for a final clip, queueing a build if missing"""
+    clip = session.get(FinalClip, clip_id)
+    if not clip:
+        raise HTTPException(status_code=404, detail="Clip not found")
+    return _status_response(thumbnail_service.request_clip_poster(clip, clip.original_file))
+
+@router.get("/{key}/{name}")
+def get_thumbnail_file(key: str, name: str):
+    """serve a cached poster, sprite sheet or VTT index with long-lived cache headers"""
+    if not _KEY_RE.match(key) or not _NAME_RE.match(name):
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+
+    path = get_thumbnail_dir(key) / name
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+
+    return FileResponse(
+        str(path),
+        media_type=MEDIA_TYPES[path.suffix],
+        headers={"Cache-Control": IMMUTABLE_CACHE}
+    )
@@ -1,12 +1,12 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Depends
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 from sqlmodel import Session
 from app.core.db import get_session
 from app.core.config import settings
 from app.models import OriginalFile
-from app.services.ffmpeg import get_video_metadata
-from app.services.queue import enqueue_job
-from app.worker import analyze_original_file
+from app.services.ffmpeg import metadata_from_media_info
+from app.video.media_info import probe_media, store_media_info
+from app.services.analysis_pipeline import enqueue_analysis
 import shutil
 import os
 import hashlib
@@ -16,10 +16,12 @@ from uuid import UUID
 router = APIRouter()
 
 @router.post("/")
-async def upload_file(
+def upload_file(
     file: UploadFile = File(...), 
     session: Session = Depends(get_session)
 ):
+    # plain def so fastapi runs it in the threadpool: the copy, the hash and
+    # the packet-level probe below all block and would stall the event loop
     # Save to temp
     temp_path = os.path.join(settings.ORIGINALS_DIR, f"temp_{file.filename}")
     with open(temp_path, "wb") as buffer:
@@ -47,9 +49,10 @@ async def upload_file(
     if existing:
         return {"message": "File already exists", "id": existing.id}
         
-    # Extract metadata
+    # Extract metadata: one probe covers streams, codecs and GOP structure
     try:
-        meta = get_video_metadata(final_path)
+        media, frame_index = probe_media(final_path)
+        meta = metadata_from_media_info(media)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid video file: {str(e)}")
         
@@ -79,17 +82,22 @@ async def upload_file(
     session.add(db_file)
     session.commit()
     session.refresh(db_file)
+    store_media_info(session, db_file.id, media, frame_index)
     
-    # enqueue analysis with file_id tracking
-    enqueue_job(analyze_original_file, db_file.id, file_id=db_file.id)
+    # queue the analysis stage graph (each stage is tracked as its own job)
+    queued = enqueue_analysis(db_file.id)
     
-    return {"id": db_file.id, "status": "uploaded"}
+    return {
+        "id": db_file.id,
+        "status": "uploaded",
+        "analysis_eta_seconds": queued["eta_seconds"] if queued else None
+    }
 
 @router.get("/media/{file_id}/info")
 def get_media_info(file_id: UUID, session: Session = Depends(get_session)):
     """diagnostic endpoint to check video file status"""
-    from app.video.proxy_utils import generate_playback_proxy
-    from pathlib import Path
+    from app.video.proxy_utils import get_playback_proxy_path
+    from app.services.proxy_coordinator import proxy_coordinator
     
     db_file = session.get(OriginalFile, file_id)
     if not db_file:
@@ -106,22 +114,27 @@ def get_media_info(file_id: UUID, session: Session = Depends(get_session)):
         info["original_size"] = os.path.getsize(db_file.stored_path)
         
         # Check what proxy would be generated
-        input_path_obj = Path(db_file.stored_path)
-        proxy_filename = input_path_obj.stem + "_web.mp4"
-        proxy_dir = Path(os.getenv("DATA_DIR", "/data")) / "playback_proxies"
-        proxy_path = proxy_dir / proxy_filename
+        proxy_path = get_playback_proxy_path(db_file.stored_path)
         
         info["proxy_path"] = str(proxy_path)
         info["proxy_exists"] = proxy_path.exists()
         if info["proxy_exists"]:
             info["proxy_size"] = proxy_path.stat().st_size
+        info["proxy_status"] = proxy_coordinator.get_status(db_file.id, db_file.stored_path)
     
     return info
 
 @router.get("/media/{file_id}")
-def get_media(file_id: UUID, session: Session = Depends(get_session)):
-    """serve video file for playback (with browser-compatible proxy)"""
-    from app.video.proxy_utils import generate_playback_proxy
+def get_media(file_id: UUID, wait: int = 0, session: Session = Depends(get_session)):
+    """
+    serve video file for playback (with browser-compatible proxy)
+    
+    if the proxy isn't built yet, a single background build is queued and
+    202 is returned with its progress. pass ?wait=N to block up to N seconds
+    (capped by MEDIA_MAX_WAIT_SECONDS) on that same build instead.
+    """
+    from app.video.proxy_utils import get_playback_proxy_path, is_playback_proxy_ready
+    from app.services.proxy_coordinator import proxy_coordinator
     import logging
     
     logger = logging.getLogger(__name__)
@@ -134,32 +147,36 @@ def get_media(file_id: UUID, session: Session = Depends(get_session)):
         logger.error(f"Original file not found on disk: {db_file.stored_path}")
         raise HTTPException(status_code=404, detail="File not found on disk")
     
-    try:
-        # Generate/use playback proxy (this is synchronous and will wait)
-        logger.info(f"Generating proxy for: {db_file.stored_path}")
-        proxy_path = generate_playback_proxy(db_file.stored_path, max_height=1080)
-        
-        # Verify proxy exists
-        if not os.path.exists(proxy_path):
-            logger.error(f"Proxy generation failed, file doesn't exist: {proxy_path}")
-            raise HTTPException(status_code=500, detail="Failed to generate playback proxy")
-        
-        # Verify proxy has content
-        file_size = os.path.getsize(proxy_path)
-        if file_size == 0:
-            logger.error(f"Proxy file is empty: {proxy_path}")
-            raise HTTPException(status_code=500, detail="Playback proxy is empty")
-        
-        logger.info(f"Serving proxy: {proxy_path} ({file_size} bytes)")
+    if not is_playback_proxy_ready(db_file.stored_path):
+        try:
+            # someone is waiting to play this: the build goes to the interactive lane
+            status = proxy_coordinator.request_proxy(db_file.id, db_file.stored_path, interactive=True)
+            if wait > 0 and status["status"] != "ready":
+                status = proxy_coordinator.wait_until_ready(
+                    db_file.id,
+                    db_file.stored_path,
+                    timeout_sec=min(wait, settings.MEDIA_MAX_WAIT_SECONDS)
+                )
+        except Exception as e:
+            logger.error(f"Error requesting proxy for {file_id}: {str(e)}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Error serving video: {str(e)}")
         
-        # Always serve as video/mp4 since we generate MP4
-        return FileResponse(
-            proxy_path,
-            media_type="video/mp4",
-            filename=db_file.original_filename
-        )
+        if status["status"] == "failed":
+            raise HTTPException(status_code=500, detail=f"Playback proxy failed: {status.get('error')}")
         
-    except Exception as e:
-        logger.error(f"Error serving video {file_id}: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Error serving video: {str(e)}")
-
+        if status["status"] != "ready":
+            return JSONResponse(
+                status_code=202,
+                content={"file_id": str(file_id), **status},
+                headers={"Retry-After": "5"}
+            )
+    
+    proxy_path = get_playback_proxy_path(db_file.stored_path)
+    logger.info(f"Serving proxy: {proxy_path} ({proxy_path.stat().st_size} bytes)")
+    
+    # Always serve as video/mp4 since we generate MP4
+    return FileResponse(
+        str(proxy_path),
+        media_type="video/mp4",
+        filename=db_file.original_filename
+    )
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends
 from sqlmodel import Session, select, func
 from app.core.db import get_session
-from app.models import OriginalFile, CandidateSegment
+from app.models import OriginalFile, VideoReviewCount
+from app.services.thumbnail_service import thumbnail_service
 from typing import List
 
 router = APIRouter()
@@ -12,27 +13,20 @@ def get_video_library(session: Session = Depends(get_session)):
     Get all videos with their sorting progress.
     Returns videos that have unreviewed segments.
     """
-    # Query videos with at least one unreviewed segment
-    videos_with_segments = session.exec(
-        select(OriginalFile)
-        .join(CandidateSegment)
-        .where(CandidateSegment.status == "UNREVIEWED")
-        .distinct()
+    # videos with at least one unreviewed segment, counts from the maintained per-video counters
+    rows = session.exec(
+        select(OriginalFile, VideoReviewCount)
+        .join(VideoReviewCount, VideoReviewCount.original_file_id == OriginalFile.id)
+        .where(VideoReviewCount.unreviewed > 0)
         .order_by(OriginalFile.created_at.desc())
     ).all()
     
     result = []
-    for video in videos_with_segments:
-        # Count segment statuses
-        segments = session.exec(
-            select(CandidateSegment)
-            .where(CandidateSegment.original_file_id == video.id)
-        ).all()
-        
-        total = len(segments)
-        unreviewed = sum(1 for s in segments if s.status == "UNREVIEWED")
-        accepted = sum(1 for s in segments if s.status == "ACCEPTED")
-        trashed = sum(1 for s in segments if s.status == "TRASHED")
+    for video, counts in rows:
+        total = counts.total
+        unreviewed = counts.unreviewed
+        accepted = counts.accepted
+        trashed = counts.trashed
         
         progress_percent = 0 if total == 0 else int(((total - unreviewed) / total) * 100)
         
@@ -45,6 +39,7 @@ def get_video_library(session: Session = Depends(get_session)):
             "resolution": f"{video.width}x{video.height}",
             "fps": video.fps,
             "camera_id": video.camera_id,
+            "poster_url": thumbnail_service.poster_url_for_video(video),
             "segments": {
                 "total": total,
                 "unreviewed": unreviewed,
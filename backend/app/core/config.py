@@ -11,6 +11,66 @@ class Settings:
     CANDIDATES_DIR: str = os.path.join(DATA_DIR, "candidates")
     FINAL_CLIPS_DIR: str = os.path.join(DATA_DIR, "final_clips")
     PLAYBACK_PROXIES_DIR: str = os.path.join(DATA_DIR, "playback_proxies")
+    THUMBNAILS_DIR: str = os.path.join(DATA_DIR, "thumbnails")
+    
+    # rq workers: lanes to serve (interactive, analysis, ingest, maintenance; empty = all),
+    # or explicit queue names which override the lanes (see services/queue.py)
+    WORKER_LANES: str = os.getenv("WORKER_LANES", "")
+    WORKER_QUEUES: str = os.getenv("WORKER_QUEUES", "")
+    # worker pool (python -m app.worker): 0 = size from cpu count and available memory
+    WORKER_CONCURRENCY: int = int(os.getenv("WORKER_CONCURRENCY", "0"))
+    WORKER_REPLICAS: int = int(os.getenv("WORKER_REPLICAS", "1"))  # worker containers sharing this host; auto sizing splits it between them
+    WORKER_RESERVED_JOBS: int = int(os.getenv("WORKER_RESERVED_JOBS", "0"))  # jobs other fixed-size workers on this host run (e.g. worker-interactive), kept out of auto sizing
+    WORKER_CPUS_PER_JOB: float = float(os.getenv("WORKER_CPUS_PER_JOB", "2"))  # cores one analysis/render job keeps busy
+    WORKER_MEMORY_MB_PER_JOB: int = int(os.getenv("WORKER_MEMORY_MB_PER_JOB", "1536"))  # peak memory of one job, on top of the preloaded models
+    WORKER_MAX_RSS_MB: int = int(os.getenv("WORKER_MAX_RSS_MB", "3072"))  # a worker above this after a job is recycled
+    # admission control (services/admission.py): workers skip queues whose work the host can't take now
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+    ADMISSION_CACHE_SECONDS: float = float(os.getenv("ADMISSION_CACHE_SECONDS", "5"))
+    ADMISSION_RECHECK_SECONDS: int = int(os.getenv("ADMISSION_RECHECK_SECONDS", "15"))  # how long a worker waits before re-checking held queues
+    ADMIT_MIN_FREE_GB: float = float(os.getenv("ADMIT_MIN_FREE_GB", "5"))  # never write into this reserve
+    ADMIT_DISK_HEADROOM_GB: float = float(os.getenv("ADMIT_DISK_HEADROOM_GB", "10"))  # proxies/downloads wait below this (after projected writes)
+    ADMIT_MAX_LOAD_PER_CPU: float = float(os.getenv("ADMIT_MAX_LOAD_PER_CPU", "1.5"))
+    ADMIT_MIN_MEMORY_MB: int = int(os.getenv("ADMIT_MIN_MEMORY_MB", "1024"))
+    ADMIT_MAX_ANALYZING: int = int(os.getenv("ADMIT_MAX_ANALYZING", "4"))  # analyses run at once; downloads wait while this many more are waiting
+    JOB_STATE_FLUSH_SECONDS: float = float(os.getenv("JOB_STATE_FLUSH_SECONDS", "5"))  # how often job progress/state is copied from redis to postgres
+    ANALYSIS_CHECKPOINT_SECONDS: float = float(os.getenv("ANALYSIS_CHECKPOINT_SECONDS", "60"))  # how often long stages (motion) save partial results
+    ANALYSIS_SJF_AGING: float = float(os.getenv("ANALYSIS_SJF_AGING", "1.0"))  # predicted seconds forgiven per second an analysis has waited
+    ANALYSIS_STAGE_RETRIES: int = int(os.getenv("ANALYSIS_STAGE_RETRIES", "3"))  # reruns of a stage failing transiently before the file is marked failed
+    # retries (services/queue.py RETRY_POLICIES): only transient errors, exponential backoff with jitter
+    RETRY_MAX_BACKOFF_SECONDS: int = int(os.getenv("RETRY_MAX_BACKOFF_SECONDS", "1800"))
+    DLQ_RETENTION_DAYS: int = int(os.getenv("DLQ_RETENTION_DAYS", "30"))  # dead-lettered jobs kept this long for inspection / replay
+
+    # ffmpeg runner: per-host concurrent encode/decode slots (shared by all worker
+    # replicas through lock files in DATA_DIR) and process priority
+    FFMPEG_MAX_ENCODES: int = int(os.getenv("FFMPEG_MAX_ENCODES", str(max(1, (os.cpu_count() or 2) // 4))))
+    FFMPEG_MAX_DECODES: int = int(os.getenv("FFMPEG_MAX_DECODES", str(max(2, (os.cpu_count() or 2) // 2))))
+    FFMPEG_NICE: int = int(os.getenv("FFMPEG_NICE", "10"))
+    FFMPEG_IONICE_CLASS: int = int(os.getenv("FFMPEG_IONICE_CLASS", "2"))  # 2 = best-effort, 0 disables
+    FFMPEG_IONICE_LEVEL: int = int(os.getenv("FFMPEG_IONICE_LEVEL", "7"))  # lowest best-effort priority
+    FFMPEG_INTERACTIVE_SLOTS: int = int(os.getenv("FFMPEG_INTERACTIVE_SLOTS", "1"))  # extra encode/decode slots only interactive-lane jobs use
+    # bulk (non-interactive) encodes/decodes are paused (SIGSTOP) while interactive jobs are queued or running
+    PREEMPT_BULK_FFMPEG: bool = os.getenv("PREEMPT_BULK_FFMPEG", "true").lower() == "true"
+    PREEMPT_MAX_PAUSE_SECONDS: int = int(os.getenv("PREEMPT_MAX_PAUSE_SECONDS", "600"))  # per run, so a busy sorter can't starve bulk work
+    
+    # playback proxy single-flight settings
+    PROXY_LOCK_TTL_SECONDS: int = int(os.getenv("PROXY_LOCK_TTL_SECONDS", "3600"))  # max time one build may hold the lock
+    MEDIA_MAX_WAIT_SECONDS: int = int(os.getenv("MEDIA_MAX_WAIT_SECONDS", "30"))  # cap on ?wait= for /media requests
+    PROXY_LOOKAHEAD_VIDEOS: int = int(os.getenv("PROXY_LOOKAHEAD_VIDEOS", "3"))  # proxies kept ready ahead of the sorter
+    PROXY_SCHEDULE_INTERVAL_SECONDS: int = int(os.getenv("PROXY_SCHEDULE_INTERVAL_SECONDS", "30"))  # min gap between scheduler passes
+    SORT_LOOKAHEAD_MAX: int = int(os.getenv("SORT_LOOKAHEAD_MAX", "10"))  # cap on /sort/next?lookahead=
+    
+    # clip rendering: "smart" re-encodes only boundary GOPs (frame accurate),
+    # "copy" is the old keyframe-aligned stream copy
+    CLIP_RENDER_MODE: str = os.getenv("CLIP_RENDER_MODE", "smart")
+    # when a source's sps/pps can't be reproduced by the encoder (most camera/phone files), smart
+    # clips fall back to a keyframe-aligned stream copy; true re-encodes them whole instead (slow, frame accurate)
+    SMART_CUT_REENCODE_ON_MISMATCH: bool = os.getenv("SMART_CUT_REENCODE_ON_MISMATCH", "false").lower() == "true"
+    # "stream" pipes fragmented MP4 from ffmpeg straight into a drive upload, "file" renders to FINAL_CLIPS_DIR first
+    CLIP_UPLOAD_MODE: str = os.getenv("CLIP_UPLOAD_MODE", "stream")
+    DRIVE_UPLOAD_CHUNK_MB: int = int(os.getenv("DRIVE_UPLOAD_CHUNK_MB", "8"))  # resumable upload chunk size
+    RENDER_BATCH_WINDOW_SECONDS: int = int(os.getenv("RENDER_BATCH_WINDOW_SECONDS", "5"))  # quiet time before a batch renders
+    RENDER_BATCH_MAX_WAIT_SECONDS: int = int(os.getenv("RENDER_BATCH_MAX_WAIT_SECONDS", "30"))  # cap so a busy sorter can't starve a batch
     
     # google drive settings
     GOOGLE_DRIVE_CREDENTIALS_PATH: str = os.getenv("GOOGLE_DRIVE_CREDENTIALS_PATH", "/app/secrets/graphic-parsec-480000-i8-0552e472ced1.json")
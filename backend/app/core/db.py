@@ -10,3 +10,11 @@ def get_session():
     with Session(engine) as session:
         yield session
 
+
+def dialect_insert(session):
+    """insert() of the session's database, for ON CONFLICT upserts (postgres in production, sqlite in tests)"""
+    if session.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
@@ -44,18 +44,105 @@ def retry_with_backoff(max_retries: int = 3, initial_delay: float = 1.0, backoff
     return decorator
 
 
-def handle_worker_error(job_id: str, error: Exception):
+# exit codes of an ffmpeg that was killed rather than failing on its input:
+# signals (negative), 128 + SIGKILL/SIGTERM from a shell wrapper, and 255,
+# which ffmpeg itself returns when interrupted
+KILLED_EXIT_CODES = {137, 143, 255}
+
+
+def _error_chain(error: BaseException):
+    """error, then whatever it was raised from / while handling"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def _is_transient_one(error: BaseException) -> bool:
+    import subprocess
+    from http.client import IncompleteRead
+
+    if isinstance(error, TransientError):
+        return True
+    # dropped / refused / reset connections and socket timeouts
+    if isinstance(error, (ConnectionError, TimeoutError, IncompleteRead)):
+        return True
+    if isinstance(error, subprocess.CalledProcessError):
+        return error.returncode < 0 or error.returncode in KILLED_EXIT_CODES
+
+    # drive: 5xx, rate limits and request timeouts (googleapiclient or plain requests)
+    response = getattr(error, "resp", None) or getattr(error, "response", None)
+    status = getattr(response, "status", None) or getattr(response, "status_code", None)
+    if status is not None:
+        try:
+            status = int(status)
+        except (TypeError, ValueError):
+            status = None
+    if status is not None and (status >= 500 or status in (408, 429)):
+        return True
+
+    try:
+        import redis.exceptions
+        if isinstance(error, (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)):
+            return True
+    except ImportError:
+        pass
+    try:
+        import sqlalchemy.exc
+        if isinstance(error, (sqlalchemy.exc.OperationalError, sqlalchemy.exc.DisconnectionError, sqlalchemy.exc.TimeoutError)):
+            return True
+        if isinstance(error, sqlalchemy.exc.DBAPIError) and error.connection_invalidated:
+            return True
+    except ImportError:
+        pass
+    return False
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    true for failures a plain retry can fix: drive 5xx / 429, dropped
+    connections, ffmpeg killed by a signal, lost database or redis connections
+
+    looks through the exception chain, so a DriveUploadError raised while
+    handling an HTTP 503 counts. a cancelled job never is
     """
-    centralized error handler for worker jobs
-    logs error and optionally sends notifications
+    if isinstance(error, JobCancelled):
+        return False
+    return any(_is_transient_one(e) for e in _error_chain(error))
+
+
+def is_job_timeout(error: BaseException) -> bool:
     """
-    logger.error(f"job {job_id} failed: {error}", exc_info=True)
+    true if rq killed the job for running past its job_timeout
+
+    not transient by itself: the retry gets the same timeout and would die
+    at the same point. stages that checkpoint partial progress turn it into
+    a TransientError when they got further (analysis_pipeline._run_stage)
+    """
+    try:
+        from rq.timeouts import JobTimeoutException
+    except ImportError:
+        return False
+    return any(isinstance(e, JobTimeoutException) for e in _error_chain(error))
+
+
+def handle_worker_error(job, error: BaseException):
+    """
+    centralized handler for worker jobs that failed for good (no retries
+    left, or an error retrying won't fix): logs it and parks the job in the
+    dead letter queue with its error and artifacts
+    """
+    logger.error(f"job {job.id} failed: {error}", exc_info=error)
     
     # future: send slack/email notifications
-    # send_slack_notification(f"Job failed: {job_id}\nError: {str(error)}")
+    # send_slack_notification(f"Job failed: {job.id}\nError: {str(error)}")
     
-    # future: add to dead letter queue for manual review
-    # add_to_dlq(job_id, error)
+    try:
+        from app.services.dead_letter import dead_letters
+        dead_letters.add(job, error)
+    except Exception as e:
+        print(f"[DLQ] could not dead-letter {job.id}: {e}")
 
 
 class TrickyClipException(Exception):
@@ -78,4 +165,16 @@ class DetectionError(TrickyClipException):
     pass
 
 
+class TransientError(TrickyClipException):
+    """raised when a job failed in a way a retry can fix (see is_transient)"""
+    pass
+
+
+class JobCancelled(BaseException):
+    """
+    raised inside a job that was cancelled from the api (see worker.py)
 
+    a BaseException like KeyboardInterrupt, so the `except Exception` blocks
+    jobs use to keep going past a failed step don't swallow it
+    """
+    pass
@@ -1,11 +1,11 @@
 import numpy as np
 import cv2
-import subprocess
 import tempfile
 import os
 from pathlib import Path
 from typing import Optional
 import json
+from app.services.ffmpeg_runner import ffmpeg_runner, KIND_ENCODE
 
 
 class HighlightModel:
@@ -67,7 +67,7 @@ class HighlightModel:
                 tmp_path
             ]
             
-            subprocess.run(cmd, check=True, capture_output=True, text=True)
+            ffmpeg_runner.run(cmd, kind=KIND_ENCODE, duration_sec=duration)
             
             # load frames
             frames = self._load_video_frames(tmp_path)
@@ -150,6 +150,15 @@ class HighlightModel:
 _highlight_model: Optional[HighlightModel] = None
 
 
+def current_model_name() -> Optional[str]:
+    """model file the manifest currently points at (None if there isn't one)"""
+    manifest_path = Path("/app/models/highlight/model_manifest.json")
+    try:
+        return json.loads(manifest_path.read_text()).get("current")
+    except (OSError, ValueError):
+        return None
+
+
 def get_highlight_model() -> Optional[HighlightModel]:
     """
     get singleton highlight model instance
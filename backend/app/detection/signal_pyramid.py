@@ -0,0 +1,164 @@
+import numpy as np
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+# each level aggregates this many buckets of the level below
+PYRAMID_FACTOR = 4
+
+# stop building levels once a level is this small
+PYRAMID_MIN_BUCKETS = 64
+
+FIELDS = ("t0", "t1", "min", "max", "mean")
+
+
+def get_signals_path(file_id) -> Path:
+    """array file holding every signal pyramid for one original"""
+    signals_dir = Path(os.getenv("DATA_DIR", "/data")) / "signals"
+    return signals_dir / f"{file_id}.npz"
+
+
+def build_pyramid(times: np.ndarray, values: np.ndarray) -> List[Dict[str, np.ndarray]]:
+    """
+    build a min/max/mean pyramid over a timeseries
+
+    level 0 is the raw signal (one sample per bucket). each level above merges
+    PYRAMID_FACTOR neighbouring buckets, keeping the true min and max so peaks
+    survive downsampling. t0/t1 are the first/last sample times in a bucket,
+    so non-uniform series (e.g. per-window ml scores) work too.
+
+    returns: list of levels, finest first
+    """
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float32)
+
+    if len(times) == 0:
+        return []
+
+    levels = [{
+        "t0": times,
+        "t1": times,
+        "min": values,
+        "max": values,
+        "mean": values,
+    }]
+
+    # number of raw samples in each bucket, needed for exact means
+    counts = np.ones(len(times), dtype=np.int64)
+
+    while len(levels[-1]["t0"]) > PYRAMID_MIN_BUCKETS:
+        prev = levels[-1]
+        starts = np.arange(0, len(prev["t0"]), PYRAMID_FACTOR)
+        ends = np.minimum(starts + PYRAMID_FACTOR, len(prev["t0"])) - 1
+
+        bucket_counts = np.add.reduceat(counts, starts)
+        weighted_sum = np.add.reduceat(prev["mean"].astype(np.float64) * counts, starts)
+
+        levels.append({
+            "t0": prev["t0"][starts],
+            "t1": prev["t1"][ends],
+            "min": np.minimum.reduceat(prev["min"], starts),
+            "max": np.maximum.reduceat(prev["max"], starts),
+            "mean": (weighted_sum / bucket_counts).astype(np.float32),
+        })
+        counts = bucket_counts
+
+    return levels
+
+
+def save_signal_pyramids(file_id, signals: Dict[str, Tuple[np.ndarray, np.ndarray]]):
+    """
+    build and persist pyramids for several named signals of one file
+
+    signals already stored for the file but not passed here are kept, so the
+    ml score series can be added after motion/audio were saved
+    """
+    path = get_signals_path(file_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    arrays = {}
+    if path.exists():
+        with np.load(path) as existing:
+            arrays = {k: existing[k] for k in existing.files if k.split("__")[0] not in signals}
+
+    for name, (times, values) in signals.items():
+        for level_idx, level in enumerate(build_pyramid(times, values)):
+            for field in FIELDS:
+                arrays[f"{name}__L{level_idx}__{field}"] = level[field]
+
+    # write then rename so readers never see a partial file
+    tmp_path = path.with_name(path.stem + ".tmp.npz")
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+    print(f"[SIGNALS] saved pyramids for {file_id}: {', '.join(signals.keys())}")
+
+
+def load_signal_pyramid(file_id, signal: str) -> Optional[List[Dict[str, np.ndarray]]]:
+    """load one signal's pyramid (finest level first), or None if not stored"""
+    path = get_signals_path(file_id)
+    if not path.exists():
+        return None
+
+    with np.load(path) as data:
+        levels = []
+        while f"{signal}__L{len(levels)}__t0" in data.files:
+            idx = len(levels)
+            levels.append({field: data[f"{signal}__L{idx}__{field}"] for field in FIELDS})
+
+    return levels or None
+
+
+def list_signals(file_id) -> List[str]:
+    """names of the signals stored for a file"""
+    path = get_signals_path(file_id)
+    if not path.exists():
+        return []
+    with np.load(path) as data:
+        return sorted({k.split("__")[0] for k in data.files})
+
+
+def query_pyramid(
+    levels: List[Dict[str, np.ndarray]],
+    start_sec: Optional[float] = None,
+    end_sec: Optional[float] = None,
+    max_points: int = 500,
+    level: Optional[int] = None
+) -> dict:
+    """
+    slice a pyramid to a time range at the finest level that fits max_points
+
+    range lookups are binary searches on the sorted bucket times, so cost is
+    proportional to the points returned, not the length of the file
+    """
+    if not levels:
+        return {"level": 0, "levels": 0, "t0": [], "t1": [], "min": [], "max": [], "mean": []}
+
+    first = levels[0]
+    start_sec = float(first["t0"][0]) if start_sec is None else start_sec
+    end_sec = float(first["t1"][-1]) if end_sec is None else end_sec
+
+    def bounds(lvl: Dict[str, np.ndarray]) -> Tuple[int, int]:
+        # buckets overlapping [start, end]: t1 >= start and t0 <= end
+        lo = int(np.searchsorted(lvl["t1"], start_sec, side="left"))
+        hi = int(np.searchsorted(lvl["t0"], end_sec, side="right"))
+        return lo, max(lo, hi)
+
+    if level is not None:
+        chosen = min(max(level, 0), len(levels) - 1)
+    else:
+        chosen = len(levels) - 1
+        for idx, lvl in enumerate(levels):
+            lo, hi = bounds(lvl)
+            if hi - lo <= max_points:
+                chosen = idx
+                break
+
+    lvl = levels[chosen]
+    lo, hi = bounds(lvl)
+
+    return {
+        "level": chosen,
+        "levels": len(levels),
+        **{field: np.round(lvl[field][lo:hi].astype(np.float64), 4).tolist() for field in FIELDS},
+    }
@@ -1,9 +1,9 @@
-import subprocess
 import numpy as np
 from pathlib import Path
 from typing import Tuple
 import tempfile
 import os
+from app.services.ffmpeg_runner import ffmpeg_runner, KIND_DECODE
 
 
 def compute_audio_energy_timeseries(
@@ -44,7 +44,7 @@ def compute_audio_energy_timeseries(
             tmp_wav_path
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        result = ffmpeg_runner.run(cmd, kind=KIND_DECODE, check=False)
         if result.returncode != 0:
             print(f"[AUDIO] ffmpeg error: {result.stderr}")
             # return empty if no audio
@@ -1,18 +1,26 @@
 import cv2
+import time
 import numpy as np
 from pathlib import Path
-from typing import Tuple
+from typing import Callable, Optional, Tuple
 from scipy.ndimage import gaussian_filter1d
 
 
 def compute_motion_energy_timeseries(
     video_path: str,
     sample_stride_frames: int = 2,
-    blur_kernel: int = 5
+    blur_kernel: int = 5,
+    resume: Optional[dict] = None,
+    on_checkpoint: Optional[Callable[[np.ndarray, np.ndarray, int], None]] = None,
+    checkpoint_every_sec: float = 60.0
 ) -> Tuple[np.ndarray, np.ndarray]:
     """
     extract 1d motion energy signal with background stabilization
     
+    resume: {"times", "energy", "next_frame"} from an earlier on_checkpoint
+    call; decoding restarts there instead of at frame 0. on_checkpoint gets
+    (times, raw energy, next_frame) every checkpoint_every_sec of work.
+    
     returns:
       times: np.ndarray [T] in seconds
       energy: np.ndarray [T] normalized motion energy (0-1)
@@ -51,6 +59,18 @@ def compute_motion_energy_timeseries(
     prev_kp = None
     prev_desc = None
     frame_idx = 0
+    warmup_idx = None
+    
+    if resume and resume["next_frame"] >= sample_stride_frames:
+        times = list(resume["times"])
+        energies = list(resume["energy"])
+        # re-read the last sampled frame so the first new sample has something to diff against
+        warmup_idx = resume["next_frame"] - sample_stride_frames
+        cap.set(cv2.CAP_PROP_POS_FRAMES, warmup_idx)
+        frame_idx = warmup_idx
+        print(f"[MOTION] resuming at frame {resume['next_frame']} ({len(times)} samples already done)")
+    
+    last_checkpoint = time.monotonic()
     
     while True:
         ret, frame = cap.read()
@@ -68,6 +88,11 @@ def compute_motion_energy_timeseries(
             # detect keypoints and descriptors
             kp, desc = orb.detectAndCompute(gray_blur, None)
             
+            if frame_idx == warmup_idx:
+                prev_gray, prev_kp, prev_desc = gray, kp, desc
+                frame_idx += 1
+                continue
+            
             if prev_gray is not None and prev_desc is not None and desc is not None and len(desc) > 10:
                 try:
                     # match descriptors
@@ -114,6 +139,10 @@ def compute_motion_energy_timeseries(
             prev_gray = gray
             prev_kp = kp
             prev_desc = desc
+            
+            if on_checkpoint and time.monotonic() - last_checkpoint >= checkpoint_every_sec:
+                on_checkpoint(np.array(times), np.array(energies), frame_idx + sample_stride_frames)
+                last_checkpoint = time.monotonic()
         
         frame_idx += 1
     
@@ -1,6 +1,6 @@
 from fastapi import FastAPI
 from app.core.db import init_db
-from app.api.v1 import upload, sort, people, tricks, jobs, clips, health, admin, ws, auth, videos
+from app.api.v1 import upload, sort, people, tricks, jobs, clips, health, admin, ws, auth, videos, thumbnails, signals
 from app.core.config import settings
 import os
 
@@ -13,6 +13,11 @@ def on_startup():
     os.makedirs(settings.CANDIDATES_DIR, exist_ok=True)
     os.makedirs(settings.FINAL_CLIPS_DIR, exist_ok=True)
     os.makedirs(settings.PLAYBACK_PROXIES_DIR, exist_ok=True)
+    os.makedirs(settings.THUMBNAILS_DIR, exist_ok=True)
+    
+    # job progress/state is written to redis by workers, copied to postgres in batches here
+    from app.services.job_tracker import start_flusher
+    start_flusher()
 
 @app.get("/")
 def read_root():
@@ -28,5 +33,7 @@ app.include_router(clips.router, prefix="/api/clips", tags=["clips"])
 app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(videos.router, prefix="/api/videos", tags=["videos"])
+app.include_router(thumbnails.router, prefix="/api/thumbnails", tags=["thumbnails"])
+app.include_router(signals.router, prefix="/api/signals", tags=["signals"])
 app.include_router(ws.router, prefix="/ws", tags=["websocket"])
 
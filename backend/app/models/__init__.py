@@ -1,8 +1,9 @@
 from .people import Person
 from .tricks import Trick
 from .files import OriginalFile
-from .segments import CandidateSegment, HighlightWindow
-from .clips import FinalClip
+from .segments import CandidateSegment, HighlightWindow, VideoReviewCount, SortCounter
+from .clips import FinalClip, FilenameVersion
 from .jobs import Job
 from .oauth import OAuthToken
+from .media_info import MediaInfo
 
@@ -49,3 +49,10 @@ class FinalClip(SQLModel, table=True):
     # SQLModel doesn't support `onupdate` directly in Field like SQLAlchemy Column does easily without wrapper.
     # We will handle updated_at in application logic or migration.
 
+
+
+class FilenameVersion(SQLModel, table=True):
+    """last v### handed out per filename base (see services/filenames.allocate_versions)"""
+    __tablename__ = "filename_versions"
+    base: str = Field(primary_key=True)
+    last_version: int = Field(default=0)
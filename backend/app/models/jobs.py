@@ -8,7 +8,7 @@ class Job(SQLModel, table=True):
     id: UUID = Field(default_factory=uuid4, primary_key=True)
     rq_job_id: str = Field(unique=True, index=True)  # redis queue job id
     job_type: str = Field(index=True)  # "analyze", "render", etc
-    status: str = Field(index=True)  # "queued", "running", "completed", "failed"
+    status: str = Field(index=True)  # "queued", "running", "completed", "failed", "cancelled"
     file_id: Optional[UUID] = Field(default=None, nullable=True, index=True)
     clip_id: Optional[UUID] = Field(default=None, nullable=True, index=True)
     progress_percent: int = Field(default=0)
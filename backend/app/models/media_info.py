@@ -0,0 +1,45 @@
+from datetime import datetime
+from uuid import UUID, uuid4
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from sqlalchemy import BigInteger
+
+class MediaInfo(SQLModel, table=True):
+    """everything one ffprobe pass learns about an original, so later stages never re-probe"""
+    __tablename__ = "media_info"
+    id: UUID = Field(default_factory=uuid4, primary_key=True)
+    original_file_id: UUID = Field(foreign_key="original_files.id", unique=True, index=True)
+    probe_version: int = Field(default=1)
+
+    # container
+    format_name: str = Field(default="unknown")
+    duration_ms: int = Field(default=0)
+    size_bytes: int = Field(default=0, sa_type=BigInteger)
+    bit_rate: int = Field(default=0, sa_type=BigInteger)
+    creation_time: Optional[str] = Field(default=None, nullable=True)
+
+    # first video stream
+    video_codec: Optional[str] = Field(default=None, nullable=True)
+    video_profile: Optional[str] = Field(default=None, nullable=True)
+    pix_fmt: Optional[str] = Field(default=None, nullable=True)
+    level: Optional[int] = Field(default=None, nullable=True)
+    width: int = Field(default=0)
+    height: int = Field(default=0)
+    fps: float = Field(default=0.0)
+    video_bit_rate: int = Field(default=0, sa_type=BigInteger)
+    rotation: int = Field(default=0)  # clockwise degrees
+
+    # first audio stream
+    has_audio: bool = Field(default=False)
+    audio_codec: Optional[str] = Field(default=None, nullable=True)
+    audio_channels: int = Field(default=0)
+    audio_sample_rate: int = Field(default=0)
+
+    # GOP structure from the packet scan
+    frame_count: int = Field(default=0)
+    keyframe_count: int = Field(default=0)
+    mean_gop_frames: float = Field(default=0.0)
+    max_gop_frames: int = Field(default=0)
+
+    streams_json: str = Field(default="[]")  # every stream as probed, for fields not broken out above
+    created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -1,11 +1,17 @@
 from datetime import datetime
 from uuid import UUID, uuid4
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index
 from typing import Optional
 from .files import OriginalFile
 
 class CandidateSegment(SQLModel, table=True):
     __tablename__ = "candidate_segments"
+    __table_args__ = (
+        # per-video navigation (unreviewed ids in timeline order) and /sort/next's pick
+        Index("ix_candidate_segments_file_status_start", "original_file_id", "status", "start_ms"),
+        Index("ix_candidate_segments_status_confidence", "status", "confidence_score"),
+    )
     id: UUID = Field(default_factory=uuid4, primary_key=True)
     
     original_file_id: UUID = Field(foreign_key="original_files.id")
@@ -33,3 +39,20 @@ class HighlightWindow(SQLModel, table=True):
     source: str  # user_final_clip, auto_negative, manual_label
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+
+
+class VideoReviewCount(SQLModel, table=True):
+    """per-video segment counts by status, kept in step with every status change (services/review_counts.py)"""
+    __tablename__ = "video_review_counts"
+    original_file_id: UUID = Field(foreign_key="original_files.id", primary_key=True)
+    total: int = Field(default=0)
+    unreviewed: int = Field(default=0)
+    accepted: int = Field(default=0)
+    trashed: int = Field(default=0)
+
+
+class SortCounter(SQLModel, table=True):
+    """global sort queue counters (videos_remaining)"""
+    __tablename__ = "sort_counters"
+    name: str = Field(primary_key=True)
+    value: int = Field(default=0)
@@ -0,0 +1,221 @@
+import os
+import shutil
+import time
+from typing import Dict, Optional, Tuple
+from sqlmodel import Session, select
+from app.core.db import engine
+from app.core.config import settings
+from app.models import OriginalFile
+
+# admission control: workers only pull from queues whose work the host can take
+# right now, and the drive poller only queues a download that fits.
+#
+#   interactive  - always, unless the disk is down to its reserve
+#   analysis     - cheap stages (probe, candidates, persist, archive) always, so
+#                  files in flight keep finishing and freeing their work dirs;
+#                  cpu/memory heavy stages wait on load and memory, proxy
+#                  stages also on disk headroom
+#   ingest       - waits while the disk is near its headroom; drive downloads
+#                  also while ADMIT_MAX_ANALYZING analyses are already waiting
+#                  for a slot (how many run at once is the dispatcher's job)
+#   maintenance  - waits on load and memory
+#
+# disk headroom = free - reserve - what queued work is about to write (queued
+# and running downloads, reserved when they're queued, and the proxies of
+# files not analyzed yet)
+
+# cheap analysis stages aren't listed anywhere and always run
+CPU_HEAVY_QUEUES = {"analysis_proxy", "playback_proxy", "motion", "audio", "ml", "maintenance", "default"}
+DISK_HEAVY_QUEUES = {"analysis_proxy", "playback_proxy", "ingest", "download"}
+DISK_WRITING_QUEUES = DISK_HEAVY_QUEUES | {"interactive"}
+
+# rough proxy sizes: 480p/15fps crf 28 analysis proxy, <=1080p crf 23 playback proxy
+ANALYSIS_PROXY_BYTES_PER_SEC = 1_000_000 // 8
+PLAYBACK_PROXY_BYTES_PER_SEC = 6_000_000 // 8
+# before a download is probed only its size is known
+PROXY_BYTES_PER_SOURCE_BYTE = 0.5
+
+GB = 1024 ** 3
+
+# the drive download job type (its unique markers carry the disk reservations)
+DOWNLOAD_JOB = "download_and_process_from_drive"
+
+
+def cpu_count() -> int:
+    """cores this process may use (respects cpusets / docker --cpuset-cpus)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def read_proc_int(path: str, field: int = 0) -> int:
+    """whitespace-separated field of a /proc or /sys file as an int, 0 if unreadable ("max" too)"""
+    try:
+        with open(path) as f:
+            return int(f.read().split()[field])
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def available_memory_mb() -> int:
+    """MemAvailable, capped by the container's cgroup limit if there is one"""
+    available = 0
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) // 1024
+                    break
+    except OSError:
+        pass
+
+    # cgroup v2; "max" (no limit) doesn't parse and reads as 0
+    limit = read_proc_int("/sys/fs/cgroup/memory.max")
+    if limit:
+        in_cgroup = (limit - read_proc_int("/sys/fs/cgroup/memory.current")) // (1024 * 1024)
+        available = min(available, in_cgroup) if available else in_cgroup
+    return available
+
+
+def download_bytes(size_bytes: int) -> int:
+    """disk a drive download of size_bytes will take, with its proxies"""
+    return size_bytes + int(size_bytes * PROXY_BYTES_PER_SOURCE_BYTE)
+
+
+def estimate_proxy_bytes(file: OriginalFile) -> int:
+    """disk the analysis + playback proxies of a not yet analyzed file will take"""
+    from app.services.analysis_pipeline import get_work_dir
+    from app.video.proxy_utils import is_playback_proxy_ready
+
+    seconds = file.duration_ms / 1000
+    if seconds <= 0:
+        return int(file.file_size_bytes * PROXY_BYTES_PER_SOURCE_BYTE)
+
+    total = 0
+    if not (get_work_dir(file.id) / "analysis_proxy.json").exists():
+        total += seconds * ANALYSIS_PROXY_BYTES_PER_SEC
+    if not is_playback_proxy_ready(file.stored_path):
+        # a remuxed proxy is as big as the source, never bigger
+        playback = seconds * PLAYBACK_PROXY_BYTES_PER_SEC
+        total += min(playback, file.file_size_bytes) if file.file_size_bytes else playback
+    return int(total)
+
+
+class AdmissionController:
+    """decides which queues this host can take work from right now"""
+
+    def __init__(self):
+        self._snapshot: Optional[dict] = None
+        self._snapshot_at = 0.0
+        self._last_blocked: Dict[str, str] = {}
+
+    def _pending_downloads(self) -> Tuple[int, int]:
+        """
+        (count, bytes) of drive downloads queued or running
+
+        reserved when enqueue_unique queues them and released by the job's
+        callbacks, so no queue scan. a running download counts in full until
+        it ends (its partial file is counted twice, on the safe side)
+        """
+        from app.services.queue import reserved_unique
+
+        reserved = reserved_unique(DOWNLOAD_JOB)
+        return len(reserved), sum(reserved.values())
+
+    def snapshot(self, max_age: Optional[float] = None) -> dict:
+        """host + backlog numbers admission decides on (cached for ADMISSION_CACHE_SECONDS)"""
+        max_age = settings.ADMISSION_CACHE_SECONDS if max_age is None else max_age
+        if self._snapshot is not None and time.monotonic() - self._snapshot_at < max_age:
+            return self._snapshot
+
+        from app.services.queue import LANES, get_queue
+        from app.services.analysis_pipeline import analysis_backlog
+
+        free = shutil.disk_usage(settings.DATA_DIR).free
+        downloads, download_bytes = self._pending_downloads()
+
+        with Session(engine) as session:
+            in_flight = session.exec(
+                select(OriginalFile).where(OriginalFile.processing_status.in_(["pending", "analyzing"]))
+            ).all()
+            proxy_bytes = sum(estimate_proxy_bytes(f) for f in in_flight)
+
+        projected = download_bytes + proxy_bytes
+        backlog = analysis_backlog()
+        self._snapshot = {
+            "disk_free_bytes": free,
+            "projected_bytes": projected,
+            "disk_headroom_bytes": free - projected - int(settings.ADMIT_MIN_FREE_GB * GB),
+            "load_per_cpu": os.getloadavg()[0] / cpu_count(),
+            "memory_available_mb": available_memory_mb(),
+            "analyses_waiting": backlog["waiting"],
+            "analyses_running": backlog["running"],
+            "files_analyzing": sum(1 for f in in_flight if f.processing_status == "analyzing"),
+            "files_pending": sum(1 for f in in_flight if f.processing_status == "pending"),
+            "downloads_queued": downloads,
+            "lane_depth": {lane: sum(get_queue(q).count for q in names) for lane, names in LANES.items()},
+        }
+        self._snapshot_at = time.monotonic()
+        return self._snapshot
+
+    def queue_blocked(self, queue_name: str, snap: dict) -> Optional[str]:
+        """why queue_name can't take work now, or None if it can"""
+        if queue_name in DISK_WRITING_QUEUES and snap["disk_free_bytes"] < settings.ADMIT_MIN_FREE_GB * GB:
+            return f"disk free {snap['disk_free_bytes'] / GB:.1f}GB under reserve"
+
+        if queue_name in CPU_HEAVY_QUEUES:
+            if snap["load_per_cpu"] > settings.ADMIT_MAX_LOAD_PER_CPU:
+                return f"load {snap['load_per_cpu']:.2f}/cpu"
+            if snap["memory_available_mb"] and snap["memory_available_mb"] < settings.ADMIT_MIN_MEMORY_MB:
+                return f"memory {snap['memory_available_mb']}MB available"
+
+        if queue_name in DISK_HEAVY_QUEUES and snap["disk_headroom_bytes"] < settings.ADMIT_DISK_HEADROOM_GB * GB:
+            return f"disk headroom {snap['disk_headroom_bytes'] / GB:.1f}GB"
+
+        if queue_name == "download" and snap["analyses_waiting"] >= settings.ADMIT_MAX_ANALYZING:
+            return f"analysis behind, {snap['analyses_waiting']} files waiting"
+        return None
+
+    def admitted_queues(self, queues: list) -> list:
+        """the queues (in the given order) whose work the host can take now"""
+        if not settings.ADMISSION_ENABLED:
+            return list(queues)
+        try:
+            snap = self.snapshot()
+        except Exception as e:
+            # never stall the workers because the numbers couldn't be read
+            print(f"[ADMISSION] snapshot failed, admitting everything: {e}")
+            return list(queues)
+
+        admitted = []
+        for q in queues:
+            reason = self.queue_blocked(q.name, snap)
+            if reason is None:
+                admitted.append(q)
+                if self._last_blocked.pop(q.name, None):
+                    print(f"[ADMISSION] {q.name}: admitted again")
+            elif self._last_blocked.get(q.name) != reason.split()[0]:
+                # log when a queue starts waiting on something new, not every re-check
+                self._last_blocked[q.name] = reason.split()[0]
+                print(f"[ADMISSION] {q.name}: holding ({reason})")
+        return admitted
+
+    def can_download(self, size_bytes: int, snap: Optional[dict] = None) -> Tuple[bool, Optional[str]]:
+        """
+        whether a drive download of size_bytes (plus its proxies) may be queued now
+
+        pass the poll's snapshot to check several candidates against one read
+        """
+        snap = snap or self.snapshot(max_age=0)
+        if settings.ADMISSION_ENABLED and snap["analyses_waiting"] >= settings.ADMIT_MAX_ANALYZING:
+            return False, f"analysis behind, {snap['analyses_waiting']} files waiting"
+
+        need = download_bytes(size_bytes)
+        if snap["disk_headroom_bytes"] < need:
+            return False, f"disk: needs {need / GB:.1f}GB, headroom {snap['disk_headroom_bytes'] / GB:.1f}GB"
+        return True, None
+
+
+# singleton instance
+admission = AdmissionController()
@@ -0,0 +1,903 @@
+from app.core.db import engine
+from app.core.config import settings
+from app.models import OriginalFile, CandidateSegment, Job
+from app.core.errors import JobCancelled, TransientError, is_transient, is_job_timeout
+from app.services.job_tracker import start_job, complete_job, fail_job, set_file_progress
+from app.services.log_publisher import publish_log
+from app.services.ffmpeg_runner import job_progress
+from app.services import review_counts
+from sqlmodel import Session, select
+from dataclasses import asdict
+from pathlib import Path
+from rq import get_current_job
+from typing import Callable, Optional
+from uuid import UUID, uuid4
+from datetime import datetime
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+
+# analysis as a graph of small jobs, one queue per stage:
+#
+#   ingest -> probe -> analysis_proxy -> motion --> candidates -> ml -> persist -> archive
+#                  \-> audio ---------------------/
+#                  \-> playback_proxy
+#
+# stages hand results to each other through files in DATA_DIR/analysis/<file_id>,
+# so a retried stage only redoes its own work. stages that produce an artifact
+# also write a checkpoint (artifact path, sha256, stage version, source file
+# hash, params hash); a re-run with a still-valid checkpoint skips the work
+
+# stage -> (job timeout, file progress once the stage is done)
+STAGES = {
+    "ingest": ("2h", 5),
+    "probe": ("30m", 10),
+    "analysis_proxy": ("1h", 20),
+    "audio": ("30m", 30),
+    "motion": ("2h", 45),
+    "playback_proxy": ("1h", None),
+    "candidates": ("10m", 55),
+    "ml": ("1h", 70),
+    "persist": ("10m", 100),
+    "archive": ("30m", None),
+}
+
+# bump when a stage's output changes meaning; older checkpoints are then ignored
+STAGE_VERSIONS = {
+    "analysis_proxy": 1,
+    "audio": 1,
+    "motion": 1,
+    "candidates": 1,
+    "ml": 1,
+}
+
+# stages that save partial progress while they run (checkpoint name); a run
+# killed by its job timeout after saving more is retried and resumes from it
+PARTIAL_CHECKPOINTS = {
+    "motion": "motion.partial",
+}
+
+# one analysis graph per file at a time; the marker lives until archive
+# finishes or a stage fails for good
+UNIQUE_TYPE = "analysis"
+UNIQUE_TTL_SECONDS = 24 * 3600
+
+
+def get_work_dir(file_id) -> Path:
+    return Path(settings.DATA_DIR) / "analysis" / str(file_id)
+
+
+def _save_json(file_id, name: str, data):
+    path = get_work_dir(file_id) / f"{name}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(data))
+    os.replace(tmp_path, path)
+
+
+def _load_json(file_id, name: str):
+    return json.loads((get_work_dir(file_id) / f"{name}.json").read_text())
+
+
+def _save_series(file_id, name: str, times: np.ndarray, values: np.ndarray, **extra) -> str:
+    path = get_work_dir(file_id) / f"{name}.npz"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.stem + ".tmp.npz")
+    np.savez(tmp_path, times=times, values=values, **extra)
+    os.replace(tmp_path, path)
+    return str(path)
+
+
+def _load_series(file_id, name: str) -> tuple:
+    with np.load(get_work_dir(file_id) / f"{name}.npz") as data:
+        return data["times"], data["values"]
+
+
+def _file_sha256(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def _params_hash(params: dict) -> str:
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def write_checkpoint(file: OriginalFile, stage: str, artifact: str, params: dict) -> dict:
+    """record that `stage` produced `artifact` for this source + params"""
+    record = {
+        "stage": stage,
+        "version": STAGE_VERSIONS[stage.split(".")[0]],
+        "source_hash": file.file_hash,
+        "params_hash": _params_hash(params),
+        "artifact": artifact,
+        "sha256": _file_sha256(artifact),
+        "created_at": datetime.utcnow().isoformat(),
+    }
+    _save_json(file.id, f"{stage}.checkpoint", record)
+    return record
+
+
+def valid_checkpoint(file: OriginalFile, stage: str, params: dict) -> Optional[dict]:
+    """the stage's checkpoint if its artifact is intact and still matches this run, else None"""
+    try:
+        record = _load_json(file.id, f"{stage}.checkpoint")
+    except (OSError, ValueError):
+        return None
+
+    if (
+        record.get("version") != STAGE_VERSIONS[stage.split(".")[0]]
+        or record.get("source_hash") != file.file_hash
+        or record.get("params_hash") != _params_hash(params)
+        or not os.path.exists(record.get("artifact", ""))
+    ):
+        return None
+    # a crash can't leave a torn artifact (writes are tmp + rename), but an
+    # evicted / replaced file can still be swapped under us
+    if _file_sha256(record["artifact"]) != record["sha256"]:
+        return None
+    return record
+
+
+def _artifact_sha256(file_id, stage: str) -> str:
+    """hash of an upstream stage's artifact, used as part of a downstream stage's params"""
+    return _load_json(file_id, f"{stage}.checkpoint")["sha256"]
+
+
+def _add_elapsed(file_id, stage: str, seconds: float):
+    key = ELAPSED_KEY.format(file_id)
+    pipe = _redis().pipeline(transaction=False)
+    pipe.hincrbyfloat(key, stage, seconds)
+    pipe.expire(key, UNIQUE_TTL_SECONDS)
+    pipe.execute()
+
+
+def _partial_mark(file: OriginalFile, stage: str, params: Optional[dict]) -> Optional[str]:
+    """when the stage's partial checkpoint was written, if it has a valid one"""
+    if stage not in PARTIAL_CHECKPOINTS or params is None:
+        return None
+    record = valid_checkpoint(file, PARTIAL_CHECKPOINTS[stage], params)
+    return record["created_at"] if record else None
+
+
+def _run_stage(file_id, stage: str, work: Callable, checkpoint_params: Optional[Callable] = None):
+    """
+    shared bookkeeping for one stage job: job record, file progress and,
+    once the stage won't be retried, marking the file failed
+
+    checkpointed stages pass checkpoint_params(file) -> dict and have work
+    return their artifact path; a valid checkpoint skips work entirely
+    """
+    current_job = get_current_job()
+
+    with Session(engine) as session:
+        file = session.get(OriginalFile, UUID(str(file_id)))
+        if not file:
+            raise ValueError(f"original file {file_id} not found")
+
+        params, partial = None, None
+        try:
+            if current_job:
+                start_job(current_job.id)
+
+            params = checkpoint_params(file) if checkpoint_params else None
+            partial = _partial_mark(file, stage, params)
+            checkpoint = valid_checkpoint(file, stage, params) if params is not None else None
+            if checkpoint:
+                print(f"[PIPELINE] {stage} for {file.original_filename}: checkpoint from {checkpoint['created_at']} still valid, skipping")
+                result = checkpoint["artifact"]
+                _add_elapsed(file.id, "checkpoint", 0)
+            else:
+                started = time.monotonic()
+                result = work(session, file, current_job)
+                if params is not None and result:
+                    write_checkpoint(file, stage, result, params)
+                if stage != "playback_proxy":
+                    _add_elapsed(file.id, stage, time.monotonic() - started)
+
+            # last write wins when the flusher runs; parallel stages may report
+            # slightly out of order, which is fine for a progress bar
+            progress = STAGES[stage][1]
+            if progress is not None:
+                set_file_progress(file.id, progress)
+
+            if current_job:
+                complete_job(current_job.id)
+            return result
+        except JobCancelled:
+            # cancel_analysis already dropped the graph and freed its slot;
+            # only the partial stage files are left to clean up
+            session.rollback()
+            print(f"[PIPELINE] {stage} cancelled for {file.original_filename}")
+            shutil.rmtree(get_work_dir(file.id), ignore_errors=True)
+            raise
+        except Exception as e:
+            print(f"[PIPELINE] {stage} failed for {file.original_filename}: {e}")
+            error = e
+            if is_job_timeout(e) and _partial_mark(file, stage, params) not in (None, partial):
+                # it saved progress before the timeout hit: worth a retry, which resumes from there
+                error = TransientError(f"{stage} timed out, retry resumes from its partial checkpoint")
+            # mirrors queue._on_failure: only transient errors get the retry
+            if current_job is None or not current_job.retries_left or not is_transient(error):
+                file.processing_status = "failed"
+                session.add(file)
+                session.commit()
+                publish_log('worker', 'ERROR', f'❌ analysis {stage} failed: {file.original_filename}: {e}')
+                if current_job:
+                    fail_job(current_job.id, str(e))
+                # the rest of the graph will never run, allow a re-run
+                _drop_pending_stages(session, file.id)
+                _finish_analysis(file.id)
+            if error is not e:
+                raise error from e
+            raise
+
+
+def _drop_pending_stages(session: Session, file_id):
+    """
+    a stage failed for good: cancel the graph's stages that haven't started
+
+    rq leaves the dependents of a failed job deferred forever (and their job
+    rows "queued"). stages already running (e.g. playback_proxy next to a
+    failed motion) are left to finish, their checkpoints help the re-run
+    """
+    from app.services.queue import cancel_rq_job
+
+    rq_job_ids = session.exec(
+        select(Job.rq_job_id).where(Job.file_id == UUID(str(file_id)), Job.job_type.like("analysis_%"))
+    ).all()
+    dropped = 0
+    for rq_job_id in rq_job_ids:
+        try:
+            if cancel_rq_job(rq_job_id, stop_running=False) is not None:
+                dropped += 1
+        except Exception as e:
+            print(f"[PIPELINE] could not cancel stage {rq_job_id} of {file_id}: {e}")
+    if dropped:
+        print(f"[PIPELINE] dropped {dropped} pending stages of {file_id}")
+    return dropped
+
+
+def analysis_ingest(file_id: str):
+    """make sure the original is on local disk and mark the file as analyzing"""
+    def work(session, file, current_job):
+        if not os.path.exists(file.stored_path):
+            if not file.drive_file_id:
+                raise FileNotFoundError(f"original missing: {file.stored_path}")
+            # evicted since upload: pull it back from drive
+            from app.services.drive_sync import drive_sync
+            publish_log('worker', 'INFO', f'📥 re-downloading evicted original: {file.original_filename}')
+            drive_sync.download_video_from_drive(file.drive_file_id, file.original_filename, file.stored_path)
+
+        # stage files of an earlier, interrupted run are kept: their checkpoints
+        # are checked against the source hash, stage version and params, so
+        # whatever still matches is reused and the rest is redone
+
+        file.processing_status = "analyzing"
+        session.add(file)
+        session.commit()
+        publish_log('worker', 'INFO', f'🎬 starting analysis: {file.original_filename}')
+
+    return _run_stage(file_id, "ingest", work)
+
+
+def analysis_probe(file_id: str):
+    """media info + keyframe index (usually already cached by the ingest probe)"""
+    def work(session, file, current_job):
+        try:
+            from app.video.media_info import get_media_info
+            get_media_info(file.id, file.stored_path)
+        except Exception as e:
+            # nothing downstream strictly needs it, they fall back to probing
+            print(f"[DETECTION] ⚠️ media info probe failed: {e}")
+
+    return _run_stage(file_id, "probe", work)
+
+
+def analysis_proxy(file_id: str):
+    """low-res, low-fps proxy the motion and ml stages read"""
+    def work(session, file, current_job):
+        from app.video.proxy_utils import generate_proxy_video
+        publish_log('worker', 'INFO', '🔄 generating analysis proxy...')
+        proxy_path = generate_proxy_video(
+            file.stored_path,
+            on_progress=job_progress(current_job.id, 0, 99) if current_job else None
+        )
+        _save_json(file.id, "analysis_proxy", {"path": proxy_path})
+        # a fallback to the original isn't worth checkpointing (or hashing)
+        return proxy_path if proxy_path != file.stored_path else None
+
+    return _run_stage(file_id, "analysis_proxy", work, lambda file: {})
+
+
+def _motion_params(file) -> dict:
+    proxy = _load_json(file.id, "analysis_proxy")["path"]
+    if proxy == file.stored_path:
+        return {"proxy": "original"}
+    return {"proxy": _artifact_sha256(file.id, "analysis_proxy")}
+
+
+def analysis_motion(file_id: str):
+    """
+    motion energy over the analysis proxy; long videos checkpoint partial
+    results so a killed or timed-out run resumes where it stopped
+    """
+    def work(session, file, current_job):
+        from app.detection.stage1_motion import compute_motion_energy_timeseries
+        publish_log('worker', 'INFO', '📊 analyzing motion patterns (ORB keypoints + homography)...')
+        proxy_path = _load_json(file.id, "analysis_proxy")["path"]
+        params = _motion_params(file)
+
+        resume = None
+        partial = valid_checkpoint(file, "motion.partial", params)
+        if partial:
+            with np.load(partial["artifact"]) as data:
+                resume = {"times": data["times"], "energy": data["values"], "next_frame": int(data["next_frame"])}
+
+        def save_partial(times, energy, next_frame):
+            path = _save_series(file.id, "motion.partial", times, energy, next_frame=next_frame)
+            write_checkpoint(file, "motion.partial", path, params)
+
+        times, energy = compute_motion_energy_timeseries(
+            proxy_path,
+            resume=resume,
+            on_checkpoint=save_partial,
+            checkpoint_every_sec=settings.ANALYSIS_CHECKPOINT_SECONDS
+        )
+        path = _save_series(file.id, "motion", times, energy)
+
+        for name in ("motion.partial.npz", "motion.partial.checkpoint.json"):
+            (get_work_dir(file.id) / name).unlink(missing_ok=True)
+        return path
+
+    return _run_stage(file_id, "motion", work, _motion_params)
+
+
+def analysis_audio(file_id: str):
+    def work(session, file, current_job):
+        from app.detection.stage1_audio import compute_audio_energy_timeseries
+        from app.video.media_info import get_media_info
+
+        media = get_media_info(file.id)
+        if media and not media["has_audio"]:
+            print(f"[AUDIO] {file.original_filename} has no audio track, skipping")
+            times, energy = np.array([]), np.array([])
+        else:
+            # the analysis proxy is video only, audio comes from the original
+            publish_log('worker', 'INFO', '🔊 analyzing audio energy (impact detection)...')
+            times, energy = compute_audio_energy_timeseries(file.stored_path)
+        return _save_series(file.id, "audio", times, energy)
+
+    return _run_stage(file_id, "audio", work, lambda file: {})
+
+
+def analysis_playback_proxy(file_id: str):
+    """
+    build the browser proxy alongside the analysis when this video is going
+    to be near the head of the sort queue anyway (fewer videos waiting than
+    the scheduler's lookahead); otherwise the scheduler builds it later
+    """
+    def work(session, file, current_job):
+        from app.services.proxy_scheduler import proxy_scheduler
+        from app.services.proxy_coordinator import proxy_coordinator
+
+        upcoming = proxy_scheduler.get_upcoming_files(session, proxy_scheduler.lookahead)
+        if len(upcoming) >= proxy_scheduler.lookahead:
+            print(f"[PROXY] {len(upcoming)} videos ahead in the sort queue, leaving {file.original_filename} to the scheduler")
+            return
+        try:
+            proxy_coordinator.build(
+                file.id, file.stored_path, max_height=1080,
+                on_progress=job_progress(current_job.id, 0, 99) if current_job else None
+            )
+        except Exception as e:
+            # the sorter can still request it on demand, don't fail the analysis
+            print(f"[PROXY] early playback proxy failed for {file.original_filename}: {e}")
+
+    return _run_stage(file_id, "playback_proxy", work)
+
+
+def analysis_candidates(file_id: str):
+    """fuse motion + audio into candidate windows"""
+    def work(session, file, current_job):
+        from app.detection.config import DetectionConfig
+        from app.detection.stage1_candidates import find_candidate_windows
+        from app.detection.signal_pyramid import save_signal_pyramids
+
+        motion_times, motion_energy = _load_series(file.id, "motion")
+        audio_times, audio_energy = _load_series(file.id, "audio")
+
+        # keep the raw signals as a zoomable min/max/mean pyramid for the UI
+        try:
+            save_signal_pyramids(file.id, {
+                "motion": (motion_times, motion_energy),
+                "audio": (audio_times, audio_energy),
+            })
+        except Exception as e:
+            print(f"[DETECTION] could not save signal pyramids: {e}")
+
+        windows = find_candidate_windows(motion_times, motion_energy, audio_times, audio_energy, DetectionConfig())
+        _save_json(file.id, "candidates", [asdict(w) for w in windows])
+
+        publish_log('worker', 'SUCCESS', f'✅ stage 1 complete: found {len(windows)} candidate windows')
+        print(f"[DETECTION] stage 1 produced {len(windows)} windows")
+        return str(get_work_dir(file.id) / "candidates.json")
+
+    def params(file):
+        from app.detection.config import DetectionConfig
+        return {
+            "motion": _artifact_sha256(file.id, "motion"),
+            "audio": _artifact_sha256(file.id, "audio"),
+            "config": DetectionConfig().model_dump(),
+        }
+
+    return _run_stage(file_id, "candidates", work, params)
+
+
+def analysis_ml(file_id: str):
+    """stage 2 ml scoring (passes windows through when disabled or no model)"""
+    def work(session, file, current_job):
+        from app.detection.config import DetectionConfig
+        from app.detection.stage1_candidates import CandidateWindow
+
+        config = DetectionConfig()
+        windows = [CandidateWindow(**w) for w in _load_json(file.id, "candidates")]
+        method = "motion_audio_stage1"
+
+        if config.use_ml_stage2:
+            from app.detection import get_highlight_model
+            method = "motion_audio_ml"
+            highlight_model = get_highlight_model()
+
+            if highlight_model:
+                print(f"[DETECTION] running stage 2 ml scoring...")
+                proxy_path = _load_json(file.id, "analysis_proxy")["path"]
+
+                filtered_windows = []
+                ml_times, ml_scores = [], []
+                for window in windows:
+                    ml_score = highlight_model.score_clip(proxy_path, window.start_sec, window.end_sec)
+
+                    # combine scores: weighted average
+                    final_score = config.ml_weight * ml_score + config.stage1_weight * window.combined_score
+                    ml_times.append((window.start_sec + window.end_sec) / 2)
+                    ml_scores.append(ml_score)
+
+                    # filter by ml threshold
+                    if final_score >= config.ml_threshold:
+                        window.ml_score = ml_score
+                        window.final_score = final_score
+                        filtered_windows.append(window)
+
+                print(f"[DETECTION] stage 2 filtered to {len(filtered_windows)} windows")
+
+                try:
+                    from app.detection.signal_pyramid import save_signal_pyramids
+                    save_signal_pyramids(file.id, {"ml": (np.array(ml_times), np.array(ml_scores))})
+                except Exception as e:
+                    print(f"[DETECTION] could not save ml score pyramid: {e}")
+                windows = filtered_windows
+            else:
+                print(f"[DETECTION] ml model not available, using stage 1 only")
+
+        _save_json(file.id, "scored", {
+            "detection_method": method,
+            "segments": [
+                (int(w.start_sec * 1000), int(w.end_sec * 1000), float(w.final_score or w.combined_score))
+                for w in windows
+            ],
+        })
+        return str(get_work_dir(file.id) / "scored.json")
+
+    def params(file):
+        from app.detection.config import DetectionConfig
+        from app.detection.highlight_model import current_model_name
+        config = DetectionConfig()
+        return {
+            "candidates": _artifact_sha256(file.id, "candidates"),
+            "config": config.model_dump(),
+            "model": current_model_name() if config.use_ml_stage2 else None,
+        }
+
+    return _run_stage(file_id, "ml", work, params)
+
+
+def analysis_persist(file_id: str):
+    """write candidate segments and mark the file completed"""
+    def work(session, file, current_job):
+        scored = _load_json(file.id, "scored")
+        segments = scored["segments"]
+
+        publish_log('worker', 'INFO', f'💾 saving {len(segments)} segments to database...')
+        new_segments = [
+            CandidateSegment(
+                original_file_id=file.id,
+                start_ms=int(start),
+                end_ms=int(end),
+                confidence_score=float(confidence),
+                detection_method=scored["detection_method"]
+            )
+            for start, end, confidence in segments
+        ]
+        session.add_all(new_segments)
+        review_counts.segments_added(session, new_segments)
+
+        file.processing_status = "completed"
+        file.analysis_progress_percent = 100
+        session.add(file)
+        session.commit()
+        publish_log('worker', 'SUCCESS', f'🎉 analysis complete: {file.original_filename} - {len(segments)} segments ready for sorting')
+        print(f"analyzed file {file.id}: found {len(segments)} segments")
+
+        try:
+            _record_analysis_time(file)
+        except Exception as e:
+            print(f"[COST] could not record analysis time: {e}")
+
+        # new segments may have moved this video into the proxy lookahead window
+        try:
+            from app.services.proxy_scheduler import proxy_scheduler
+            proxy_scheduler.schedule()
+        except Exception as e:
+            print(f"[DETECTION] proxy scheduling failed: {e}")
+
+        # poster + scrub sprites for the library and sort timeline
+        try:
+            from app.services.thumbnail_service import thumbnail_service
+            thumbnail_service.request_video_thumbnails(file)
+        except Exception as e:
+            print(f"[DETECTION] thumbnail queueing failed: {e}")
+
+    return _run_stage(file_id, "persist", work)
+
+
+def analysis_archive(file_id: str):
+    """move a drive-sourced raw video to the processed folder, drop stage files"""
+    def work(session, file, current_job):
+        # NOTE: do NOT delete the original here, it is needed for sorting;
+        # cleanup happens via StorageManager LRU eviction
+        if file.drive_file_id:
+            from app.services.drive_sync import drive_sync
+            print(f"moving raw video to processed folder in drive")
+            drive_sync.move_to_processed_folder(file.drive_file_id, file.original_filename, file.recorded_at)
+
+        shutil.rmtree(get_work_dir(file.id), ignore_errors=True)
+        _finish_analysis(file.id)
+
+    return _run_stage(file_id, "archive", work)
+
+
+def start_analysis_graph(file_id) -> dict:
+    """
+    queue the whole analysis graph for one original
+
+    every stage goes to its own queue and waits on its inputs via depends_on,
+    so independent stages run on whichever workers are free. a stage is
+    retried on its own (ANALYSIS_STAGE_RETRIES); dependents of a stage that
+    keeps failing are never started.
+
+    returns: stage name -> rq job
+    """
+    from app.services.queue import enqueue_job
+
+    graph = [
+        ("ingest", analysis_ingest, []),
+        ("probe", analysis_probe, ["ingest"]),
+        ("analysis_proxy", analysis_proxy, ["probe"]),
+        ("audio", analysis_audio, ["probe"]),
+        ("playback_proxy", analysis_playback_proxy, ["probe"]),
+        ("motion", analysis_motion, ["analysis_proxy"]),
+        ("candidates", analysis_candidates, ["motion", "audio"]),
+        ("ml", analysis_ml, ["candidates"]),
+        ("persist", analysis_persist, ["ml"]),
+        ("archive", analysis_archive, ["persist"]),
+    ]
+
+    jobs = {}
+    try:
+        for stage, func, needs in graph:
+            # retries (ANALYSIS_STAGE_RETRIES, with backoff) come from enqueue_job
+            jobs[stage] = enqueue_job(
+                func, str(file_id),
+                file_id=UUID(str(file_id)),
+                timeout=STAGES[stage][0],
+                queue_name=stage,
+                depends_on=[jobs[n] for n in needs] or None
+            )
+    except Exception:
+        # a half-queued graph can't finish: cancel what made it in
+        for job in jobs.values():
+            try:
+                job.cancel()
+            except Exception:
+                pass
+        raise
+
+    print(f"[PIPELINE] queued {len(jobs)} analysis stages for {file_id}")
+    return jobs
+
+
+# --- scheduling ---
+# graphs don't go straight to the queues: they wait in a sorted set and the
+# dispatcher starts them shortest predicted job first (cost_model), at most
+# ADMIT_MAX_ANALYZING at a time. waiting also counts: every second a file has
+# waited takes ANALYSIS_SJF_AGING seconds off its predicted cost, so a long
+# 4K file is delayed by short clips but never starved
+
+WAITING_KEY = "analysis:waiting"  # zset file id -> submitted at (epoch seconds)
+PREDICTED_KEY = "analysis:predicted"  # hash file id -> cost_model.predict_file json
+RUNNING_KEY = "analysis:running"  # hash file id -> dispatched at
+ELAPSED_KEY = "analysis:elapsed:{}"  # hash stage -> seconds of work, for the cost model
+DISPATCH_LOCK = "analysis:dispatch"
+
+
+def _redis():
+    from app.services.queue import redis_conn
+    return redis_conn
+
+
+def effective_cost(predicted_seconds: float, waited_seconds: float, aging: float) -> float:
+    return predicted_seconds - aging * waited_seconds
+
+
+def order_waiting(waiting: dict, now: float, aging: float) -> list:
+    """file ids in dispatch order; waiting maps file id -> (submitted at, predicted seconds)"""
+    return sorted(waiting, key=lambda f: (effective_cost(waiting[f][1], now - waiting[f][0], aging), waiting[f][0]))
+
+
+def estimate_etas(running: dict, queued: list, costs: dict, slots: int) -> dict:
+    """
+    seconds until each file is analyzed, assuming the current order holds
+
+    running maps file id -> predicted seconds left, queued is the dispatch
+    order and costs its predicted seconds; each of the slots picks up the
+    next queued file as soon as it frees up
+    """
+    import heapq
+
+    etas = dict(running)
+    free_at = sorted(running.values())[:slots]
+    free_at += [0.0] * (slots - len(free_at))
+    heapq.heapify(free_at)
+    for file_id in queued:
+        done = heapq.heappop(free_at) + costs[file_id]
+        etas[file_id] = done
+        heapq.heappush(free_at, done)
+    return etas
+
+
+def _predict(file_id) -> dict:
+    from app.services.cost_model import cost_model, media_for_file
+
+    with Session(engine) as session:
+        file = session.get(OriginalFile, UUID(str(file_id)))
+        if not file:
+            raise ValueError(f"original file {file_id} not found")
+        return cost_model.predict_file(media_for_file(file))
+
+
+def _waiting(redis) -> dict:
+    submitted = {f.decode(): at for f, at in redis.zrange(WAITING_KEY, 0, -1, withscores=True)}
+    if not submitted:
+        return {}
+    predicted = redis.hmget(PREDICTED_KEY, list(submitted))
+    return {
+        f: (at, json.loads(p)["total_seconds"] if p else 0.0)
+        for (f, at), p in zip(submitted.items(), predicted)
+    }
+
+
+def _running(redis) -> dict:
+    """graphs in flight (file id -> dispatched at); ones whose dedup marker is gone are dropped"""
+    from app.services.queue import _unique_key
+
+    running = {f.decode(): float(at) for f, at in redis.hgetall(RUNNING_KEY).items()}
+    if not running:
+        return {}
+    pipe = redis.pipeline(transaction=False)
+    for file_id in running:
+        pipe.exists(_unique_key(UNIQUE_TYPE, file_id))
+    stale = [f for f, live in zip(list(running), pipe.execute()) if not live]
+    if stale:
+        redis.hdel(RUNNING_KEY, *stale)
+    return {f: at for f, at in running.items() if f not in stale}
+
+
+def analysis_backlog() -> dict:
+    """how many graphs are waiting for a slot and how many are running"""
+    redis = _redis()
+    return {"waiting": redis.zcard(WAITING_KEY), "running": len(_running(redis))}
+
+
+def dispatch_analyses() -> int:
+    """start waiting graphs, cheapest first, while slots are free; returns how many started"""
+    from redis.exceptions import LockError
+    from app.services.queue import release_unique, _unique_key
+
+    redis = _redis()
+    lock = redis.lock(DISPATCH_LOCK, timeout=60, blocking_timeout=10)
+    if not lock.acquire():
+        return 0
+
+    started = 0
+    try:
+        free = settings.ADMIT_MAX_ANALYZING - len(_running(redis))
+        while free > 0:
+            waiting = _waiting(redis)
+            if not waiting:
+                break
+            file_id = order_waiting(waiting, time.time(), settings.ANALYSIS_SJF_AGING)[0]
+            redis.zrem(WAITING_KEY, file_id)
+            try:
+                start_analysis_graph(file_id)
+            except Exception as e:
+                print(f"[PIPELINE] could not start analysis for {file_id}: {e}")
+                redis.hdel(PREDICTED_KEY, file_id)
+                release_unique(UNIQUE_TYPE, file_id)
+                continue
+
+            redis.hset(RUNNING_KEY, file_id, time.time())
+            # waiting may have eaten into the marker's ttl
+            redis.expire(_unique_key(UNIQUE_TYPE, file_id), UNIQUE_TTL_SECONDS)
+            print(f"[PIPELINE] started analysis for {file_id} (predicted {waiting[file_id][1]:.0f}s, waited {time.time() - waiting[file_id][0]:.0f}s)")
+            free -= 1
+            started += 1
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            pass
+    return started
+
+
+def enqueue_analysis(file_id: UUID) -> Optional[dict]:
+    """
+    submit an original for analysis (no-op returning None while it is
+    already waiting, queued or running)
+
+    returns: {"position": place in the dispatch order (0 = started),
+              "eta_seconds": until it can be sorted, "predicted": cost_model estimate}
+    """
+    from app.services.queue import claim_unique, release_unique
+
+    if not claim_unique(UNIQUE_TYPE, file_id, str(uuid4()), UNIQUE_TTL_SECONDS):
+        print(f"[PIPELINE] analysis already queued for {file_id}, skipping")
+        return None
+
+    redis = _redis()
+    try:
+        try:
+            predicted = _predict(file_id)
+        except Exception as e:
+            # unknown cost sorts as "medium", not first or last
+            print(f"[PIPELINE] no cost prediction for {file_id}: {e}")
+            predicted = {"analysis_seconds": 600.0, "proxy_seconds": 60.0, "total_seconds": 660.0}
+        redis.hset(PREDICTED_KEY, str(file_id), json.dumps(predicted))
+        redis.zadd(WAITING_KEY, {str(file_id): time.time()})
+    except Exception:
+        release_unique(UNIQUE_TYPE, file_id)
+        raise
+
+    dispatch_analyses()
+    entry = next((e for e in analysis_queue_status() if e["file_id"] == str(file_id)), None)
+    return {
+        "position": entry["position"] if entry else 0,
+        "eta_seconds": entry["eta_seconds"] if entry else None,
+        "predicted": predicted,
+    }
+
+
+def _finish_analysis(file_id):
+    """a graph is done (or failed for good): free its slot and start the next one"""
+    from app.services.queue import release_unique
+
+    redis = _redis()
+    pipe = redis.pipeline(transaction=False)
+    pipe.hdel(RUNNING_KEY, str(file_id))
+    pipe.hdel(PREDICTED_KEY, str(file_id))
+    pipe.delete(ELAPSED_KEY.format(file_id))
+    pipe.execute()
+    release_unique(UNIQUE_TYPE, file_id)
+    try:
+        dispatch_analyses()
+    except Exception as e:
+        print(f"[PIPELINE] dispatch after {file_id} failed: {e}")
+
+
+def _record_analysis_time(file: OriginalFile):
+    """feed the stages' summed work time to the cost model (skipped if any stage reused a checkpoint)"""
+    from app.services.cost_model import cost_model, media_for_file
+
+    elapsed = {k.decode(): float(v) for k, v in _redis().hgetall(ELAPSED_KEY.format(file.id)).items()}
+    if not elapsed or "checkpoint" in elapsed:
+        return
+    cost_model.record("analysis", media_for_file(file), sum(elapsed.values()))
+
+
+def analysis_queue_status() -> list:
+    """running and waiting analyses with predicted cost and ETA, in dispatch order"""
+    redis = _redis()
+    now = time.time()
+    running = _running(redis)
+    waiting = _waiting(redis)
+    order = order_waiting(waiting, now, settings.ANALYSIS_SJF_AGING)
+
+    predicted = {}
+    ids = list(running) + order
+    for file_id, raw in zip(ids, redis.hmget(PREDICTED_KEY, ids) if ids else []):
+        predicted[file_id] = json.loads(raw) if raw else {"analysis_seconds": 0.0, "total_seconds": 0.0}
+
+    # sorting can start once the analysis part is done; the playback proxy runs next to it
+    remaining = {
+        f: max(0.05 * predicted[f]["analysis_seconds"], predicted[f]["analysis_seconds"] - (now - at))
+        for f, at in running.items()
+    }
+    etas = estimate_etas(remaining, order, {f: predicted[f]["analysis_seconds"] for f in order}, settings.ADMIT_MAX_ANALYZING)
+
+    result = []
+    for position, file_id in enumerate(ids):
+        is_running = file_id in running
+        result.append({
+            "file_id": file_id,
+            "status": "running" if is_running else "waiting",
+            "position": 0 if is_running else position - len(running) + 1,
+            "predicted_seconds": round(predicted[file_id]["total_seconds"]),
+            "waited_seconds": 0 if is_running else round(now - waiting[file_id][0]),
+            "eta_seconds": round(etas[file_id]),
+        })
+    return result
+
+
+def cancel_analysis(file_id) -> Optional[dict]:
+    """
+    drop a file's analysis: out of the waiting set if it hasn't started,
+    otherwise every stage job of its graph is cancelled (queued) or stopped
+    (running). the slot is freed right away; a stopped stage removes the
+    work dir on its way out
+
+    returns: {"waiting": was it still waiting, "jobs": rq ids cancelled},
+             or None if nothing was queued or running for the file
+    """
+    from app.services.queue import cancel_rq_job
+    from rq.job import JobStatus
+
+    redis = _redis()
+    was_waiting = bool(redis.zrem(WAITING_KEY, str(file_id)))
+
+    cancelled, stopping = [], False
+    with Session(engine) as session:
+        # the rows' status lags (batched flush), so rq decides what's still live
+        stage_jobs = session.exec(
+            select(Job).where(Job.file_id == UUID(str(file_id)), Job.job_type.like("analysis_%"))
+        ).all()
+        for job in stage_jobs:
+            status = cancel_rq_job(job.rq_job_id)
+            if status is not None:
+                cancelled.append(job.rq_job_id)
+                stopping = stopping or status == JobStatus.STARTED.value
+
+        if not was_waiting and not cancelled:
+            return None
+
+        file = session.get(OriginalFile, UUID(str(file_id)))
+        if file and file.processing_status in ("pending", "analyzing"):
+            file.processing_status = "cancelled"
+            session.add(file)
+            session.commit()
+
+    if not stopping:
+        shutil.rmtree(get_work_dir(file_id), ignore_errors=True)
+    _finish_analysis(file_id)
+    print(f"[PIPELINE] cancelled analysis for {file_id} ({'waiting' if was_waiting else f'{len(cancelled)} stage jobs'})")
+    return {"waiting": was_waiting, "jobs": cancelled}
+
+
+def cancel_waiting_analyses() -> int:
+    """cancel every analysis that hasn't started yet (e.g. an accidental reprocess-all)"""
+    waiting = [f.decode() for f in _redis().zrange(WAITING_KEY, 0, -1)]
+    return sum(1 for file_id in waiting if cancel_analysis(file_id) is not None)
@@ -0,0 +1,131 @@
+import json
+import time
+import numpy as np
+from typing import Dict, List, Optional
+
+# predicted analysis / playback proxy time of a video from its media info:
+#
+#   seconds = a + b * duration + c * duration * decode_rate
+#
+# decode_rate is megapixels per second of source (width * height * fps / 1e6)
+# scaled by how expensive the codec is to decode, so a 4K240 hevc file costs
+# what it should next to a 1080p30 h264 clip of the same length. a, b, c are
+# refit (least squares) from recent timings; until there are enough of those
+# the defaults below are used
+
+SAMPLES_KEY = "costs:samples:{}"
+MAX_SAMPLES = 500
+MIN_SAMPLES = 8
+REFIT_SECONDS = 600
+
+CODEC_WEIGHTS = {
+    "h264": 1.0,
+    "hevc": 1.6,
+    "prores": 1.3,
+    "vp9": 1.5,
+    "av1": 2.0,
+}
+DEFAULT_CODEC_WEIGHT = 1.2
+
+# (a, b, c) before anything has been measured
+DEFAULT_COEFFICIENTS = {
+    "analysis": (10.0, 0.3, 0.01),
+    "proxy": (2.0, 0.05, 0.008),
+}
+
+
+def features(media: dict) -> List[float]:
+    """[1, duration, duration * decode rate] for one video"""
+    duration = (media.get("duration_ms") or 0) / 1000
+    megapixels = (media.get("width") or 0) * (media.get("height") or 0) / 1e6
+    weight = CODEC_WEIGHTS.get(media.get("video_codec") or "", DEFAULT_CODEC_WEIGHT)
+    return [1.0, duration, duration * megapixels * (media.get("fps") or 0) * weight]
+
+
+class CostModel:
+    """least squares fit of job time on video features, per kind (analysis, proxy)"""
+
+    def __init__(self, redis=None):
+        self._redis = redis
+        self._fits: Dict[str, tuple] = {}
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            from app.services.queue import redis_conn
+            self._redis = redis_conn
+        return self._redis
+
+    def record(self, kind: str, media: dict, seconds: float):
+        """remember how long a job on this video took"""
+        sample = json.dumps({"x": features(media), "seconds": round(float(seconds), 2)})
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.lpush(SAMPLES_KEY.format(kind), sample)
+        pipe.ltrim(SAMPLES_KEY.format(kind), 0, MAX_SAMPLES - 1)
+        pipe.execute()
+
+    def fit(self, kind: str) -> tuple:
+        """coefficients from the recorded samples (defaults if too few or nonsense)"""
+        raw = self.redis.lrange(SAMPLES_KEY.format(kind), 0, MAX_SAMPLES - 1)
+        samples = [json.loads(s) for s in raw]
+        if len(samples) < MIN_SAMPLES:
+            return DEFAULT_COEFFICIENTS[kind]
+
+        x = np.array([s["x"] for s in samples], dtype=np.float64)
+        y = np.array([s["seconds"] for s in samples], dtype=np.float64)
+        coefficients, *_ = np.linalg.lstsq(x, y, rcond=None)
+        # a negative term means the samples don't pin it down yet
+        if np.any(coefficients < 0):
+            return DEFAULT_COEFFICIENTS[kind]
+        return tuple(float(c) for c in coefficients)
+
+    def coefficients(self, kind: str) -> tuple:
+        cached = self._fits.get(kind)
+        if cached and time.monotonic() - cached[0] < REFIT_SECONDS:
+            return cached[1]
+        try:
+            fitted = self.fit(kind)
+        except Exception as e:
+            print(f"[COST] fit for {kind} failed, using defaults: {e}")
+            fitted = DEFAULT_COEFFICIENTS[kind]
+        self._fits[kind] = (time.monotonic(), fitted)
+        return fitted
+
+    def predict(self, kind: str, media: dict) -> float:
+        """predicted seconds of work (not counting queue time)"""
+        return float(np.dot(self.coefficients(kind), features(media)))
+
+    def predict_file(self, media: dict) -> dict:
+        """analysis + proxy estimate for one original; proxies that only need a remux are ~free"""
+        analysis = self.predict("analysis", media)
+        proxy = self.predict("proxy", media)
+        try:
+            from app.video.proxy_utils import plan_playback_proxy
+            remux, _ = plan_playback_proxy(media, 1080)
+            if remux:
+                proxy = DEFAULT_COEFFICIENTS["proxy"][0]
+        except (KeyError, TypeError):
+            pass
+        return {"analysis_seconds": analysis, "proxy_seconds": proxy, "total_seconds": analysis + proxy}
+
+
+def media_for_file(file) -> Optional[dict]:
+    """the features cost prediction needs: probed media info, else the OriginalFile columns"""
+    from app.video.media_info import get_media_info
+    try:
+        media = get_media_info(file.id)
+    except Exception:
+        media = None
+    if media:
+        return media
+    return {
+        "duration_ms": file.duration_ms,
+        "width": file.width,
+        "height": file.height,
+        "fps": file.fps,
+        "video_codec": None,
+    }
+
+
+# singleton instance
+cost_model = CostModel()
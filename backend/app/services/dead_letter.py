@@ -0,0 +1,188 @@
+import json
+import os
+import time
+import traceback
+from typing import List, Optional
+from uuid import UUID
+from sqlmodel import Session, select
+from app.core.db import engine
+from app.core.config import settings
+from app.models import Job, OriginalFile
+
+# jobs that failed for good (retries used up, or an error a retry can't fix)
+# are parked here with their error and what they left on disk, until someone
+# replays or discards them. the rq job itself stays in its queue's
+# FailedJobRegistry, which is what a replay requeues; analysis stages are
+# replayed as a fresh analysis of the file instead (checkpoints make the
+# stages that already worked free)
+
+DLQ_KEY = "dlq:jobs"  # zset rq job id -> failed at (epoch seconds)
+DLQ_ENTRY_KEY = "dlq:job:{}"  # json entry
+
+
+def _job_type(job) -> str:
+    return (job.func_name or "").rsplit(".", 1)[-1]
+
+
+def _artifacts(file_id) -> dict:
+    """what a file's failed job left behind: the analysis work dir and the local original"""
+    from app.services.analysis_pipeline import get_work_dir
+
+    artifacts = {}
+    work_dir = get_work_dir(file_id)
+    if work_dir.exists():
+        artifacts["work_dir"] = str(work_dir)
+        artifacts["work_files"] = sorted(p.name for p in work_dir.iterdir())
+
+    with Session(engine) as session:
+        file = session.get(OriginalFile, UUID(str(file_id)))
+        if file:
+            artifacts["original"] = file.stored_path if os.path.exists(file.stored_path) else None
+            artifacts["processing_status"] = file.processing_status
+    return artifacts
+
+
+class DeadLetterQueue:
+    """failed-for-good jobs: inspect, replay, discard"""
+
+    def __init__(self, redis=None):
+        self._redis = redis
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            from app.services.queue import redis_conn
+            self._redis = redis_conn
+        return self._redis
+
+    def add(self, job, error: BaseException):
+        """park a job that failed for good (called from core/errors.handle_worker_error)"""
+        from app.core.errors import is_transient
+
+        with Session(engine) as session:
+            row = session.exec(select(Job).where(Job.rq_job_id == job.id)).first()
+            file_id = str(row.file_id) if row and row.file_id else None
+            clip_id = str(row.clip_id) if row and row.clip_id else None
+
+        entry = {
+            "rq_job_id": job.id,
+            "job_type": _job_type(job),
+            "queue": job.origin,
+            "args": [str(a) for a in job.args],
+            "file_id": file_id,
+            "clip_id": clip_id,
+            "error_type": type(error).__name__,
+            "error": str(error)[:2000],
+            "traceback": "".join(traceback.format_exception(type(error), error, error.__traceback__))[-8000:],
+            "transient": is_transient(error),
+            "attempts": job.meta.get("attempts", 1),
+            "failed_at": time.time(),
+            "artifacts": _artifacts(file_id) if file_id else {},
+        }
+
+        retention = settings.DLQ_RETENTION_DAYS * 86400
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(DLQ_ENTRY_KEY.format(job.id), json.dumps(entry), ex=retention)
+        pipe.zadd(DLQ_KEY, {job.id: entry["failed_at"]})
+        # entries expire on their own; drop their ids too
+        pipe.zremrangebyscore(DLQ_KEY, 0, entry["failed_at"] - retention)
+        pipe.execute()
+        print(f"[DLQ] {entry['job_type']} {job.id} dead-lettered after {entry['attempts']} attempt(s): {entry['error_type']}: {entry['error'][:200]}")
+
+    def get(self, rq_job_id: str) -> Optional[dict]:
+        raw = self.redis.get(DLQ_ENTRY_KEY.format(rq_job_id))
+        return json.loads(raw) if raw else None
+
+    def entries(self, limit: int = 100) -> List[dict]:
+        """newest first"""
+        ids = [i.decode() for i in self.redis.zrevrange(DLQ_KEY, 0, limit - 1)]
+        if not ids:
+            return []
+        raws = self.redis.mget([DLQ_ENTRY_KEY.format(i) for i in ids])
+        return [json.loads(raw) for raw in raws if raw]
+
+    def count(self) -> int:
+        return self.redis.zcard(DLQ_KEY)
+
+    def discard(self, rq_job_ids: List[str]) -> int:
+        if not rq_job_ids:
+            return 0
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zrem(DLQ_KEY, *rq_job_ids)
+        pipe.delete(*[DLQ_ENTRY_KEY.format(i) for i in rq_job_ids])
+        removed, _ = pipe.execute()
+        return removed
+
+    def _replay_one(self, entry: dict) -> Optional[str]:
+        """requeue one entry; returns why it couldn't be, or None"""
+        from rq.job import Job as RQJob
+        from rq.exceptions import NoSuchJobError, InvalidJobOperation
+        from app.services.queue import redis_conn, claim_unique, release_unique, retry_for
+        from app.services.job_tracker import requeue_job
+
+        if entry["job_type"].startswith("analysis_"):
+            if not entry.get("file_id"):
+                return "analysis stage without a file"
+            # the rest of that graph never ran; start the file over
+            from app.services.analysis_pipeline import enqueue_analysis
+            enqueue_analysis(UUID(entry["file_id"]))
+            return None
+
+        try:
+            rq_job = RQJob.fetch(entry["rq_job_id"], connection=redis_conn)
+        except NoSuchJobError:
+            return "rq job expired"
+
+        unique_type = rq_job.meta.get("unique_type")
+        if unique_type and not claim_unique(
+            unique_type, rq_job.meta["unique_key"], rq_job.id, reserve_bytes=rq_job.meta.get("reserve_bytes", 0)
+        ):
+            return "an identical job is already queued"
+
+        # a replay gets the job type's retries back
+        retry = retry_for(entry["job_type"])
+        rq_job.retries_left = retry.max if retry else None
+        rq_job.retry_intervals = retry.intervals if retry else None
+        rq_job.meta["attempts"] = 0
+        rq_job.save()
+        try:
+            rq_job.requeue()
+        except InvalidJobOperation as e:
+            if unique_type:
+                release_unique(unique_type, rq_job.meta["unique_key"], rq_job.id)
+            return str(e)
+        requeue_job(rq_job.id)
+        return None
+
+    def replay(self, rq_job_ids: Optional[List[str]] = None) -> dict:
+        """
+        requeue dead-lettered jobs (all of them when no ids are given)
+
+        returns: {"replayed": [ids], "skipped": {id: reason}}
+        """
+        if rq_job_ids is None:
+            rq_job_ids = [i.decode() for i in self.redis.zrange(DLQ_KEY, 0, -1)]
+
+        replayed, skipped = [], {}
+        for rq_job_id in rq_job_ids:
+            entry = self.get(rq_job_id)
+            if entry is None:
+                skipped[rq_job_id] = "not in the dead letter queue"
+                continue
+            try:
+                reason = self._replay_one(entry)
+            except Exception as e:
+                reason = f"replay failed: {e}"
+            if reason:
+                skipped[rq_job_id] = reason
+            else:
+                replayed.append(rq_job_id)
+
+        self.discard(replayed)
+        if replayed:
+            print(f"[DLQ] replayed {len(replayed)} job(s), skipped {len(skipped)}")
+        return {"replayed": replayed, "skipped": skipped}
+
+
+# singleton instance
+dead_letters = DeadLetterQueue()
@@ -172,6 +172,50 @@ class DriveService:
         else:
             raise DriveUploadError("Database session required for OAuth upload. Please authenticate at /admin/auth")
 
+    def upload_stream(self, stream, year: str, date_description: str, person_slug: str, trick_name: str,
+                      filename: str, db_session, on_progress=None, before_last_chunk=None) -> dict:
+        """
+        Upload a stream (e.g. ffmpeg stdout) to Google Drive without a local file.
+        Retries happen per chunk inside the resumable session; a pipe can't be
+        rewound, so there is no whole-upload retry like upload_file has.
+        """
+        if not self.service or not settings.GOOGLE_DRIVE_ROOT_FOLDER_ID:
+            print("google drive not configured, skipping upload")
+            return None
+        
+        from app.services.oauth_drive import oauth_drive_service
+        
+        year_folder_id = self._ensure_folder(settings.GOOGLE_DRIVE_ROOT_FOLDER_ID, year)
+        date_folder_id = self._ensure_folder(year_folder_id, date_description)
+        person_folder_id = self._ensure_folder(date_folder_id, f"{person_slug}Tricks")
+        trick_folder_id = self._ensure_folder(person_folder_id, trick_name)
+        
+        return oauth_drive_service.upload_stream(
+            stream,
+            folder_id=trick_folder_id,
+            filename=filename,
+            session=db_session,
+            on_progress=on_progress,
+            before_last_chunk=before_last_chunk
+        )
+
+    @retry_with_backoff(max_retries=3, initial_delay=2.0)
+    def copy_file(self, file_id: str, year: str, date_description: str, person_slug: str, trick_name: str,
+                  filename: str, db_session) -> dict:
+        """copy an existing drive file into a clip's folder (no download/upload)"""
+        if not self.service or not settings.GOOGLE_DRIVE_ROOT_FOLDER_ID:
+            print("google drive not configured, skipping copy")
+            return None
+        
+        from app.services.oauth_drive import oauth_drive_service
+        
+        year_folder_id = self._ensure_folder(settings.GOOGLE_DRIVE_ROOT_FOLDER_ID, year)
+        date_folder_id = self._ensure_folder(year_folder_id, date_description)
+        person_folder_id = self._ensure_folder(date_folder_id, f"{person_slug}Tricks")
+        trick_folder_id = self._ensure_folder(person_folder_id, trick_name)
+        
+        return oauth_drive_service.copy_file(file_id, trick_folder_id, filename, db_session)
+
     def move_file(self, file_id: str, target_folder_id: str):
         """moves a file to a target folder (server-side move)"""
         if not self.service:
@@ -0,0 +1,234 @@
+from app.core.errors import DriveUploadError
+from typing import Callable, Iterator, Optional, Tuple
+import hashlib
+import queue as queue_module
+import re
+import threading
+import time
+import requests
+
+# drive requires every chunk except the last to be a multiple of 256 KiB
+CHUNK_ALIGNMENT = 256 * 1024
+
+RESUMABLE_URL = "https://www.googleapis.com/upload/drive/v3/files?uploadType=resumable&fields=id,webViewLink,md5Checksum,size"
+
+# statuses worth retrying a chunk for; anything else 4xx is a hard failure
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def align_chunk_size(chunk_size: int) -> int:
+    """round down to the 256 KiB multiple drive expects (at least one unit)"""
+    return max(CHUNK_ALIGNMENT, chunk_size - chunk_size % CHUNK_ALIGNMENT)
+
+
+def _read_full(stream, size: int) -> bytes:
+    """read exactly size bytes from a pipe, or fewer at EOF"""
+    buf = bytearray()
+    while len(buf) < size:
+        data = stream.read(size - len(buf))
+        if not data:
+            break
+        buf += data
+    return bytes(buf)
+
+
+def iter_chunks(stream, chunk_size: int, prefetch: int = 2) -> Iterator[Tuple[bytes, bool]]:
+    """
+    fixed-size chunks from a pipe as (data, is_last)
+
+    a reader thread keeps up to `prefetch` chunks buffered, so ffmpeg keeps
+    producing while the previous chunk is on the wire. memory use is bounded
+    by (prefetch + 2) * chunk_size.
+    """
+    chunks: queue_module.Queue = queue_module.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.5)
+                return True
+            except queue_module.Full:
+                continue
+        return False
+
+    def reader():
+        try:
+            while True:
+                data = _read_full(stream, chunk_size)
+                if not data or not put(data):
+                    break
+        except Exception as e:
+            put(e)
+        put(None)
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+
+    def get():
+        item = chunks.get()
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    try:
+        current = get()
+        while current is not None:
+            following = get()
+            yield current, following is None
+            current = following
+    finally:
+        stop.set()
+
+
+class ResumableUpload:
+    """
+    one drive resumable upload session, fed chunk by chunk
+
+    a failed chunk is retried with backoff after asking drive how many bytes
+    it actually committed, so only the missing tail of the chunk is resent
+    """
+
+    def __init__(self, access_token: str, metadata: dict, mime_type: str = "video/mp4",
+                 http=None, max_retries: int = 5, initial_delay: float = 1.0):
+        self.access_token = access_token
+        self.metadata = metadata
+        self.mime_type = mime_type
+        self.http = http or requests
+        self.max_retries = max_retries
+        self.initial_delay = initial_delay
+        self.session_url = None
+
+    def _auth(self) -> dict:
+        return {"Authorization": f"Bearer {self.access_token}"}
+
+    def start(self) -> str:
+        response = self.http.post(
+            RESUMABLE_URL,
+            headers={**self._auth(), "X-Upload-Content-Type": self.mime_type},
+            json=self.metadata,
+        )
+        if response.status_code != 200:
+            raise DriveUploadError(f"could not start resumable upload: {response.status_code} {response.text}")
+        self.session_url = response.headers["Location"]
+        return self.session_url
+
+    @staticmethod
+    def _committed(response) -> int:
+        # 308 Range header is inclusive ("bytes=0-1048575"); missing means nothing stored yet
+        match = re.match(r"bytes=0-(\d+)", response.headers.get("Range", ""))
+        return int(match.group(1)) + 1 if match else 0
+
+    def query_offset(self) -> Tuple[int, Optional[dict]]:
+        """bytes drive has committed so far, plus the file resource if already complete"""
+        response = self.http.put(self.session_url, headers={**self._auth(), "Content-Range": "bytes */*"})
+        if response.status_code in (200, 201):
+            return -1, response.json()
+        if response.status_code == 308:
+            return self._committed(response), None
+        raise DriveUploadError(f"upload session lost: {response.status_code} {response.text}")
+
+    def send_chunk(self, data: bytes, offset: int, total: Optional[int] = None) -> Optional[dict]:
+        """
+        upload data at offset; total is the final size when this is the last chunk
+
+        returns the file resource once drive has the whole file, else None
+        """
+        delay = self.initial_delay
+        attempt = 0
+        sent = 0  # bytes of data drive has confirmed
+
+        while True:
+            body = data[sent:]
+            start = offset + sent
+            size = "*" if total is None else str(total)
+            content_range = f"bytes {start}-{start + len(body) - 1}/{size}" if body else f"bytes */{size}"
+
+            try:
+                response = self.http.put(
+                    self.session_url,
+                    headers={**self._auth(), "Content-Range": content_range, "Content-Length": str(len(body))},
+                    data=body,
+                )
+                status = response.status_code
+            except requests.exceptions.RequestException as e:
+                response, status = None, None
+                print(f"[DRIVE STREAM] chunk at {start} failed: {e}")
+
+            if status in (200, 201):
+                return response.json()
+            if status == 308:
+                committed = self._committed(response) - offset
+                if committed >= len(data):
+                    return None
+                if committed > sent:
+                    # partial commit: resend only what drive doesn't have yet
+                    sent = committed
+                    continue
+                # drive took nothing from that request: counts as a failed attempt
+                print(f"[DRIVE STREAM] chunk at {start} made no progress (drive has {offset + max(committed, 0)})")
+            elif status is not None and status not in RETRYABLE_STATUSES:
+                raise DriveUploadError(f"chunk upload failed: {status} {response.text}")
+
+            attempt += 1
+            if attempt > self.max_retries:
+                raise DriveUploadError(f"chunk at offset {start} failed after {self.max_retries} retries")
+            print(f"[DRIVE STREAM] retrying chunk at {start} in {delay}s (attempt {attempt}/{self.max_retries})")
+            time.sleep(delay)
+            delay *= 2
+
+            committed, resource = self.query_offset()
+            if resource is not None:
+                return resource
+            sent = min(max(committed - offset, 0), len(data))
+
+
+def upload_stream(
+    stream,
+    access_token: str,
+    metadata: dict,
+    chunk_size: int,
+    mime_type: str = "video/mp4",
+    on_progress: Optional[Callable[[int], None]] = None,
+    before_last_chunk: Optional[Callable[[], None]] = None,
+    http=None
+) -> dict:
+    """
+    upload a pipe to drive without buffering the whole file
+
+    md5 is computed as bytes go out and checked against drive's md5Checksum.
+    before_last_chunk runs once the stream hit EOF but before the upload is
+    finalized (e.g. to check the producer's exit code), so a failed render
+    never becomes a truncated file on drive.
+
+    returns: drive_file_id, drive_url, size_bytes, md5
+    """
+    upload = ResumableUpload(access_token, metadata, mime_type, http=http)
+    upload.start()
+
+    md5 = hashlib.md5()
+    offset = 0
+    resource = None
+
+    for chunk, is_last in iter_chunks(stream, align_chunk_size(chunk_size)):
+        if is_last and before_last_chunk:
+            before_last_chunk()
+        md5.update(chunk)
+        resource = upload.send_chunk(chunk, offset, offset + len(chunk) if is_last else None)
+        offset += len(chunk)
+        if on_progress:
+            on_progress(offset)
+
+    if resource is None:
+        raise DriveUploadError("upload stream ended without any data")
+
+    remote_md5 = resource.get("md5Checksum")
+    if remote_md5 and remote_md5 != md5.hexdigest():
+        raise DriveUploadError(f"checksum mismatch after upload: local {md5.hexdigest()}, drive {remote_md5}")
+
+    return {
+        "drive_file_id": resource["id"],
+        "drive_url": resource.get("webViewLink", ""),
+        "size_bytes": offset,
+        "md5": md5.hexdigest(),
+    }
@@ -15,15 +15,19 @@ class DriveSyncService:
     def __init__(self):
         self.dump_folder_id = settings.GOOGLE_DRIVE_DUMP_FOLDER_ID
         self.processed_folder_id = settings.GOOGLE_DRIVE_PROCESSED_FOLDER_ID
-        self.min_free_space_gb = 5  # keep at least 5GB free
     
-    def check_available_space(self, required_bytes: int) -> bool:
-        """check if there is enough disk space for the download + buffer"""
+    def check_available_space(self, required_bytes: int, snap: dict = None) -> bool:
+        """
+        check if the download can be queued now: it and its proxies fit next to
+        what queued work will write, and analysis isn't already behind
+        (snap: the poll's admission snapshot, taken once for all candidates)
+        """
+        from app.services.admission import admission
         try:
-            total, used, free = shutil.disk_usage(settings.DATA_DIR)
-            # require file size + 5GB buffer
-            # ensure we don't fill up the disk completely
-            return free > (required_bytes + (self.min_free_space_gb * 1024 * 1024 * 1024))
+            ok, reason = admission.can_download(required_bytes, snap)
+            if not ok:
+                print(f"[QUEUE] download held: {reason}")
+            return ok
         except Exception as e:
             print(f"error checking disk space: {e}")
             return False
@@ -69,11 +73,18 @@ class DriveSyncService:
         print(f"[QUEUE] Already have {len(known_ids)} videos in database")
         print(f"[QUEUE] Known IDs: {list(known_ids)[:5]}..." if known_ids else "[QUEUE] No known IDs")
         
-        # check space for each candidate
-        # we check current actual free space for the first one
-        # then theoretically subtract for subsequent ones in this batch
-        # but realistically, the worker picks up one job at a time, so 
-        # checking "can I fit THIS file right now" is sufficient.
+        # downloads already queued or running hold a unique marker and are in
+        # the snapshot's projected bytes already: checking them again would
+        # count them twice (and hold back everything behind them)
+        from app.services.admission import admission, DOWNLOAD_JOB
+        from app.services.queue import held_unique
+        try:
+            queued_ids = held_unique(DOWNLOAD_JOB, [v['id'] for v in candidates if v['id'] not in known_ids])
+            # one snapshot for the whole poll, every candidate is checked against it
+            snap = admission.snapshot(max_age=0)
+        except Exception as e:
+            print(f"[QUEUE] could not read the download backlog: {e}")
+            return []
         
         for video in candidates:
             vid_id = video['id']
@@ -82,18 +93,21 @@ class DriveSyncService:
             if vid_id in known_ids:
                 print(f"[QUEUE] Skipping {vid_name} - already in database (ID: {vid_id})")
                 continue
+            if vid_id in queued_ids:
+                print(f"[QUEUE] Skipping {vid_name} - download already queued")
+                continue
                 
             size_bytes = int(video.get('size', 0))
             print(f"[QUEUE] Checking space for {vid_name} ({size_bytes/(1024**3):.2f} GB)")
             
-            if self.check_available_space(size_bytes):
+            if self.check_available_space(size_bytes, snap):
                 downloadable.append(video)
                 print(f"[QUEUE] ✅ Adding {vid_name} to download queue")
                 # For now, let's just return the first one that fits to avoid over-queuing
                 # The periodic sync will pick up more as space clears.
                 return [video] 
             else:
-                print(f"[QUEUE] ❌ Not enough space for {vid_name} ({size_bytes/(1024**3):.2f} GB)")
+                print(f"[QUEUE] ❌ Not admitting {vid_name} ({size_bytes/(1024**3):.2f} GB) yet")
                 # if we can't fit the oldest file, we probably shouldn't skip it to download a newer huge one
                 # but maybe a smaller newer one? for now, let's just stop to preserve order priority.
                 break 
@@ -0,0 +1,386 @@
+from app.core.config import settings
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, List, Optional
+import ctypes
+import fcntl
+import os
+import select
+import shutil
+import signal
+import subprocess
+import threading
+import time
+
+# what a run mostly costs; encodes and decodes each get a per-host slot pool,
+# stream copies / remuxes are cheap and run unthrottled
+KIND_ENCODE = "encode"
+KIND_DECODE = "decode"
+KIND_COPY = "copy"
+
+_PR_SET_PDEATHSIG = 1
+
+try:
+    _libc = ctypes.CDLL("libc.so.6", use_errno=True)
+except OSError:
+    _libc = None
+
+
+def parse_progress_seconds(fields: dict) -> Optional[float]:
+    """output position from one `-progress` block (out_time_ms is microseconds too)"""
+    for key in ("out_time_us", "out_time_ms"):
+        value = fields.get(key)
+        if value and value != "N/A":
+            try:
+                return int(value) / 1_000_000
+            except ValueError:
+                pass
+
+    value = fields.get("out_time")  # HH:MM:SS.micro
+    if value and value != "N/A":
+        try:
+            h, m, s = value.split(":")
+            return int(h) * 3600 + int(m) * 60 + float(s)
+        except ValueError:
+            pass
+    return None
+
+
+def probe_duration(path: str) -> Optional[float]:
+    """container duration in seconds, None if unknown"""
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=30)
+        return float(result.stdout.strip())
+    except (subprocess.SubprocessError, ValueError):
+        return None
+
+
+def _output_duration(cmd: List[str]) -> Optional[float]:
+    """expected output length: an explicit -t, else the first input's duration"""
+    if "-t" in cmd:
+        try:
+            return float(cmd[cmd.index("-t") + 1])
+        except (IndexError, ValueError):
+            pass
+    if "-i" in cmd:
+        return probe_duration(cmd[cmd.index("-i") + 1])
+    return None
+
+
+def _current_job_lane() -> Optional[str]:
+    """queue the rq job running in this process came from (None outside a job)"""
+    try:
+        from rq import get_current_job
+        job = get_current_job()
+    except Exception:
+        return None
+    return job.origin if job is not None else None
+
+
+def _interactive_busy() -> bool:
+    try:
+        from app.services.queue import interactive_pressure
+        return interactive_pressure() > 0
+    except Exception as e:
+        # can't tell: keep encoding rather than pause blind
+        print(f"[FFMPEG] could not check the interactive lane: {e}")
+        return False
+
+
+class Preemption:
+    """
+    pauses a bulk ffmpeg (SIGSTOP) while interactive work is queued or running
+    and resumes it (SIGCONT) once that's done
+
+    a run is paused for at most max_pause seconds in total, after which it
+    keeps going whatever the pressure; paused time doesn't count against the
+    run's timeout
+    """
+
+    def __init__(self, pressure: Callable[[], bool], max_pause: float):
+        self.pressure = pressure
+        self.max_pause = max_pause
+        self.paused_at: Optional[float] = None
+        self.paused_total = 0.0
+
+    def paused_seconds(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        return self.paused_total + (now - self.paused_at if self.paused_at is not None else 0.0)
+
+    def update(self, proc, now: Optional[float] = None) -> bool:
+        """pause or resume proc for the current pressure; True while it is paused"""
+        now = time.monotonic() if now is None else now
+        if self.paused_at is None:
+            if self.paused_total < self.max_pause and self.pressure():
+                proc.send_signal(signal.SIGSTOP)
+                self.paused_at = now
+                print(f"[FFMPEG] pausing bulk ffmpeg {proc.pid}, interactive work waiting")
+            return self.paused_at is not None
+
+        if self.paused_seconds(now) >= self.max_pause or not self.pressure():
+            self.resume(proc, now)
+        return self.paused_at is not None
+
+    def resume(self, proc, now: Optional[float] = None):
+        if self.paused_at is None:
+            return
+        now = time.monotonic() if now is None else now
+        self.paused_total = self.paused_seconds(now)
+        self.paused_at = None
+        if proc.poll() is None:
+            proc.send_signal(signal.SIGCONT)
+        print(f"[FFMPEG] resuming ffmpeg {proc.pid} (paused {self.paused_total:.0f}s in total)")
+
+
+def job_progress(rq_job_id: str, start: int = 0, end: int = 100, min_interval: float = 2.0) -> Callable[[float], None]:
+    """
+    on_progress callback mapping a run's 0..1 onto [start, end] of an RQ job
+
+    throttled so a long encode isn't a redis write per progress block
+    (job_tracker batches the postgres side)
+    """
+    from app.services.job_tracker import update_job_progress
+
+    state = {"last_time": 0.0, "last_percent": None}
+
+    def report(fraction: float):
+        percent = int(start + (end - start) * min(max(fraction, 0.0), 1.0))
+        now = time.monotonic()
+        if percent == state["last_percent"] or now - state["last_time"] < min_interval:
+            return
+        state["last_time"], state["last_percent"] = now, percent
+        try:
+            update_job_progress(rq_job_id, percent)
+        except Exception as e:
+            print(f"[FFMPEG] could not record progress for {rq_job_id}: {e}")
+
+    return report
+
+
+class FFmpegRunner:
+    """
+    the one place ffmpeg gets launched from
+
+    - real progress: `-progress` is written to a private pipe and turned into
+      a 0..1 fraction for on_progress
+    - per-host concurrency: encodes/decodes take a slot from a pool of flock'd
+      files under DATA_DIR/locks, shared by every worker replica on the VM;
+      a crashed process releases its slot automatically
+    - runs under nice/ionice so the API and sorter UI stay responsive
+    - interactive-lane jobs get FFMPEG_INTERACTIVE_SLOTS of their own, and
+      bulk encodes/decodes are paused while the interactive lane has work
+      (PREEMPT_BULK_FFMPEG), so a sorter's render never waits on a backlog
+    - children die with their job: timeouts, RQ job timeouts and stops
+      (exceptions raised in the work horse) kill ffmpeg before re-raising,
+      and PR_SET_PDEATHSIG covers the horse being SIGKILLed
+    """
+
+    def __init__(self):
+        self.lock_dir = Path(settings.DATA_DIR) / "locks" / "ffmpeg"
+        self.limits = {
+            KIND_ENCODE: settings.FFMPEG_MAX_ENCODES,
+            KIND_DECODE: settings.FFMPEG_MAX_DECODES,
+        }
+
+    def _preexec(self):
+        try:
+            os.nice(settings.FFMPEG_NICE)
+        except OSError:
+            pass
+        if _libc is not None:
+            _libc.prctl(_PR_SET_PDEATHSIG, signal.SIGKILL)
+
+    def _wrap(self, cmd: List[str]) -> List[str]:
+        """prefix with ionice when available (best-effort class, low priority)"""
+        if settings.FFMPEG_IONICE_CLASS and shutil.which("ionice"):
+            return ["ionice", "-c", str(settings.FFMPEG_IONICE_CLASS), "-n", str(settings.FFMPEG_IONICE_LEVEL), *cmd]
+        return cmd
+
+    @contextmanager
+    def slot(self, kind: str, interactive: bool = False):
+        """hold one of this host's slots for `kind` (no-op for copies)"""
+        limit = self.limits.get(kind, 0)
+        if limit <= 0:
+            yield
+            return
+        if interactive and settings.FFMPEG_INTERACTIVE_SLOTS > 0:
+            # separate pool: a paused bulk encode keeps its slot
+            kind, limit = f"{kind}_interactive", settings.FFMPEG_INTERACTIVE_SLOTS
+
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+        waiting_since = None
+        while True:
+            for i in range(limit):
+                handle = open(self.lock_dir / f"{kind}_{i}.lock", "a")
+                try:
+                    fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    handle.close()
+                    continue
+
+                if waiting_since is not None:
+                    print(f"[FFMPEG] got {kind} slot {i} after {time.monotonic() - waiting_since:.1f}s")
+                try:
+                    yield
+                finally:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+                    handle.close()
+                return
+
+            if waiting_since is None:
+                waiting_since = time.monotonic()
+                print(f"[FFMPEG] all {limit} {kind} slots busy on this host, waiting...")
+            time.sleep(0.5)
+
+    def _kill(self, proc: subprocess.Popen):
+        if proc.poll() is not None:
+            return
+        # a paused (preempted) ffmpeg only acts on SIGTERM once continued
+        proc.send_signal(signal.SIGCONT)
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+    def popen(self, cmd: List[str], **kwargs) -> subprocess.Popen:
+        """
+        start ffmpeg for streaming use (caller reads stdout and must wait/kill)
+
+        gets nice/ionice and the parent-death signal but no slot: it's meant
+        for remuxes whose speed is set by whoever consumes the pipe
+        """
+        return subprocess.Popen(self._wrap(list(cmd)), preexec_fn=self._preexec, **kwargs)
+
+    def run(
+        self,
+        cmd: List[str],
+        kind: str = KIND_ENCODE,
+        duration_sec: Optional[float] = None,
+        on_progress: Optional[Callable[[float], None]] = None,
+        timeout: Optional[float] = None,
+        check: bool = True,
+        text: bool = True
+    ) -> subprocess.CompletedProcess:
+        """
+        run an ffmpeg command (cmd[0] == "ffmpeg") like subprocess.run(capture_output=True)
+
+        duration_sec is the expected output length used for percentages; it
+        is taken from -t or probed from the first input when not given
+
+        runs from interactive-lane jobs use their own slots; other encodes and
+        decodes can be paused while the interactive lane is busy
+        """
+        cmd = list(cmd)
+        if on_progress and duration_sec is None:
+            duration_sec = _output_duration(cmd)
+
+        from app.services.queue import LANES
+        lane = _current_job_lane()
+        interactive = lane in LANES["interactive"]
+        preemption = None
+        if settings.PREEMPT_BULK_FFMPEG and lane is not None and not interactive and self.limits.get(kind, 0) > 0:
+            preemption = Preemption(_interactive_busy, settings.PREEMPT_MAX_PAUSE_SECONDS)
+
+        read_fd, write_fd = os.pipe()
+        full_cmd = self._wrap([cmd[0], "-nostats", "-progress", f"pipe:{write_fd}", *cmd[1:]])
+
+        with self.slot(kind, interactive=interactive):
+            try:
+                proc = subprocess.Popen(
+                    full_cmd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    pass_fds=(write_fd,),
+                    preexec_fn=self._preexec
+                )
+            except BaseException:
+                os.close(read_fd)
+                raise
+            finally:
+                os.close(write_fd)
+
+            # drain stdout/stderr on threads so a chatty ffmpeg never blocks on a full pipe
+            captured = {"stdout": b"", "stderr": b""}
+
+            def drain(name, pipe):
+                captured[name] = pipe.read()
+
+            drains = [
+                threading.Thread(target=drain, args=("stdout", proc.stdout), daemon=True),
+                threading.Thread(target=drain, args=("stderr", proc.stderr), daemon=True),
+            ]
+            for t in drains:
+                t.start()
+
+            try:
+                self._follow_progress(proc, read_fd, duration_sec, on_progress, timeout, full_cmd, preemption)
+                if preemption:
+                    preemption.resume(proc)
+                proc.wait(timeout=timeout)
+            except BaseException:
+                # timeout, or the RQ job being stopped/timed out
+                self._kill(proc)
+                raise
+            finally:
+                os.close(read_fd)
+                for t in drains:
+                    t.join()
+
+        stdout, stderr = captured["stdout"], captured["stderr"]
+        if text:
+            stdout = stdout.decode(errors="replace")
+            stderr = stderr.decode(errors="replace")
+
+        if check and proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, full_cmd, output=stdout, stderr=stderr)
+        if on_progress and proc.returncode == 0:
+            on_progress(1.0)
+        return subprocess.CompletedProcess(full_cmd, proc.returncode, stdout, stderr)
+
+    def _follow_progress(self, proc, read_fd, duration_sec, on_progress, timeout, full_cmd, preemption=None):
+        """read `-progress` key=value blocks until ffmpeg closes the pipe"""
+        deadline = time.monotonic() + timeout if timeout else None
+        buf = b""
+        fields = {}
+
+        while True:
+            wait = 1.0
+            if preemption is not None:
+                preemption.update(proc)
+            if deadline is not None:
+                paused = preemption.paused_seconds() if preemption is not None else 0.0
+                remaining = deadline + paused - time.monotonic()
+                if remaining <= 0:
+                    raise subprocess.TimeoutExpired(full_cmd, timeout)
+                wait = min(wait, remaining)
+
+            ready, _, _ = select.select([read_fd], [], [], wait)
+            if not ready:
+                if proc.poll() is not None:
+                    return
+                continue
+
+            data = os.read(read_fd, 4096)
+            if not data:
+                return  # ffmpeg exited (or closed progress output)
+
+            buf += data
+            *lines, buf = buf.split(b"\n")
+            for line in lines:
+                key, _, value = line.decode(errors="replace").strip().partition("=")
+                if key != "progress":
+                    fields[key] = value
+                    continue
+
+                # "progress=continue|end" closes a block
+                position = parse_progress_seconds(fields)
+                if on_progress and duration_sec and position is not None:
+                    on_progress(min(position / duration_sec, 1.0))
+                fields = {}
+
+
+# singleton instance
+ffmpeg_runner = FFmpegRunner()
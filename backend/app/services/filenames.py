@@ -1,4 +1,5 @@
 import re
+from typing import Dict, List
 
 
 def slugify(text: str) -> str:
@@ -8,14 +9,55 @@ def slugify(text: str) -> str:
     return text[:50]  # limit length
 
 
-def generate_filename(date, session, person_slug, trick_name, cam_id, fps_label, resolution_label, aspect_ratio, existing_versions: list[int]) -> str:
+def filename_base(date, session, person_slug, trick_name, cam_id, fps_label, resolution_label, aspect_ratio) -> str:
+    """everything in a clip filename but the version: clips sharing it are versions of each other"""
+    # sanitize aspect ratio for filename (replace : with x)
+    ar_safe = aspect_ratio.replace(':', 'x')
+    return f"{date}__{session}__{person_slug}__{trick_name}__{cam_id}__{resolution_label}__{ar_safe}__{fps_label}"
+
+
+def parse_version(filename: str):
+    """the ### of a __v###.mp4 filename, or None"""
+    match = re.search(r'__v(\d+)\.mp4$', filename)
+    return int(match.group(1)) if match else None
+
+
+def allocate_versions(session, counts: Dict[str, int]) -> Dict[str, List[int]]:
+    """
+    reserve the next `count` versions of each filename base
+
+    one INSERT ... ON CONFLICT DO UPDATE ... RETURNING bumps every base's
+    counter, so it's constant time however many clips a base has, and the row
+    lock it takes makes a concurrent save of the same base wait for this
+    transaction instead of getting the same v###. runs in the caller's
+    transaction: a rollback hands the versions back
+    """
+    if not counts:
+        return {}
+    from app.core.db import dialect_insert
+    from app.models import FilenameVersion
+
+    insert = dialect_insert(session)
+    table = FilenameVersion.__table__
+    # sorted, so two batches touching the same bases lock them in the same order
+    stmt = insert(table).values([{"base": base, "last_version": counts[base]} for base in sorted(counts)])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.base],
+        set_={"last_version": table.c.last_version + stmt.excluded.last_version},
+    ).returning(table.c.base, table.c.last_version)
+
+    return {
+        base: list(range(last - counts[base] + 1, last + 1))
+        for base, last in session.execute(stmt).all()
+    }
+
+
+def generate_filename(date, session, person_slug, trick_name, cam_id, fps_label, resolution_label, aspect_ratio, version: int) -> str:
     """
     generates a filename: YYYY-MM-DD__Session__Person__Trick__CAMID__RES__AR__FPS__v###.mp4
     example: 2025-12-02__Session1__john__kickflip__CAM1__1080p__9:16__60FPS__v001.mp4
-    """
-    # sanitize aspect ratio for filename (replace : with x)
-    ar_safe = aspect_ratio.replace(':', 'x')
-    base = f"{date}__{session}__{person_slug}__{trick_name}__{cam_id}__{resolution_label}__{ar_safe}__{fps_label}"
-    v = max(existing_versions) + 1 if existing_versions else 1
-    return f"{base}__v{v:03d}.mp4"
 
+    version comes from allocate_versions
+    """
+    base = filename_base(date, session, person_slug, trick_name, cam_id, fps_label, resolution_label, aspect_ratio)
+    return f"{base}__v{version:03d}.mp4"
@@ -1,9 +1,33 @@
-from sqlmodel import Session
+from sqlmodel import Session, select
 from app.core.db import engine
-from app.models import Job
+from app.core.config import settings
+from app.models import Job, OriginalFile
 from datetime import datetime
 from uuid import UUID
-from typing import Optional
+from typing import Dict, List, Optional
+import threading
+import time
+
+# job state changes land in a redis hash per job and a dirty set; a flusher
+# writes the changed rows to postgres in batches. only the initial row is
+# written directly, so the jobs list has something to show right away
+JOB_STATE_KEY = "jobs:state:{}"
+FILE_PROGRESS_KEY = "files:progress:{}"
+DIRTY_JOBS_KEY = "jobs:dirty"
+DIRTY_FILES_KEY = "files:dirty"
+
+STATE_TTL_SECONDS = 24 * 3600
+FLUSH_BATCH_SIZE = 500
+
+# a state change for a job whose row isn't committed yet (enqueue and the
+# first start_job can race) is retried for this long before it's dropped
+MISSING_ROW_GRACE_SECONDS = 300
+
+
+def _redis():
+    from app.services.queue import redis_conn
+    return redis_conn
+
 
 def create_job_record(rq_job_id: str, job_type: str, file_id: Optional[UUID] = None, clip_id: Optional[UUID] = None) -> UUID:
     """create a job record in the database when a job is queued"""
@@ -20,50 +44,174 @@ def create_job_record(rq_job_id: str, job_type: str, file_id: Optional[UUID] = N
         session.refresh(job)
         return job.id
 
+
+def _record(rq_job_id: str, **fields):
+    now = datetime.utcnow().isoformat()
+    key = JOB_STATE_KEY.format(rq_job_id)
+    pipe = _redis().pipeline(transaction=False)
+    pipe.hset(key, mapping={**{k: str(v) for k, v in fields.items()}, "updated_at": now})
+    pipe.expire(key, STATE_TTL_SECONDS)
+    pipe.sadd(DIRTY_JOBS_KEY, rq_job_id)
+    pipe.execute()
+
+
 def start_job(rq_job_id: str):
     """mark a job as started"""
-    with Session(engine) as session:
-        job = session.query(Job).filter(Job.rq_job_id == rq_job_id).first()
-        if job:
-            job.status = "running"
-            job.started_at = datetime.utcnow()
-            job.updated_at = datetime.utcnow()
-            session.add(job)
-            session.commit()
+    _record(rq_job_id, status="running", started_at=datetime.utcnow().isoformat())
+
 
 def update_job_progress(rq_job_id: str, progress_percent: int):
     """update job progress"""
-    with Session(engine) as session:
-        job = session.query(Job).filter(Job.rq_job_id == rq_job_id).first()
-        if job:
-            job.progress_percent = progress_percent
-            job.updated_at = datetime.utcnow()
-            session.add(job)
-            session.commit()
+    _record(rq_job_id, progress_percent=int(progress_percent))
+
 
 def complete_job(rq_job_id: str):
     """mark a job as completed"""
-    with Session(engine) as session:
-        job = session.query(Job).filter(Job.rq_job_id == rq_job_id).first()
-        if job:
-            job.status = "completed"
-            job.finished_at = datetime.utcnow()
-            job.progress_percent = 100
-            job.updated_at = datetime.utcnow()
-            session.add(job)
-            session.commit()
+    _record(rq_job_id, status="completed", progress_percent=100, finished_at=datetime.utcnow().isoformat())
+
 
 def fail_job(rq_job_id: str, error_message: str):
     """mark a job as failed"""
-    with Session(engine) as session:
-        job = session.query(Job).filter(Job.rq_job_id == rq_job_id).first()
-        if job:
-            job.status = "failed"
-            job.finished_at = datetime.utcnow()
-            job.error_message = error_message
-            job.updated_at = datetime.utcnow()
-            session.add(job)
+    _record(rq_job_id, status="failed", error_message=error_message[:2000], finished_at=datetime.utcnow().isoformat())
+
+
+def retry_job(rq_job_id: str, error_message: str):
+    """a failed attempt rq will retry (after its backoff): back to queued, keeping the error"""
+    _record(rq_job_id, status="queued", progress_percent=0, error_message=error_message[:2000])
+
+
+def requeue_job(rq_job_id: str):
+    """a dead-lettered job replayed from the api"""
+    _record(rq_job_id, status="queued", progress_percent=0, error_message="", finished_at="")
+
+
+def cancel_job(rq_job_id: str):
+    """mark a job as cancelled (from the api, see queue.cancel_rq_job)"""
+    _record(rq_job_id, status="cancelled", finished_at=datetime.utcnow().isoformat())
+
+
+def set_file_progress(file_id, progress_percent: int):
+    """analysis progress of an original, flushed with the job states"""
+    key = FILE_PROGRESS_KEY.format(file_id)
+    pipe = _redis().pipeline(transaction=False)
+    pipe.set(key, int(progress_percent), ex=STATE_TTL_SECONDS)
+    pipe.sadd(DIRTY_FILES_KEY, str(file_id))
+    pipe.execute()
+
+
+def _decode(raw: dict) -> dict:
+    return {k.decode(): v.decode() for k, v in raw.items()}
+
+
+def get_job_states(rq_job_ids: List[str]) -> Dict[str, dict]:
+    """live (not yet flushed) state for some jobs, in one round trip"""
+    if not rq_job_ids:
+        return {}
+    pipe = _redis().pipeline(transaction=False)
+    for rq_job_id in rq_job_ids:
+        pipe.hgetall(JOB_STATE_KEY.format(rq_job_id))
+    return {rq_job_id: _decode(raw) for rq_job_id, raw in zip(rq_job_ids, pipe.execute()) if raw}
+
+
+def apply_job_state(job: Job, state: dict):
+    """copy a redis state onto a Job row (not committed)"""
+    if "status" in state:
+        job.status = state["status"]
+    if "progress_percent" in state:
+        job.progress_percent = int(state["progress_percent"])
+    if "error_message" in state:
+        job.error_message = state["error_message"]
+    for field in ("started_at", "finished_at", "updated_at"):
+        if field in state:
+            # "" clears it (a replayed job isn't finished any more)
+            setattr(job, field, datetime.fromisoformat(state[field]) if state[field] else None)
+
+
+def _flush_jobs(redis) -> int:
+    """one batch of dirty jobs; returns how many ids were taken off the set"""
+    rq_job_ids = [i.decode() for i in redis.spop(DIRTY_JOBS_KEY, FLUSH_BATCH_SIZE) or []]
+    if not rq_job_ids:
+        return 0
+
+    states = get_job_states(rq_job_ids)
+    retry = []
+    try:
+        with Session(engine) as session:
+            rows = session.exec(select(Job).where(Job.rq_job_id.in_(list(states)))).all()
+            found = {row.rq_job_id: row for row in rows}
+            for rq_job_id, state in states.items():
+                row = found.get(rq_job_id)
+                if row is None:
+                    age = (datetime.utcnow() - datetime.fromisoformat(state["updated_at"])).total_seconds()
+                    if age < MISSING_ROW_GRACE_SECONDS:
+                        retry.append(rq_job_id)
+                    continue
+                apply_job_state(row, state)
+                session.add(row)
+            session.commit()
+    except Exception:
+        # keep them dirty for the next pass
+        redis.sadd(DIRTY_JOBS_KEY, *rq_job_ids)
+        raise
+
+    if retry:
+        redis.sadd(DIRTY_JOBS_KEY, *retry)
+    return len(rq_job_ids)
+
+
+def _flush_files(redis) -> int:
+    file_ids = [i.decode() for i in redis.spop(DIRTY_FILES_KEY, FLUSH_BATCH_SIZE) or []]
+    if not file_ids:
+        return 0
+
+    values = redis.mget([FILE_PROGRESS_KEY.format(f) for f in file_ids])
+    progress = {UUID(f): int(v) for f, v in zip(file_ids, values) if v is not None}
+    try:
+        with Session(engine) as session:
+            for file in session.exec(select(OriginalFile).where(OriginalFile.id.in_(list(progress)))).all():
+                file.analysis_progress_percent = progress[file.id]
+                session.add(file)
             session.commit()
+    except Exception:
+        redis.sadd(DIRTY_FILES_KEY, *file_ids)
+        raise
+    return len(file_ids)
+
+
+def flush_job_states(max_batches: int = 20) -> int:
+    """write changed job/file states to postgres; returns how many were processed"""
+    redis = _redis()
+    processed = 0
+    for _ in range(max_batches):
+        jobs, files = _flush_jobs(redis), _flush_files(redis)
+        processed += jobs + files
+        if jobs < FLUSH_BATCH_SIZE and files < FLUSH_BATCH_SIZE:
+            break
+    return processed
+
+
+def _flush_loop(interval: float):
+    while True:
+        time.sleep(interval)
+        try:
+            flush_job_states()
+        except Exception as e:
+            print(f"[JOBS] state flush failed: {e}")
+
 
+_flusher = None
 
 
+def start_flusher(interval: Optional[float] = None):
+    """run flush_job_states every JOB_STATE_FLUSH_SECONDS on a daemon thread (once per process)"""
+    global _flusher
+    if _flusher is not None:
+        return _flusher
+    _flusher = threading.Thread(
+        target=_flush_loop,
+        args=(interval or settings.JOB_STATE_FLUSH_SECONDS,),
+        name="job-state-flusher",
+        daemon=True
+    )
+    _flusher.start()
+    return _flusher
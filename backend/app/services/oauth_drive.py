@@ -148,6 +148,49 @@ class DriveOAuthService:
             'drive_url': file.get('webViewLink', '')
         }
 
+    def copy_file(self, file_id: str, folder_id: str, filename: str, session: Session) -> dict:
+        """Server-side copy of a drive file into a folder under a new name"""
+        credentials = self.get_valid_credentials(session)
+        service = build('drive', 'v3', credentials=credentials)
+        
+        print(f"[OAuth Copy] Copying {file_id} to folder {folder_id} as {filename}")
+        file = service.files().copy(
+            fileId=file_id,
+            body={'name': filename, 'parents': [folder_id]},
+            fields='id, webViewLink'
+        ).execute()
+        
+        print(f"[OAuth Copy] ✅ Success! File ID: {file['id']}")
+        
+        return {
+            'drive_file_id': file['id'],
+            'drive_url': file.get('webViewLink', '')
+        }
+    
+    def upload_stream(self, stream, folder_id: str, filename: str, session: Session,
+                      on_progress=None, before_last_chunk=None) -> dict:
+        """Upload a pipe (e.g. ffmpeg stdout) with a chunked resumable session"""
+        from app.services.drive_stream import upload_stream
+        
+        credentials = self.get_valid_credentials(session)
+        
+        import mimetypes
+        mime_type = mimetypes.guess_type(filename)[0] or 'video/mp4'
+        
+        print(f"[OAuth Upload] Streaming {filename} to folder {folder_id} (type: {mime_type})")
+        result = upload_stream(
+            stream,
+            access_token=credentials.token,
+            metadata={'name': filename, 'parents': [folder_id]},
+            chunk_size=settings.DRIVE_UPLOAD_CHUNK_MB * 1024 * 1024,
+            mime_type=mime_type,
+            on_progress=on_progress,
+            before_last_chunk=before_last_chunk
+        )
+        
+        print(f"[OAuth Upload] ✅ Success! File ID: {result['drive_file_id']} ({result['size_bytes']} bytes, md5 {result['md5']})")
+        return result
+
 # Singleton
 oauth_drive_service = DriveOAuthService()
 
@@ -0,0 +1,193 @@
+from app.core.config import settings
+from app.services.queue import redis_conn, enqueue_job, move_to_queue
+from app.video.proxy_utils import generate_playback_proxy, is_playback_proxy_ready, get_playback_proxy_path
+from redis.exceptions import LockError
+from typing import Optional
+from uuid import UUID
+import time
+
+class ProxyCoordinator:
+    """
+    single-flight coordination of playback proxy builds
+
+    request side: a SET NX marker per file means only the first caller
+    enqueues a build job, every other caller just reads that job's status.
+    build side: a redis lock per file means only one ffmpeg ever writes a
+    given proxy, even when the analysis job and an on-demand job overlap.
+    """
+
+    STATUS_TTL_SECONDS = 24 * 3600
+
+    def __init__(self, redis=None):
+        self.redis = redis or redis_conn
+
+    def _pending_key(self, file_id) -> str:
+        return f"proxy:pending:{file_id}"
+
+    def _status_key(self, file_id) -> str:
+        return f"proxy:status:{file_id}"
+
+    def _lock_name(self, file_id) -> str:
+        return f"proxy:build:{file_id}"
+
+    def _set_status(self, file_id, **fields):
+        key = self._status_key(file_id)
+        self.redis.hset(key, mapping={k: str(v) for k, v in fields.items()})
+        self.redis.expire(key, self.STATUS_TTL_SECONDS)
+
+    def set_progress(self, file_id, progress_percent: int):
+        """record build progress so waiting requests can report it"""
+        self._set_status(file_id, state="generating", progress=int(progress_percent))
+
+    def abandon(self, file_id, reason: str):
+        """a queued build that can't run (file gone): fail it and let a later request enqueue again"""
+        self._set_status(file_id, state="failed", error=reason[:500])
+        self.redis.delete(self._pending_key(file_id))
+
+    def get_status(self, file_id, stored_path: str) -> dict:
+        """current proxy state: ready, queued, generating, failed or missing"""
+        if is_playback_proxy_ready(stored_path):
+            return {"status": "ready", "progress_percent": 100}
+
+        raw = self.redis.hgetall(self._status_key(file_id))
+        if not raw:
+            return {"status": "missing", "progress_percent": 0}
+
+        fields = {k.decode(): v.decode() for k, v in raw.items()}
+        return {
+            "status": fields.get("state", "missing"),
+            "progress_percent": int(fields.get("progress", 0)),
+            "job_id": fields.get("job_id"),
+            "error": fields.get("error"),
+        }
+
+    def request_proxy(self, file_id: UUID, stored_path: str, interactive: bool = False) -> dict:
+        """
+        make sure exactly one build is queued or running for this file
+
+        interactive=True when someone is waiting on it (/media): the build
+        goes to the interactive lane, and a background build still sitting
+        in the bulk queue is moved there. everything else (scheduler,
+        prefetch, admin) builds on the playback_proxy queue, so hour-long
+        encodes never hold up clip saves
+
+        returns the current status; never runs ffmpeg in the caller
+        """
+        if is_playback_proxy_ready(stored_path):
+            return {"status": "ready", "progress_percent": 100}
+
+        # only the first caller wins the marker and enqueues the build
+        pending_key = self._pending_key(file_id)
+        if self.redis.set(pending_key, "1", nx=True, ex=settings.PROXY_LOCK_TTL_SECONDS):
+            from app.worker import generate_proxy_for_file
+
+            self.redis.delete(self._status_key(file_id))
+            self._set_status(file_id, state="queued", progress=0)
+            try:
+                job = enqueue_job(
+                    generate_proxy_for_file, str(file_id), file_id=file_id, timeout='1h',
+                    queue_name="interactive" if interactive else None
+                )
+            except Exception:
+                self.redis.delete(pending_key)
+                raise
+            self.redis.set(pending_key, job.id, xx=True, keepttl=True)
+            self._set_status(file_id, job_id=job.id)
+            print(f"[PROXY] queued {'interactive' if interactive else 'background'} playback proxy build for {file_id} (job {job.id})")
+        elif interactive:
+            self._promote(file_id)
+
+        return self.get_status(file_id, stored_path)
+
+    def _promote(self, file_id):
+        """someone is waiting on a build queued in the background: move it to the interactive lane"""
+        raw = self.redis.get(self._pending_key(file_id))
+        job_id = raw.decode() if isinstance(raw, bytes) else raw
+        if not job_id or job_id == "1":
+            return  # nothing queued, or the winner is still enqueueing
+        try:
+            if move_to_queue(job_id, "interactive"):
+                print(f"[PROXY] moved playback proxy build for {file_id} to the interactive lane (job {job_id})")
+        except Exception as e:
+            print(f"[PROXY] could not promote build {job_id} for {file_id}: {e}")
+
+    def wait_until_ready(self, file_id, stored_path: str, timeout_sec: float, poll_sec: float = 0.5) -> dict:
+        """block until the shared build finishes or fails, or the timeout passes"""
+        deadline = time.monotonic() + timeout_sec
+        status = self.get_status(file_id, stored_path)
+        while status["status"] not in ("ready", "failed") and time.monotonic() < deadline:
+            time.sleep(poll_sec)
+            status = self.get_status(file_id, stored_path)
+        return status
+
+    def _media_info(self, file_id, stored_path: str) -> Optional[dict]:
+        try:
+            from app.video.media_info import get_media_info
+            return get_media_info(file_id, stored_path)
+        except Exception as e:
+            print(f"[PROXY] no media info for {file_id}, proxy will probe: {e}")
+            return None
+
+    def _record_build_time(self, media_info: Optional[dict], max_height: int, seconds: float):
+        """re-encodes feed the cost model; remuxes say nothing about encode speed"""
+        if not media_info:
+            return
+        try:
+            from app.services.cost_model import cost_model
+            from app.video.proxy_utils import plan_playback_proxy
+            if not plan_playback_proxy(media_info, max_height)[0]:
+                cost_model.record("proxy", media_info, seconds)
+        except Exception as e:
+            print(f"[PROXY] could not record build time: {e}")
+
+    def build(self, file_id, stored_path: str, max_height: int = 1080, on_progress=None) -> Optional[str]:
+        """
+        build the playback proxy while holding the per-file lock
+
+        a second caller blocks on the lock and then finds the proxy ready,
+        so it shares the first build's result instead of running ffmpeg
+        """
+        lock = self.redis.lock(
+            self._lock_name(file_id),
+            timeout=settings.PROXY_LOCK_TTL_SECONDS,
+            blocking_timeout=settings.PROXY_LOCK_TTL_SECONDS
+        )
+        if not lock.acquire():
+            raise TimeoutError(f"timed out waiting for proxy build lock on {file_id}")
+
+        try:
+            if is_playback_proxy_ready(stored_path):
+                self._set_status(file_id, state="ready", progress=100)
+                return str(get_playback_proxy_path(stored_path))
+
+            self.set_progress(file_id, 0)
+
+            def report(fraction: float):
+                self.set_progress(file_id, int(fraction * 100))
+                if on_progress:
+                    on_progress(fraction)
+
+            media_info = self._media_info(file_id, stored_path)
+            started = time.monotonic()
+            proxy_path = generate_playback_proxy(
+                stored_path, max_height=max_height, on_progress=report,
+                media_info=media_info
+            )
+            self._set_status(file_id, state="ready", progress=100)
+            self._record_build_time(media_info, max_height, time.monotonic() - started)
+            return proxy_path
+        except BaseException as e:
+            # includes JobCancelled / rq timeouts, or the status would stay "generating"
+            self._set_status(file_id, state="failed", error=(str(e) or type(e).__name__)[:500])
+            raise
+        finally:
+            # clear the marker so a later request (e.g. after a failure) can enqueue again
+            self.redis.delete(self._pending_key(file_id))
+            try:
+                lock.release()
+            except LockError:
+                print(f"[PROXY] build lock for {file_id} expired before release")
+
+
+# singleton instance
+proxy_coordinator = ProxyCoordinator()
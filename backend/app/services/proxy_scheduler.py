@@ -0,0 +1,125 @@
+from sqlmodel import Session, select, func
+from app.core.db import engine
+from app.core.config import settings
+from app.models import OriginalFile, CandidateSegment
+from app.services.proxy_coordinator import proxy_coordinator
+from app.services.queue import redis_conn
+from app.video.proxy_utils import get_playback_proxy_path
+from typing import List, Optional
+from uuid import UUID
+import os
+
+class ProxyScheduler:
+    """
+    keeps playback proxies ready just ahead of the sorter
+
+    /api/sort/next serves the highest-confidence unreviewed segment first, so
+    videos come up in order of their best unreviewed confidence (ties broken
+    by how many unreviewed segments they have). proxies are built for the next
+    N videos in that order and removed once a video is fully reviewed.
+    """
+
+    THROTTLE_KEY = "proxy:schedule:throttle"
+
+    def __init__(self, lookahead: Optional[int] = None):
+        self.lookahead = lookahead or settings.PROXY_LOOKAHEAD_VIDEOS
+
+    def get_upcoming_files(self, session: Session, limit: int) -> List[UUID]:
+        """file ids in the order the sort queue will serve them"""
+        best_confidence = func.max(CandidateSegment.confidence_score)
+        unreviewed_count = func.count(CandidateSegment.id)
+
+        rows = session.exec(
+            select(CandidateSegment.original_file_id, best_confidence, unreviewed_count)
+            .where(CandidateSegment.status == "UNREVIEWED")
+            .group_by(CandidateSegment.original_file_id)
+            .order_by(best_confidence.desc(), unreviewed_count.desc())
+            .limit(limit)
+        ).all()
+
+        return [row[0] for row in rows]
+
+    def get_reviewed_files(self, session: Session) -> List[OriginalFile]:
+        """analyzed files with nothing left to review"""
+        has_unreviewed = (
+            select(CandidateSegment.id)
+            .where(CandidateSegment.original_file_id == OriginalFile.id)
+            .where(CandidateSegment.status == "UNREVIEWED")
+            .exists()
+        )
+
+        return session.exec(
+            select(OriginalFile)
+            .where(OriginalFile.processing_status.in_(["completed", "archived"]))
+            .where(~has_unreviewed)
+        ).all()
+
+    def schedule(self, lookahead: Optional[int] = None) -> dict:
+        """queue proxy builds for the next videos and drop proxies nobody will watch"""
+        lookahead = lookahead or self.lookahead
+        summary = {"upcoming": [], "queued": 0, "ready": 0, "evicted": 0, "bytes_freed": 0}
+
+        with Session(engine) as session:
+            for file_id in self.get_upcoming_files(session, lookahead):
+                file = session.get(OriginalFile, file_id)
+                if not file or not os.path.exists(file.stored_path):
+                    continue
+
+                # single-flight: no-op if a build is already pending for this file
+                status = proxy_coordinator.request_proxy(file.id, file.stored_path)
+                summary["upcoming"].append({"file_id": str(file.id), "proxy_status": status["status"]})
+                if status["status"] == "ready":
+                    summary["ready"] += 1
+                else:
+                    summary["queued"] += 1
+
+            evicted, bytes_freed = self.evict_reviewed(session)
+            summary["evicted"] = evicted
+            summary["bytes_freed"] = bytes_freed
+
+        print(f"[PROXY SCHEDULER] {summary['ready']} ready, {summary['queued']} pending, "
+              f"{summary['evicted']} evicted ({summary['bytes_freed'] / (1024**2):.1f} MB)")
+        return summary
+
+    def maybe_schedule(self) -> Optional[dict]:
+        """run a scheduling pass unless one ran within PROXY_SCHEDULE_INTERVAL_SECONDS"""
+        try:
+            if not redis_conn.set(self.THROTTLE_KEY, "1", nx=True, ex=settings.PROXY_SCHEDULE_INTERVAL_SECONDS):
+                return None
+            return self.schedule()
+        except Exception as e:
+            # scheduling is an optimisation, never fail the caller over it
+            print(f"[PROXY SCHEDULER] pass failed: {e}")
+            return None
+
+    def evict_reviewed(self, session: Session) -> tuple:
+        """
+        delete playback proxies of fully reviewed videos
+        returns: (files_deleted, bytes_freed)
+        """
+        files_deleted = 0
+        bytes_freed = 0
+
+        for file in self.get_reviewed_files(session):
+            proxy_path = get_playback_proxy_path(file.stored_path)
+            if not proxy_path.exists():
+                continue
+
+            # never pull a proxy out from under a build that is writing it
+            if proxy_coordinator.get_status(file.id, file.stored_path)["status"] in ("queued", "generating"):
+                continue
+
+            try:
+                size = proxy_path.stat().st_size
+                proxy_path.unlink()
+                files_deleted += 1
+                bytes_freed += size
+                print(f"evicted reviewed playback proxy: {proxy_path}")
+            except Exception as e:
+                print(f"error deleting {proxy_path}: {e}")
+
+        return files_deleted, bytes_freed
+
+
+# singleton instance
+proxy_scheduler = ProxyScheduler()
@@ -1,21 +1,174 @@
 from redis import Redis
-from rq import Queue
+from rq import Queue, Callback, Retry
 from app.core.config import settings
 from app.services.job_tracker import create_job_record
-from typing import Optional
-from uuid import UUID
+from datetime import timedelta
+from typing import Dict, Iterable, Optional, Set
+from uuid import UUID, uuid4
+import random
 
 redis_conn = Redis.from_url(settings.REDIS_URL)
-queue = Queue(connection=redis_conn)
 
-def enqueue_job(func, *args, file_id: Optional[UUID] = None, clip_id: Optional[UUID] = None, timeout=None, **kwargs):
-    """enqueue a job and track it in the database"""
+# queues are grouped into lanes. a worker serves one or more lanes (WORKER_LANES)
+# and always drains them in LANE_ORDER, so a sorter's save never waits behind
+# a backlog of analysis or downloads. within a lane the listed order is the
+# drain order: later analysis stages first, so files in flight finish before
+# new ones start
+LANES = {
+    "interactive": ["interactive"],
+    "analysis": [
+        "archive",
+        "persist",
+        "ml",
+        "candidates",
+        "motion",
+        "audio",
+        "analysis_proxy",
+        "playback_proxy",
+        "probe",
+    ],
+    "ingest": ["ingest", "download"],
+    "maintenance": ["maintenance", "default"],
+}
+LANE_ORDER = ["interactive", "analysis", "ingest", "maintenance"]
+QUEUE_NAMES = [name for lane in LANE_ORDER for name in LANES[lane]]
+
+# job type (function name) -> queue, for callers that don't pick one;
+# anything unlisted goes to "default"
+JOB_QUEUES = {
+    "render_and_upload_clip": "interactive",
+    "render_clip_batch": "interactive",
+    # background builds (scheduler, prefetch, admin); a build someone is
+    # waiting on goes to "interactive" (proxy_coordinator.request_proxy)
+    "generate_proxy_for_file": "playback_proxy",
+    "download_and_process_from_drive": "download",
+    "analyze_original_file": "ingest",
+    "generate_thumbnails_for_file": "maintenance",
+    "generate_thumbnail_for_clip": "maintenance",
+}
+
+# job type -> (retries, seconds before the first one); each further wait
+# doubles (capped at RETRY_MAX_BACKOFF_SECONDS). only transient errors are
+# retried (core/errors.is_transient), the rest go straight to the dead letter
+# queue. analysis stages use ANALYSIS_STAGE_RETRIES
+RETRY_POLICIES = {
+    "download_and_process_from_drive": (5, 60),
+    "render_clip_batch": (4, 30),
+    "render_and_upload_clip": (4, 30),
+    "generate_proxy_for_file": (2, 10),
+    "analyze_original_file": (3, 10),
+    "generate_thumbnails_for_file": (3, 60),
+    "generate_thumbnail_for_clip": (3, 60),
+}
+ANALYSIS_STAGE_FIRST_RETRY_SECONDS = 30
+
+queues = {name: Queue(name, connection=redis_conn) for name in QUEUE_NAMES}
+queue = queues["default"]
+
+
+def get_queue(name: Optional[str] = None) -> Queue:
+    """queue by name (default queue when None)"""
+    if name is None:
+        return queue
+    if name not in queues:
+        raise ValueError(f"unknown queue: {name}")
+    return queues[name]
+
+
+def queue_for_job(func) -> Queue:
+    return get_queue(JOB_QUEUES.get(func.__name__, "default"))
+
+
+def move_to_queue(rq_job_id: str, queue_name: str) -> bool:
+    """
+    move a job that's still waiting in its queue to another one (e.g. a
+    background build someone is now waiting on). the job keeps its id, so
+    its job record and anything holding the id stay valid
+
+    returns False if it already started, finished or isn't queued
+    """
+    from rq.job import Job, JobStatus
+    from rq.exceptions import NoSuchJobError
+
+    target = get_queue(queue_name)
+    try:
+        rq_job = Job.fetch(rq_job_id, connection=redis_conn)
+    except NoSuchJobError:
+        return False
+    if rq_job.origin == target.name or rq_job.get_status() != JobStatus.QUEUED:
+        return False
+    # LREM is the claim: 0 means a worker dequeued it in the meantime
+    if not get_queue(rq_job.origin).remove(rq_job):
+        return False
+    target.enqueue_job(rq_job)
+    return True
+
+
+def worker_queues() -> list:
+    """
+    queues this worker process listens on, in priority order
+
+    WORKER_QUEUES (explicit queue names) wins over WORKER_LANES; lanes are
+    always served in LANE_ORDER whatever order they're configured in
+    """
+    names = [n.strip() for n in settings.WORKER_QUEUES.split(",") if n.strip()]
+    if names:
+        return [get_queue(name) for name in names]
+
+    lanes = {n.strip() for n in settings.WORKER_LANES.split(",") if n.strip()} or set(LANE_ORDER)
+    unknown = lanes - set(LANE_ORDER)
+    if unknown:
+        raise ValueError(f"unknown worker lanes: {', '.join(sorted(unknown))}")
+    return [get_queue(name) for lane in LANE_ORDER if lane in lanes for name in LANES[lane]]
+
+
+def backoff_intervals(retries: int, first: float) -> list:
+    """exponential waits before each retry, +-20% jitter so a drive outage doesn't retry in lockstep"""
+    return [
+        int(min(first * 2 ** i, settings.RETRY_MAX_BACKOFF_SECONDS) * random.uniform(0.8, 1.2))
+        for i in range(retries)
+    ]
+
+
+def retry_for(job_type: str) -> Optional[Retry]:
+    """rq retry policy for a job type (None = never retried)"""
+    if job_type.startswith("analysis_"):
+        retries, first = settings.ANALYSIS_STAGE_RETRIES, ANALYSIS_STAGE_FIRST_RETRY_SECONDS
+    else:
+        retries, first = RETRY_POLICIES.get(job_type, (0, 0))
+    if retries <= 0:
+        return None
+    return Retry(max=retries, interval=backoff_intervals(retries, first))
+
+
+def interactive_pressure() -> int:
+    """jobs queued on or running from the interactive lane (bulk ffmpeg pauses while > 0)"""
+    from rq.registry import StartedJobRegistry
+
+    total = 0
+    for name in LANES["interactive"]:
+        q = get_queue(name)
+        total += q.count + StartedJobRegistry(queue=q).get_job_count(cleanup=False)
+    return total
+
+
+def enqueue_job(func, *args, file_id: Optional[UUID] = None, clip_id: Optional[UUID] = None, timeout=None,
+                queue_name: Optional[str] = None, delay: Optional[float] = None, **kwargs):
+    """enqueue a job and track it in the database (delay: seconds until the rq scheduler queues it)"""
     # timeout is for RQ, not for the worker function - don't pass it in kwargs
-    rq_job = queue.enqueue(func, *args, job_timeout=timeout, **kwargs)
-    
+    target = get_queue(queue_name) if queue_name else queue_for_job(func)
+
     # determine job type from function name
     job_type = func.__name__
-    
+
+    if "retry" not in kwargs:
+        kwargs["retry"] = retry_for(job_type)
+    kwargs.setdefault("on_failure", Callback(_on_failure))
+    if delay:
+        rq_job = target.enqueue_in(timedelta(seconds=delay), func, *args, job_timeout=timeout, **kwargs)
+    else:
+        rq_job = target.enqueue(func, *args, job_timeout=timeout, **kwargs)
+
     # create database record
     create_job_record(
         rq_job_id=rq_job.id,
@@ -23,6 +176,177 @@ def enqueue_job(func, *args, file_id: Optional[UUID] = None, clip_id: Optional[U
         file_id=file_id,
         clip_id=clip_id
     )
-    
+
     return rq_job
 
+
+# dedup markers outlive a normal run; the ttl only matters when a worker dies
+# without running the job's callbacks
+UNIQUE_TTL_SECONDS = 6 * 3600
+
+
+def _unique_key(job_type: str, key) -> str:
+    return f"job:unique:{job_type}:{key}"
+
+
+def _reserved_key(job_type: str) -> str:
+    # unique key -> disk bytes the job will write, for as long as it holds its marker
+    return f"job:unique:reserved:{job_type}"
+
+
+def claim_unique(job_type: str, key, owner: str, ttl: int = UNIQUE_TTL_SECONDS, reserve_bytes: int = 0) -> bool:
+    """SET NX a marker for (job type, key); False if someone already holds it"""
+    if not redis_conn.set(_unique_key(job_type, key), owner, nx=True, ex=ttl):
+        return False
+    if reserve_bytes:
+        redis_conn.hset(_reserved_key(job_type), str(key), int(reserve_bytes))
+    return True
+
+
+def release_unique(job_type: str, key, owner: Optional[str] = None):
+    """drop the marker (only if owner still holds it, when given) and its disk reservation"""
+    unique_key = _unique_key(job_type, key)
+    if owner is None or redis_conn.get(unique_key) == owner.encode():
+        pipe = redis_conn.pipeline(transaction=False)
+        pipe.delete(unique_key)
+        pipe.hdel(_reserved_key(job_type), str(key))
+        pipe.execute()
+
+
+def held_unique(job_type: str, keys: Iterable) -> Set[str]:
+    """the keys that have a job of this type queued or running (one MGET)"""
+    keys = [str(k) for k in keys]
+    if not keys:
+        return set()
+    markers = redis_conn.mget([_unique_key(job_type, k) for k in keys])
+    return {k for k, marker in zip(keys, markers) if marker is not None}
+
+
+def reserved_unique(job_type: str) -> Dict[str, int]:
+    """
+    disk bytes reserved by this job type's queued/running jobs, per unique key
+
+    maintained by claim_unique / release_unique instead of scanning the
+    queue; a reservation whose marker expired (worker died without running
+    the callbacks) is dropped here
+    """
+    raw = redis_conn.hgetall(_reserved_key(job_type))
+    if not raw:
+        return {}
+    reserved = {(k.decode() if isinstance(k, bytes) else k): int(v) for k, v in raw.items()}
+    live = held_unique(job_type, reserved)
+    stale = [k for k in reserved if k not in live]
+    if stale:
+        redis_conn.hdel(_reserved_key(job_type), *stale)
+    return {k: v for k, v in reserved.items() if k in live}
+
+
+def _release_on_success(job, connection, result, *args, **kwargs):
+    release_unique(job.meta["unique_type"], job.meta["unique_key"], job.id)
+
+
+def _release_on_failure(job, connection, *exc_info, **kwargs):
+    # runs before rq decides on a retry; a pending retry still counts as queued
+    if job.retries_left:
+        return
+    release_unique(job.meta["unique_type"], job.meta["unique_key"], job.id)
+
+
+def _on_failure(job, connection, exc_type, exc_value, traceback):
+    """
+    every tracked job's failure callback; runs before rq decides on a retry
+
+    errors a retry can't fix use up the job's retries right here, so rq
+    fails it for good; a job failing for good is dead-lettered and its
+    dedup marker (enqueue_unique) dropped
+    """
+    from app.core.errors import is_transient, handle_worker_error, JobCancelled
+    from app.services.job_tracker import retry_job
+
+    job.meta["attempts"] = job.meta.get("attempts", 0) + 1
+    job.save_meta()
+
+    if job.retries_left and not is_transient(exc_value):
+        print(f"[RETRY] {job.id} ({job.func_name}): {exc_type.__name__} isn't transient, not retrying")
+        job.retries_left = 0
+
+    if job.retries_left:
+        delay = job.get_retry_interval()
+        print(f"[RETRY] {job.id} ({job.func_name}) failed ({exc_value}), retrying in {delay}s, {job.retries_left} left")
+        retry_job(job.id, f"attempt {job.meta['attempts']} failed, retrying in {delay}s: {exc_value}")
+        return
+
+    if job.meta.get("unique_type"):
+        _release_on_failure(job, connection, exc_type, exc_value, traceback)
+    if not isinstance(exc_value, JobCancelled):
+        handle_worker_error(job, exc_value)
+
+
+def _release_on_stopped(job, connection, *args, **kwargs):
+    release_unique(job.meta["unique_type"], job.meta["unique_key"], job.id)
+
+
+def enqueue_unique(func, unique_key, *args, ttl: int = UNIQUE_TTL_SECONDS, reserve_bytes: int = 0, **kwargs):
+    """
+    enqueue_job unless the same job type is already queued/running for unique_key
+
+    one redis SET NX instead of scanning the queue; the marker holds the job
+    id and is dropped by the job's success/failure/stopped callbacks (the
+    failure one is enqueue_job's _on_failure). reserve_bytes is disk the job
+    will write, counted by reserved_unique (admission) while the marker lives
+
+    returns the rq job, or None if it was a duplicate
+    """
+    job_type = func.__name__
+    job_id = str(uuid4())
+    if not claim_unique(job_type, unique_key, job_id, ttl, reserve_bytes=reserve_bytes):
+        return None
+
+    try:
+        return enqueue_job(
+            func, *args,
+            job_id=job_id,
+            meta={"unique_type": job_type, "unique_key": str(unique_key), "reserve_bytes": int(reserve_bytes)},
+            on_success=Callback(_release_on_success),
+            on_stopped=Callback(_release_on_stopped),
+            **kwargs
+        )
+    except Exception:
+        release_unique(job_type, unique_key, job_id)
+        raise
+
+
+def cancel_rq_job(rq_job_id: str, stop_running: bool = True) -> Optional[str]:
+    """
+    stop a running job or cancel a queued/deferred/scheduled one
+
+    running jobs get rq's stop-job command; the worker interrupts the job
+    (worker.py) and rq marks it stopped and cancels its dependents.
+    stop_running=False leaves running jobs alone
+    returns the status the job was in, or None if it was already done (or left running)
+    """
+    from rq.job import Job, JobStatus
+    from rq.command import send_stop_job_command
+    from rq.exceptions import NoSuchJobError
+    from app.services.job_tracker import cancel_job
+
+    try:
+        rq_job = Job.fetch(rq_job_id, connection=redis_conn)
+    except NoSuchJobError:
+        return None
+
+    status = rq_job.get_status()
+    if status == JobStatus.STARTED:
+        if not stop_running:
+            return None
+        send_stop_job_command(redis_conn, rq_job_id)
+    elif status in (JobStatus.QUEUED, JobStatus.DEFERRED, JobStatus.SCHEDULED):
+        rq_job.cancel()
+        if rq_job.meta.get("unique_type"):
+            # never runs, so its callbacks won't drop the marker
+            release_unique(rq_job.meta["unique_type"], rq_job.meta["unique_key"], rq_job.id)
+    else:
+        return None
+
+    cancel_job(rq_job_id)
+    return status.value
@@ -0,0 +1,44 @@
+from sqlmodel import Session, select
+from app.core.config import settings
+from app.models import FinalClip
+from typing import Optional
+import hashlib
+import json
+
+# bump when encoder settings / cut logic change so old renders stop matching
+RENDER_VERSION = 1
+
+
+def render_params() -> dict:
+    """everything besides source + trim that changes the rendered bytes"""
+    return {"mode": settings.CLIP_RENDER_MODE, "version": RENDER_VERSION}
+
+
+def compute_clip_hash(file_hash: str, start_ms: int, end_ms: int, params: Optional[dict] = None) -> str:
+    """
+    render cache key: original content hash + trim range + render params
+
+    two clips with the same key are byte-for-byte the same video, whatever
+    they are tagged or named
+    """
+    key = {
+        "file_hash": file_hash,
+        "start_ms": int(start_ms),
+        "end_ms": int(end_ms),
+        "params": params if params is not None else render_params(),
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def find_rendered_clip(session: Session, clip_hash: str, exclude_id=None) -> Optional[FinalClip]:
+    """an already uploaded clip with this render key, newest first"""
+    statement = (
+        select(FinalClip)
+        .where(FinalClip.clip_hash == clip_hash)
+        .where(FinalClip.is_uploaded_to_drive == True)
+        .where(FinalClip.drive_file_id != None)
+        .order_by(FinalClip.created_at.desc())
+    )
+    if exclude_id is not None:
+        statement = statement.where(FinalClip.id != exclude_id)
+    return session.exec(statement).first()
@@ -0,0 +1,125 @@
+from app.core.config import settings
+from app.models import FinalClip
+from app.services.queue import redis_conn, enqueue_job
+from typing import List, Optional
+from uuid import UUID
+import time
+
+class RenderCoordinator:
+    """
+    groups clip renders per original so one ffmpeg run serves a sorting burst
+
+    saves push their clips onto a per-original pending list; the first
+    push also schedules one render_clip_batch job RENDER_BATCH_WINDOW_SECONDS
+    out. if clips are still arriving when it runs, it schedules itself again
+    for when the window (or RENDER_BATCH_MAX_WAIT_SECONDS since the first
+    clip) will have passed instead of sleeping in the worker; otherwise it
+    takes the whole list and renders every clip in one ffmpeg run.
+    """
+
+    LIST_TTL_SECONDS = 24 * 3600
+    SCHEDULED_TTL_SECONDS = 3600
+
+    def __init__(self, redis=None):
+        self.redis = redis or redis_conn
+
+    def _pending_key(self, original_file_id) -> str:
+        return f"render:batch:{original_file_id}"
+
+    def _scheduled_key(self, original_file_id) -> str:
+        return f"render:batch:scheduled:{original_file_id}"
+
+    def _last_key(self, original_file_id) -> str:
+        return f"render:batch:last:{original_file_id}"
+
+    def _first_key(self, original_file_id) -> str:
+        return f"render:batch:first:{original_file_id}"
+
+    def request_render(self, clip: FinalClip) -> Optional[str]:
+        """
+        add a clip to its original's pending batch
+
+        returns the batch job id if this call queued a new batch, None if the
+        clip joined a batch that is already waiting
+        """
+        job_ids = self.request_renders([clip])
+        return job_ids[0] if job_ids else None
+
+    def request_renders(self, clips: List[FinalClip]) -> List[str]:
+        """
+        add clips to their originals' pending batches in one redis round trip
+
+        returns the ids of the batch jobs this call queued (one per original
+        that had no batch waiting yet)
+        """
+        by_original = {}
+        for clip in clips:
+            by_original.setdefault(clip.original_file_id, []).append(str(clip.id))
+
+        pipe = self.redis.pipeline()
+        for original_file_id, clip_ids in by_original.items():
+            pipe.rpush(self._pending_key(original_file_id), *clip_ids)
+            pipe.expire(self._pending_key(original_file_id), self.LIST_TTL_SECONDS)
+            pipe.set(self._last_key(original_file_id), str(time.time()), ex=self.LIST_TTL_SECONDS)
+            pipe.set(self._first_key(original_file_id), str(time.time()), nx=True, ex=self.LIST_TTL_SECONDS)
+        for original_file_id in by_original:
+            pipe.set(self._scheduled_key(original_file_id), "1", nx=True, ex=self.SCHEDULED_TTL_SECONDS)
+        scheduled = pipe.execute()[-len(by_original):] if by_original else []
+
+        job_ids = []
+        for original_file_id, claimed in zip(by_original, scheduled):
+            if not claimed:
+                continue
+            try:
+                job_ids.append(self.schedule_batch(original_file_id, settings.RENDER_BATCH_WINDOW_SECONDS))
+            except Exception:
+                self.redis.delete(self._scheduled_key(original_file_id))
+                raise
+        return job_ids
+
+    def schedule_batch(self, original_file_id, delay_sec: float) -> str:
+        """queue the original's render_clip_batch to run delay_sec from now"""
+        from app.worker import render_clip_batch
+        job = enqueue_job(
+            render_clip_batch, str(original_file_id),
+            file_id=original_file_id, timeout='1h', delay=delay_sec
+        )
+        print(f"[RENDER] batch {job.id} for original {original_file_id} scheduled in {delay_sec:.1f}s")
+        return job.id
+
+    def quiet_in(self, original_file_id, window_sec: Optional[float] = None, max_wait_sec: Optional[float] = None) -> float:
+        """seconds until the batch should render: no clip added for window_sec, or max_wait_sec since the first one"""
+        window_sec = settings.RENDER_BATCH_WINDOW_SECONDS if window_sec is None else window_sec
+        max_wait_sec = settings.RENDER_BATCH_MAX_WAIT_SECONDS if max_wait_sec is None else max_wait_sec
+
+        last, first = self.redis.mget([self._last_key(original_file_id), self._first_key(original_file_id)])
+        now = time.time()
+        remaining = min(
+            window_sec - (now - float(last or 0)),
+            max_wait_sec - (now - float(first or 0)),
+        )
+        return max(0.0, remaining)
+
+    def take_batch(self, original_file_id) -> List[UUID]:
+        """
+        atomically claim every pending clip for an original
+
+        the scheduled marker is dropped in the same transaction, so a clip
+        saved after this point queues a fresh batch instead of being stranded
+        """
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(self._scheduled_key(original_file_id), self._first_key(original_file_id))
+        pipe.lrange(self._pending_key(original_file_id), 0, -1)
+        pipe.delete(self._pending_key(original_file_id))
+        _, raw_ids, _ = pipe.execute()
+
+        clip_ids = []
+        for raw in raw_ids:
+            clip_id = UUID(raw.decode() if isinstance(raw, bytes) else raw)
+            if clip_id not in clip_ids:
+                clip_ids.append(clip_id)
+        return clip_ids
+
+
+# singleton instance
+render_coordinator = RenderCoordinator()
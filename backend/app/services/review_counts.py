@@ -0,0 +1,123 @@
+from collections import defaultdict
+from typing import Dict, Iterable
+from uuid import UUID
+from sqlalchemy import delete
+from sqlmodel import Session, select, func
+from app.core.db import dialect_insert
+from app.models import CandidateSegment, VideoReviewCount, SortCounter
+
+# segment counts per video (total / unreviewed / accepted / trashed) and the
+# number of videos with anything left to review, so /sort/next never has to
+# count segments. every status change goes through set_segment_status (and
+# new segments through segments_added), which bump the counters with atomic
+# upserts in the caller's transaction: they commit or roll back with it
+#
+# rebuild() recounts everything from candidate_segments if they ever drift
+
+STATUS_COLUMNS = {"UNREVIEWED": "unreviewed", "ACCEPTED": "accepted", "TRASHED": "trashed"}
+VIDEOS_REMAINING = "videos_remaining"
+
+
+def _bump_videos_remaining(session: Session, delta: int):
+    insert = dialect_insert(session)
+    table = SortCounter.__table__
+    stmt = insert(table).values(name=VIDEOS_REMAINING, value=delta)
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.name],
+        set_={"value": table.c.value + stmt.excluded.value},
+    ))
+
+
+def _apply(session: Session, deltas: Dict[UUID, Dict[str, int]]):
+    """add per-video deltas to the counters; a video's unreviewed count crossing zero moves videos_remaining"""
+    insert = dialect_insert(session)
+    table = VideoReviewCount.__table__
+    remaining = 0
+    # sorted, so concurrent batches lock the same videos in the same order
+    for original_file_id in sorted(deltas, key=str):
+        columns = {column: n for column, n in deltas[original_file_id].items() if n}
+        if not columns:
+            continue
+        stmt = insert(table).values(original_file_id=original_file_id, **columns)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.original_file_id],
+            set_={column: table.c[column] + stmt.excluded[column] for column in columns},
+        ).returning(table.c.unreviewed)
+        unreviewed = session.execute(stmt).scalar_one()
+        before = unreviewed - columns.get("unreviewed", 0)
+        if before <= 0 < unreviewed:
+            remaining += 1
+        elif unreviewed <= 0 < before:
+            remaining -= 1
+
+    if remaining:
+        _bump_videos_remaining(session, remaining)
+
+
+def set_segment_status(session: Session, segments: Iterable[CandidateSegment], status: str) -> int:
+    """change segments' status and their videos' counters together; returns how many changed"""
+    deltas = defaultdict(lambda: defaultdict(int))
+    changed = 0
+    for segment in segments:
+        if segment.status == status:
+            continue
+        if segment.status in STATUS_COLUMNS:
+            deltas[segment.original_file_id][STATUS_COLUMNS[segment.status]] -= 1
+        if status in STATUS_COLUMNS:
+            deltas[segment.original_file_id][STATUS_COLUMNS[status]] += 1
+        segment.status = status
+        session.add(segment)
+        changed += 1
+
+    _apply(session, deltas)
+    return changed
+
+
+def segments_added(session: Session, segments: Iterable[CandidateSegment]):
+    """count freshly inserted segments"""
+    deltas = defaultdict(lambda: defaultdict(int))
+    for segment in segments:
+        deltas[segment.original_file_id]["total"] += 1
+        if segment.status in STATUS_COLUMNS:
+            deltas[segment.original_file_id][STATUS_COLUMNS[segment.status]] += 1
+    _apply(session, deltas)
+
+
+def video_counts(session: Session, original_file_id: UUID) -> dict:
+    # populate_existing: the upserts above bypass the orm, a cached row may be stale
+    row = session.get(VideoReviewCount, original_file_id, populate_existing=True)
+    return {
+        "total": row.total if row else 0,
+        "unreviewed": row.unreviewed if row else 0,
+        "accepted": row.accepted if row else 0,
+        "trashed": row.trashed if row else 0,
+    }
+
+
+def videos_remaining(session: Session) -> int:
+    row = session.get(SortCounter, VIDEOS_REMAINING, populate_existing=True)
+    return row.value if row else 0
+
+
+def rebuild(session: Session) -> dict:
+    """recount every video from candidate_segments (backfill / repair)"""
+    rows = session.exec(
+        select(CandidateSegment.original_file_id, CandidateSegment.status, func.count(CandidateSegment.id))
+        .group_by(CandidateSegment.original_file_id, CandidateSegment.status)
+    ).all()
+
+    counts = defaultdict(lambda: {"total": 0, "unreviewed": 0, "accepted": 0, "trashed": 0})
+    for original_file_id, status, n in rows:
+        counts[original_file_id]["total"] += n
+        if status in STATUS_COLUMNS:
+            counts[original_file_id][STATUS_COLUMNS[status]] += n
+
+    session.execute(delete(VideoReviewCount))
+    session.add_all(VideoReviewCount(original_file_id=original_file_id, **c) for original_file_id, c in counts.items())
+    remaining = sum(1 for c in counts.values() if c["unreviewed"] > 0)
+    counter = session.get(SortCounter, VIDEOS_REMAINING) or SortCounter(name=VIDEOS_REMAINING)
+    counter.value = remaining
+    session.add(counter)
+    session.commit()
+    print(f"[REVIEW COUNTS] rebuilt counters for {len(counts)} videos, {remaining} with segments to review")
+    return {"videos": len(counts), "videos_remaining": remaining}
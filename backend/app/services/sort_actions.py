@@ -0,0 +1,232 @@
+from collections import defaultdict
+from typing import List, Optional
+from uuid import UUID
+from sqlmodel import Session, select, or_
+from app.models import CandidateSegment, FinalClip, HighlightWindow, OriginalFile, Person, Trick
+from app.services.filenames import slugify, filename_base, allocate_versions, generate_filename
+from app.services.render_cache import compute_clip_hash
+from app.services.review_counts import set_segment_status
+
+# sorting decisions (save / trash) applied in bulk: one transaction per batch,
+# one query per lookup for the whole batch instead of one per decision, and
+# one redis round trip for the renders the saves need. /sort/save and
+# /sort/trash are batches of one
+#
+# a decision is anything with .action ("save" / "trash") and .segment_id;
+# saves also carry the SaveClipRequest fields (see api/v1/sort.py)
+
+NEGATIVES_PER_SAVE = 2
+
+
+def _resolve(session: Session, model, name_field: str, refs: list, create) -> dict:
+    """
+    every (id, name) reference in a batch in one query; names that don't exist
+    yet are created (in one flush). returns {id: row, name: row}
+    """
+    ids = {i for i, _ in refs if i}
+    names = {n for i, n in refs if not i and n}
+    if not ids and not names:
+        return {}
+
+    name_column = getattr(model, name_field)
+    found = {}
+    for row in session.exec(select(model).where(or_(model.id.in_(ids), name_column.in_(names)))).all():
+        found[row.id] = row
+        found[getattr(row, name_field)] = row
+
+    created = [create(n) for n in sorted(names) if n not in found]
+    if created:
+        session.add_all(created)
+        session.flush()
+        for row in created:
+            found[getattr(row, name_field)] = row
+    return found
+
+
+def _tag(found: dict, tag_id: Optional[UUID], name: Optional[str]):
+    # an unknown id means no tag (BROLL), same as before batching
+    if tag_id:
+        return found.get(tag_id)
+    return found.get(name) if name else None
+
+
+def apply_sort_decisions(session: Session, decisions: list) -> List[dict]:
+    """
+    apply save / trash decisions in one transaction and queue the renders
+
+    returns one result per decision, in order:
+        {"segment_id", "status": saved | duplicate | trashed | not_found, "clip_id"?}
+    """
+    from app.ml_training.negatives import generate_negative_samples
+    from app.services.render_coordinator import render_coordinator
+
+    segment_ids = {d.segment_id for d in decisions}
+    segments = {
+        s.id: s for s in session.exec(select(CandidateSegment).where(CandidateSegment.id.in_(segment_ids))).all()
+    }
+    saves = [d for d in decisions if d.action == "save" and d.segment_id in segments]
+
+    original_ids = {segments[d.segment_id].original_file_id for d in saves}
+    originals = {
+        o.id: o for o in session.exec(select(OriginalFile).where(OriginalFile.id.in_(original_ids))).all()
+    } if original_ids else {}
+
+    # people and tricks: one lookup each, missing names created
+    def clean(name):
+        return name.strip() if name and name.strip() else None
+
+    people = _resolve(
+        session, Person, "display_name",
+        [(d.person_id, clean(d.person_name)) for d in saves],
+        lambda name: Person(display_name=name, slug=slugify(name)),
+    )
+    tricks = _resolve(
+        session, Trick, "name",
+        [(d.trick_id, clean(d.trick_name)) for d in saves],
+        lambda name: Trick(name=name, category="uncategorized"),
+    )
+
+    # render cache key; an identical save (same video, same tags) reuses the existing clip
+    def dedupe_key(clip_hash, person_id, trick_id, session_name, category):
+        return (clip_hash, person_id, trick_id, session_name, category)
+
+    # work out every save's tags, hash and filename base up front so the
+    # duplicate check and the version allocation are one statement each
+    planned = []
+    for d in saves:
+        original = originals[segments[d.segment_id].original_file_id]
+        person = _tag(people, d.person_id, clean(d.person_name))
+        trick = _tag(tricks, d.trick_id, clean(d.trick_name))
+        clip_hash = compute_clip_hash(original.file_hash, d.start_ms, d.end_ms)
+        planned.append({
+            "decision": d,
+            "original": original,
+            "person": person,
+            "trick": trick,
+            "clip_hash": clip_hash,
+            "key": dedupe_key(clip_hash, person.id if person else None, trick.id if trick else None, d.session_name, d.category),
+            "base": filename_base(
+                original.recorded_at.strftime("%Y-%m-%d"), d.session_name,
+                person.slug if person else "BROLL", trick.name if trick else "BROLL",
+                original.camera_id, original.fps_label, original.resolution_label, original.aspect_ratio,
+            ),
+        })
+
+    existing = {}
+    hashes = {p["clip_hash"] for p in planned}
+    if hashes:
+        for clip in session.exec(
+            select(FinalClip).where(FinalClip.clip_hash.in_(hashes)).order_by(FinalClip.created_at.desc())
+        ).all():
+            existing.setdefault(dedupe_key(clip.clip_hash, clip.person_id, clip.trick_id, clip.session_name, clip.category), clip)
+
+    # versions for the saves that make a new clip (the first of any in-batch repeats)
+    counts, new_keys = defaultdict(int), set()
+    for p in planned:
+        if p["key"] not in existing and p["key"] not in new_keys:
+            new_keys.add(p["key"])
+            counts[p["base"]] += 1
+    versions = allocate_versions(session, counts)
+
+    # positives already labelled per video, for negative sampling
+    positives = defaultdict(list)
+    if original_ids:
+        for original_id, start_sec, end_sec in session.exec(
+            select(HighlightWindow.original_file_id, HighlightWindow.start_sec, HighlightWindow.end_sec)
+            .where(HighlightWindow.original_file_id.in_(original_ids))
+            .where(HighlightWindow.label == "POSITIVE")
+        ).all():
+            positives[original_id].append((start_sec, end_sec))
+
+    results = {}
+    new_clips, rerender, windows, accepted, trashed = [], [], [], [], []
+    for p in planned:
+        d, original, person, trick = p["decision"], p["original"], p["person"], p["trick"]
+        segment = segments[d.segment_id]
+        accepted.append(segment)
+
+        duplicate = existing.get(p["key"])
+        if duplicate:
+            # the earlier save never made it to drive (still rendering, or its
+            # render was dead-lettered): ask for it again. a clip already in a
+            # pending batch is only rendered once, and render_clip_batch skips
+            # clips that are uploaded by the time it runs
+            if not duplicate.is_uploaded_to_drive and duplicate not in new_clips and duplicate not in rerender:
+                rerender.append(duplicate)
+            results[id(d)] = {"segment_id": d.segment_id, "status": "duplicate", "clip_id": duplicate.id}
+            continue
+
+        date_str = original.recorded_at.strftime("%Y-%m-%d")
+        filename = generate_filename(
+            date=date_str,
+            session=d.session_name,
+            person_slug=person.slug if person else "BROLL",
+            trick_name=trick.name if trick else "BROLL",
+            cam_id=original.camera_id,
+            fps_label=original.fps_label,
+            resolution_label=original.resolution_label,
+            aspect_ratio=original.aspect_ratio,
+            version=versions[p["base"]].pop(0),
+        )
+
+        final_clip = FinalClip(
+            candidate_segment_id=segment.id,
+            original_file_id=original.id,
+            person_id=person.id if person else None,
+            trick_id=trick.id if trick else None,
+            category=d.category,
+            session_name=d.session_name,
+            start_ms=d.start_ms,
+            end_ms=d.end_ms,
+            camera_id=original.camera_id,
+            fps_label=original.fps_label,
+            resolution_label=original.resolution_label,
+            aspect_ratio=original.aspect_ratio,
+            date=original.recorded_at.date(),
+            stored_path=f"/data/final_clips/{filename}",  # placeholder, worker will use this
+            clip_hash=p["clip_hash"],
+            filename=filename
+        )
+        new_clips.append(final_clip)
+        existing[p["key"]] = final_clip
+        results[id(d)] = {"segment_id": d.segment_id, "status": "saved", "clip_id": final_clip.id}
+
+        # log positive training sample for ml, plus negatives away from every positive so far
+        window = (d.start_ms / 1000.0, d.end_ms / 1000.0)
+        windows.append(HighlightWindow(
+            original_file_id=original.id,
+            start_sec=window[0],
+            end_sec=window[1],
+            label="POSITIVE",
+            source="user_final_clip"
+        ))
+        positives[original.id].append(window)
+        windows.extend(generate_negative_samples(
+            session,
+            original.id,
+            list(positives[original.id]),
+            original.duration_ms / 1000.0,
+            num_negatives=NEGATIVES_PER_SAVE
+        ))
+
+    for d in decisions:
+        segment = segments.get(d.segment_id)
+        if segment is None:
+            results[id(d)] = {"segment_id": d.segment_id, "status": "not_found"}
+        elif d.action == "trash":
+            trashed.append(segment)
+            results[id(d)] = {"segment_id": d.segment_id, "status": "trashed"}
+
+    # ids are generated client side, so the flush sends each table's new rows
+    # as one multi-row insert (sqlalchemy insertmanyvalues)
+    set_segment_status(session, accepted, "ACCEPTED")
+    set_segment_status(session, trashed, "TRASHED")
+    session.add_all(new_clips)
+    session.add_all(windows)
+    session.commit()
+
+    if new_clips or rerender:
+        # batched per original: a burst of saves from one video renders in one ffmpeg pass
+        render_coordinator.request_renders(new_clips + rerender)
+
+    return [results[id(d)] for d in decisions]
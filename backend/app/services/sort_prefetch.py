@@ -0,0 +1,103 @@
+import os
+from typing import List
+from sqlmodel import Session, select
+from app.core.config import settings
+from app.models import CandidateSegment, OriginalFile
+
+# /sort/next?lookahead=N: the segments the sorter will get after the current
+# one, in serving order, with what the client should fetch ahead (media and
+# preview URLs, byte ranges of the playback proxy) so the next swipe plays
+# at once. prepare() runs after the response and queues whatever those
+# videos still need built (playback proxy, poster + sprites)
+
+# the sort page pads every segment by this much on each side
+PLAYBACK_PAD_MS = 2000
+
+
+def serving_order():
+    """unreviewed segments in the order /sort/next hands them out"""
+    return (
+        select(CandidateSegment)
+        .where(CandidateSegment.status == "UNREVIEWED")
+        .order_by(CandidateSegment.confidence_score.desc(), CandidateSegment.id)
+    )
+
+
+class SortPrefetch:
+    """what to warm ahead of the sorter, and getting it built"""
+
+    def upcoming(self, session: Session, current: CandidateSegment, count: int) -> List[CandidateSegment]:
+        """the next `count` segments after current"""
+        count = max(0, min(count, settings.SORT_LOOKAHEAD_MAX))
+        if count == 0:
+            return []
+        return session.exec(serving_order().where(CandidateSegment.id != current.id).limit(count)).all()
+
+    def describe(self, session: Session, segments: List[CandidateSegment]) -> List[dict]:
+        """one lookahead entry per segment"""
+        from app.services.proxy_coordinator import proxy_coordinator
+        from app.services.thumbnail_service import thumbnail_service
+        from app.video.proxy_utils import get_playback_proxy_path, warm_byte_ranges
+
+        file_ids = {s.original_file_id for s in segments}
+        originals = {
+            f.id: f for f in session.exec(select(OriginalFile).where(OriginalFile.id.in_(file_ids))).all()
+        } if file_ids else {}
+
+        media = {}
+        for file_id, original in originals.items():
+            try:
+                status = proxy_coordinator.get_status(file_id, original.stored_path)["status"]
+            except Exception as e:
+                print(f"[PREFETCH] proxy status for {file_id} unavailable: {e}")
+                status = "unknown"
+            if status != "ready" and not os.path.exists(original.stored_path):
+                status = "unavailable"
+            media[file_id] = status
+
+        entries = []
+        for segment in segments:
+            original = originals[segment.original_file_id]
+            window = (
+                max(0, segment.start_ms - PLAYBACK_PAD_MS),
+                min(original.duration_ms, segment.end_ms + PLAYBACK_PAD_MS),
+            )
+            ranges = []
+            if media[original.id] == "ready":
+                ranges = warm_byte_ranges(get_playback_proxy_path(original.stored_path), original.duration_ms, *window)
+            entries.append({
+                "segment_id": str(segment.id),
+                "start_ms": segment.start_ms,
+                "end_ms": segment.end_ms,
+                "confidence_score": segment.confidence_score,
+                "original_file_id": str(original.id),
+                "duration_ms": original.duration_ms,
+                "media_url": f"/api/upload/media/{original.id}",
+                "media_status": media[original.id],
+                "warm_ranges": [[first, last] for first, last in ranges],
+                "preview_url": f"/api/thumbnails/video/{original.id}",
+                "poster_url": thumbnail_service.poster_url_for_video(original),
+            })
+        return entries
+
+    def prepare(self, file_ids: List[str]):
+        """queue playback proxies and thumbnails the upcoming videos don't have yet (single-flight)"""
+        from uuid import UUID
+        from app.core.db import engine
+        from app.services.proxy_coordinator import proxy_coordinator
+        from app.services.thumbnail_service import thumbnail_service
+
+        with Session(engine) as session:
+            for file_id in dict.fromkeys(file_ids):
+                original = session.get(OriginalFile, UUID(file_id))
+                if not original or not os.path.exists(original.stored_path):
+                    continue
+                try:
+                    proxy_coordinator.request_proxy(original.id, original.stored_path)
+                    thumbnail_service.request_video_thumbnails(original)
+                except Exception as e:
+                    print(f"[PREFETCH] could not prepare {file_id}: {e}")
+
+
+# singleton instance
+sort_prefetch = SortPrefetch()
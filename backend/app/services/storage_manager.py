@@ -171,7 +171,12 @@ class StorageManager:
         else:
             originals_deleted, originals_bytes = 0, 0
         
-        # step 3: if still over 80% capacity, use LRU eviction
+        # step 3: drop playback proxies of fully reviewed videos
+        from app.services.proxy_scheduler import proxy_scheduler
+        with Session(engine) as session:
+            proxies_deleted, proxies_bytes = proxy_scheduler.evict_reviewed(session)
+        
+        # step 4: if still over 80% capacity, use LRU eviction
         current_usage = self.get_disk_usage()
         if current_usage["percent_used"] > 80:
             lru_deleted, lru_bytes = self.evict_lru_files(target_free_gb=15)
@@ -180,13 +185,14 @@ class StorageManager:
         
         final_usage = self.get_disk_usage()
         
-        total_freed = clips_bytes + originals_bytes + lru_bytes
+        total_freed = clips_bytes + originals_bytes + proxies_bytes + lru_bytes
         
         summary = {
             "clips_deleted": clips_deleted,
             "originals_deleted": originals_deleted,
+            "proxies_deleted": proxies_deleted,
             "lru_deleted": lru_deleted,
-            "total_files_deleted": clips_deleted + originals_deleted + lru_deleted,
+            "total_files_deleted": clips_deleted + originals_deleted + proxies_deleted + lru_deleted,
             "total_gb_freed": total_freed / (1024**3),
             "initial_usage_percent": initial_usage["percent_used"],
             "final_usage_percent": final_usage["percent_used"],
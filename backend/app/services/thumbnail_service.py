@@ -0,0 +1,90 @@
+from app.models import OriginalFile, FinalClip
+from app.services.queue import redis_conn, enqueue_job
+from app.video.thumbnails import video_thumbnail_key, clip_thumbnail_key, load_manifest
+from typing import Optional
+import os
+
+class ThumbnailService:
+    """
+    resolves thumbnail manifests to URLs and queues missing builds
+
+    entries are content-addressed (source file_hash + render params), so the
+    URLs handed out never change meaning and can be cached forever
+    """
+
+    PENDING_TTL_SECONDS = 3600
+
+    def __init__(self, redis=None):
+        self.redis = redis or redis_conn
+
+    def _url(self, key: str, name: Optional[str]) -> Optional[str]:
+        return f"/api/thumbnails/{key}/{name}" if name else None
+
+    def _to_urls(self, manifest: dict) -> dict:
+        key = manifest["key"]
+        result = {"status": "ready", "poster_url": self._url(key, manifest.get("poster"))}
+        if manifest.get("vtt"):
+            result.update({
+                "sprites_vtt_url": self._url(key, manifest["vtt"]),
+                "interval_sec": manifest["interval_sec"],
+                "tile_width": manifest["tile_width"],
+                "tile_height": manifest["tile_height"],
+            })
+        return result
+
+    def poster_url_for_video(self, file: OriginalFile) -> Optional[str]:
+        """poster URL if already built; never queues anything (safe in list endpoints)"""
+        manifest = load_manifest(video_thumbnail_key(file.file_hash))
+        return self._url(manifest["key"], manifest.get("poster")) if manifest else None
+
+    def poster_url_for_clip(self, clip: FinalClip, original: OriginalFile) -> Optional[str]:
+        manifest = load_manifest(clip_thumbnail_key(original.file_hash, clip.start_ms, clip.end_ms))
+        return self._url(manifest["key"], manifest.get("poster")) if manifest else None
+
+    def _queue_once(self, key: str, func, *args, **kwargs) -> dict:
+        """enqueue a build unless one for the same cache key is already pending"""
+        pending_key = f"thumbs:pending:{key}"
+        if self.redis.set(pending_key, "1", nx=True, ex=self.PENDING_TTL_SECONDS):
+            try:
+                job = enqueue_job(func, *args, **kwargs)
+            except Exception:
+                self.redis.delete(pending_key)
+                raise
+            return {"status": "queued", "job_id": job.id}
+        return {"status": "queued"}
+
+    def clear_pending(self, key: str):
+        self.redis.delete(f"thumbs:pending:{key}")
+
+    def request_video_thumbnails(self, file: OriginalFile) -> dict:
+        manifest = load_manifest(video_thumbnail_key(file.file_hash))
+        if manifest:
+            return self._to_urls(manifest)
+        if not os.path.exists(file.stored_path):
+            return {"status": "unavailable"}
+
+        from app.worker import generate_thumbnails_for_file
+        return self._queue_once(
+            video_thumbnail_key(file.file_hash),
+            generate_thumbnails_for_file, str(file.id),
+            file_id=file.id, timeout='1h'
+        )
+
+    def request_clip_poster(self, clip: FinalClip, original: OriginalFile) -> dict:
+        key = clip_thumbnail_key(original.file_hash, clip.start_ms, clip.end_ms)
+        manifest = load_manifest(key)
+        if manifest:
+            return self._to_urls(manifest)
+        if not os.path.exists(original.stored_path):
+            return {"status": "unavailable"}
+
+        from app.worker import generate_thumbnail_for_clip
+        return self._queue_once(
+            key,
+            generate_thumbnail_for_clip, str(clip.id),
+            clip_id=clip.id, timeout='10m'
+        )
+
+
+# singleton instance
+thumbnail_service = ThumbnailService()
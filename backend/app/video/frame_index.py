@@ -0,0 +1,141 @@
+import subprocess
+import numpy as np
+import os
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+
+class FrameIndex:
+    """
+    keyframe + frame timestamp table for one video stream
+
+    arrays are sorted by presentation time, so every lookup is a binary
+    search instead of a probe or a scan of the file
+    """
+
+    def __init__(self, frame_pts: np.ndarray, key_pts: np.ndarray, key_pos: np.ndarray):
+        self.frame_pts = frame_pts  # float64 seconds, every video frame
+        self.key_pts = key_pts  # float64 seconds, keyframes only
+        self.key_pos = key_pos  # int64 byte offset of each keyframe packet (-1 if unknown)
+
+    @property
+    def frame_count(self) -> int:
+        return len(self.frame_pts)
+
+    @property
+    def keyframe_count(self) -> int:
+        return len(self.key_pts)
+
+    def keyframe_at_or_before(self, t: float) -> Tuple[float, int]:
+        """last keyframe whose pts <= t (first keyframe if t is before it): (pts, byte_pos)"""
+        i = int(np.searchsorted(self.key_pts, t, side="right")) - 1
+        i = max(i, 0)
+        return float(self.key_pts[i]), int(self.key_pos[i])
+
+    def keyframe_at_or_after(self, t: float) -> Optional[Tuple[float, int]]:
+        """first keyframe whose pts >= t, or None past the last keyframe"""
+        i = int(np.searchsorted(self.key_pts, t, side="left"))
+        if i >= len(self.key_pts):
+            return None
+        return float(self.key_pts[i]), int(self.key_pos[i])
+
+    def frame_at_or_after(self, t: float) -> Optional[float]:
+        """pts of the first frame shown at or after t"""
+        i = int(np.searchsorted(self.frame_pts, t, side="left"))
+        if i >= len(self.frame_pts):
+            return None
+        return float(self.frame_pts[i])
+
+    def frame_at_or_before(self, t: float) -> Optional[float]:
+        """pts of the frame on screen at time t"""
+        i = int(np.searchsorted(self.frame_pts, t, side="right")) - 1
+        if i < 0:
+            return None
+        return float(self.frame_pts[i])
+
+    def frames_between(self, start: float, end: float) -> int:
+        """number of frames with start <= pts < end"""
+        lo = int(np.searchsorted(self.frame_pts, start, side="left"))
+        hi = int(np.searchsorted(self.frame_pts, end, side="left"))
+        return max(hi - lo, 0)
+
+    def keyframes_between(self, start: float, end: float) -> np.ndarray:
+        """keyframe pts with start <= pts < end"""
+        lo = int(np.searchsorted(self.key_pts, start, side="left"))
+        hi = int(np.searchsorted(self.key_pts, end, side="left"))
+        return self.key_pts[lo:hi]
+
+
+def get_frame_index_path(file_id) -> Path:
+    index_dir = Path(os.getenv("DATA_DIR", "/data")) / "frame_index"
+    return index_dir / f"{file_id}.npz"
+
+
+def build_frame_index(input_path: str) -> FrameIndex:
+    """
+    one packet-level ffprobe pass over the first video stream (no decoding),
+    parsed like the full media probe (media_info.parse_probe_output)
+    """
+    from app.video.media_info import parse_probe_output
+
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=index,codec_type:packet=stream_index,pts_time,dts_time,pos,flags",
+        "-of", "compact=p=1:nk=0",
+        input_path
+    ]
+
+    print(f"[FRAME INDEX] probing packets: {input_path}")
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    _, index = parse_probe_output(result.stdout)
+
+    if index.frame_count == 0:
+        raise ValueError(f"no video packets found in {input_path}")
+
+    print(f"[FRAME INDEX] {index.frame_count} frames, {index.keyframe_count} keyframes")
+    return index
+
+
+def save_frame_index(file_id, index: FrameIndex):
+    path = get_frame_index_path(file_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.stem + ".tmp.npz")
+    np.savez(tmp_path, frame_pts=index.frame_pts, key_pts=index.key_pts, key_pos=index.key_pos)
+    os.replace(tmp_path, path)
+
+
+def load_frame_index(file_id) -> Optional[FrameIndex]:
+    path = get_frame_index_path(file_id)
+    if not path.exists():
+        return None
+    with np.load(path) as data:
+        return FrameIndex(data["frame_pts"], data["key_pts"], data["key_pos"])
+
+
+# small in-process cache: renders of several clips from one original reuse it
+_index_cache: Dict[str, FrameIndex] = {}
+_INDEX_CACHE_SIZE = 16
+
+
+def get_frame_index(file_id, input_path: Optional[str] = None) -> Optional[FrameIndex]:
+    """
+    cached index for a file; built (and persisted) from input_path if missing
+
+    returns None if there is no index and no readable source to build from
+    """
+    cache_key = str(file_id)
+    if cache_key in _index_cache:
+        return _index_cache[cache_key]
+
+    index = load_frame_index(file_id)
+    if index is None:
+        if not input_path or not os.path.exists(input_path):
+            return None
+        index = build_frame_index(input_path)
+        save_frame_index(file_id, index)
+
+    if len(_index_cache) >= _INDEX_CACHE_SIZE:
+        _index_cache.pop(next(iter(_index_cache)))
+    _index_cache[cache_key] = index
+    return index
@@ -0,0 +1,232 @@
+import json
+import subprocess
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+from app.video.frame_index import FrameIndex, save_frame_index
+
+# bump when the probe captures new fields; older rows get re-probed on read
+PROBE_VERSION = 1
+
+_SHOW_ENTRIES = ":".join([
+    "format=format_name,duration,size,bit_rate",
+    "format_tags=creation_time",
+    "stream=index,codec_type,codec_name,profile,pix_fmt,level,width,height,avg_frame_rate,bit_rate,channels,sample_rate",
+    "stream_tags=rotate",
+    "stream_side_data=rotation",
+    "packet=stream_index,pts_time,dts_time,pos,flags",
+])
+
+
+def _to_int(value, default: int = 0) -> int:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def _to_float(value, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _rate(value: Optional[str]) -> float:
+    """"30000/1001" -> 29.97"""
+    if not value or "/" not in value:
+        return _to_float(value)
+    num, den = value.split("/", 1)
+    return _to_float(num) / _to_float(den) if _to_float(den) else 0.0
+
+
+def _fields(line: str) -> Tuple[str, Dict[str, str]]:
+    section, _, rest = line.strip().partition("|")
+    fields = {}
+    for part in rest.split("|"):
+        if "=" in part:
+            k, v = part.split("=", 1)
+            fields[k] = v
+    return section, fields
+
+
+def parse_probe_output(output: str) -> Tuple[dict, FrameIndex]:
+    """
+    turn one compact ffprobe listing (format + streams + packets) into a
+    media info dict and the first video stream's frame index
+    """
+    streams = []
+    fmt = {}
+    packets = []
+
+    for line in output.splitlines():
+        section, fields = _fields(line)
+        if section == "packet":
+            packets.append(fields)
+        elif section == "stream":
+            streams.append(fields)
+        elif section.startswith("side_data") and streams:
+            # nested side data may come on its own line after its stream
+            streams[-1].update({k: v for k, v in fields.items() if k == "rotation"})
+        elif section == "format":
+            fmt = fields
+
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    if video is None:
+        raise ValueError("no video stream found")
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+
+    # clockwise degrees, same convention as the legacy rotate tag
+    # (display matrix side data is counter-clockwise, hence the sign flip)
+    rotation = _to_int(video.get("tag:rotate"))
+    if video.get("rotation") not in (None, "", "N/A"):
+        rotation = (-_to_int(video["rotation"])) % 360
+
+    video_index = video.get("index", "0")
+    frame_pts, key_pts, key_pos = [], [], []
+    for p in packets:
+        if p.get("stream_index") != video_index:
+            continue
+        t = p.get("pts_time", "N/A")
+        if t == "N/A":
+            t = p.get("dts_time", "N/A")
+        if t == "N/A":
+            continue
+        t = float(t)
+        frame_pts.append(t)
+        if p.get("flags", "").startswith("K"):
+            key_pts.append(t)
+            key_pos.append(_to_int(p.get("pos"), -1))
+
+    frame_pts = np.sort(np.array(frame_pts, dtype=np.float64))
+    order = np.argsort(np.array(key_pts, dtype=np.float64), kind="stable")
+    key_pts = np.array(key_pts, dtype=np.float64)[order]
+    key_pos = np.array(key_pos, dtype=np.int64)[order]
+    index = FrameIndex(frame_pts, key_pts, key_pos)
+
+    # GOP lengths in frames: distance between consecutive keyframes, plus the tail
+    gop_frames = np.diff(np.append(np.searchsorted(frame_pts, key_pts), len(frame_pts)))
+
+    level = _to_int(video.get("level"), -1)
+    info = {
+        "probe_version": PROBE_VERSION,
+        "format_name": fmt.get("format_name", "unknown"),
+        "duration_ms": int(_to_float(fmt.get("duration")) * 1000),
+        "size_bytes": _to_int(fmt.get("size")),
+        "bit_rate": _to_int(fmt.get("bit_rate")),
+        "creation_time": fmt.get("tag:creation_time") or None,
+        "video_codec": video.get("codec_name"),
+        "video_profile": video.get("profile"),
+        "pix_fmt": video.get("pix_fmt"),
+        "level": level if level > 0 else None,
+        "width": _to_int(video.get("width")),
+        "height": _to_int(video.get("height")),
+        "fps": _rate(video.get("avg_frame_rate")),
+        "video_bit_rate": _to_int(video.get("bit_rate")),
+        "rotation": rotation,
+        "has_audio": audio is not None,
+        "audio_codec": audio.get("codec_name") if audio else None,
+        "audio_channels": _to_int(audio.get("channels")) if audio else 0,
+        "audio_sample_rate": _to_int(audio.get("sample_rate")) if audio else 0,
+        "frame_count": len(frame_pts),
+        "keyframe_count": len(key_pts),
+        "mean_gop_frames": float(gop_frames.mean()) if len(gop_frames) else 0.0,
+        "max_gop_frames": int(gop_frames.max()) if len(gop_frames) else 0,
+        "streams_json": json.dumps(streams),
+    }
+    return info, index
+
+
+def probe_media(input_path: str) -> Tuple[dict, FrameIndex]:
+    """
+    the single probe: format, every stream and the packet table in one
+    ffprobe process (packets are read, never decoded)
+    """
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_entries", _SHOW_ENTRIES,
+        "-of", "compact=p=1:nk=0",
+        input_path
+    ]
+    print(f"[MEDIA INFO] probing {input_path}")
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    info, index = parse_probe_output(result.stdout)
+    print(
+        f"[MEDIA INFO] {info['video_codec']} {info['width']}x{info['height']} @ {info['fps']:.2f}fps, "
+        f"{index.frame_count} frames, GOP ~{info['mean_gop_frames']:.0f} frames, audio: {info['audio_codec'] or 'none'}"
+    )
+    return info, index
+
+
+def video_stream_params(info: dict) -> dict:
+    """the codec parameters smart cut needs, in its probe_video_stream shape"""
+    return {
+        "codec_name": info["video_codec"],
+        "profile": info["video_profile"],
+        "pix_fmt": info["pix_fmt"],
+        "level": info["level"],
+        "rotation": info["rotation"],
+        "has_audio": info["has_audio"],
+    }
+
+
+def _row_to_info(row) -> dict:
+    return {k: v for k, v in row.model_dump().items() if k not in ("id", "original_file_id", "created_at")}
+
+
+# in-process cache; rows never change once written (re-probing replaces them)
+_info_cache: Dict[str, dict] = {}
+_INFO_CACHE_SIZE = 64
+
+
+def _remember(file_id, info: dict):
+    if len(_info_cache) >= _INFO_CACHE_SIZE:
+        _info_cache.pop(next(iter(_info_cache)))
+    _info_cache[str(file_id)] = info
+
+
+def store_media_info(session, file_id, info: dict, index: Optional[FrameIndex] = None):
+    """persist a probe result (and its frame index) for an original"""
+    from sqlmodel import select
+    from app.models import MediaInfo
+
+    row = session.exec(select(MediaInfo).where(MediaInfo.original_file_id == file_id)).first()
+    if row is None:
+        row = MediaInfo(original_file_id=file_id)
+    for key, value in info.items():
+        setattr(row, key, value)
+    session.add(row)
+    session.commit()
+
+    if index is not None:
+        save_frame_index(file_id, index)
+    _remember(file_id, info)
+
+
+def get_media_info(file_id, input_path: Optional[str] = None) -> Optional[dict]:
+    """
+    media info for an original: memory, then the DB, then one probe of
+    input_path (persisted for next time). None if unknown and unprobeable.
+    """
+    cached = _info_cache.get(str(file_id))
+    if cached:
+        return cached
+
+    import os
+    from sqlmodel import Session, select
+    from app.core.db import engine
+    from app.models import MediaInfo
+
+    with Session(engine) as session:
+        row = session.exec(select(MediaInfo).where(MediaInfo.original_file_id == file_id)).first()
+        if row is not None and row.probe_version >= PROBE_VERSION:
+            info = _row_to_info(row)
+            _remember(file_id, info)
+            return info
+
+        if not input_path or not os.path.exists(input_path):
+            return None
+
+        info, index = probe_media(input_path)
+        store_media_info(session, file_id, info, index)
+        return info
@@ -1,12 +1,21 @@
 import subprocess
 import os
+import struct
 from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+from app.services.ffmpeg_runner import ffmpeg_runner, KIND_ENCODE, KIND_COPY
+
+# sources already in this shape play in every browser as-is and only need a
+# remux (moov up front), not a re-encode
+BROWSER_SAFE_PROFILES = {"Baseline", "Constrained Baseline", "Main", "High"}
+BROWSER_SAFE_PIX_FMTS = {"yuv420p", "yuvj420p"}
 
 
 def generate_proxy_video(
     input_path: str,
     target_height: int = 480,
-    target_fps: int = 15
+    target_fps: int = 15,
+    on_progress: Optional[Callable[[float], None]] = None
 ) -> str:
     """
     generate downsampled proxy video for efficient analysis
@@ -24,6 +33,7 @@ def generate_proxy_video(
     proxy_dir.mkdir(exist_ok=True)
     
     proxy_path = proxy_dir / proxy_filename
+    partial_path = proxy_path.with_name(proxy_path.stem + ".part.mp4")
     
     # check if proxy already exists and is newer than source
     if proxy_path.exists():
@@ -47,27 +57,61 @@ def generate_proxy_video(
         "-crf", "28",  # quality (higher = smaller file)
         "-an",  # no audio (we extract separately)
         "-y",  # overwrite
-        str(proxy_path)
+        str(partial_path)  # renamed when done, a stopped encode never looks cached
     ]
     
     try:
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
+        ffmpeg_runner.run(cmd, kind=KIND_ENCODE, on_progress=on_progress)
+        os.replace(partial_path, proxy_path)
         print(f"✅ proxy generated: {proxy_path}")
         return str(proxy_path)
     except subprocess.CalledProcessError as e:
         print(f"error generating proxy: {e.stderr}")
+        _remove_partial(partial_path)
         # fallback: return original if proxy fails
         return str(input_path)
+    except BaseException:
+        # cancelled or timed out
+        _remove_partial(partial_path)
+        raise
+
+
+def get_playback_proxy_path(input_path: str) -> Path:
+    """
+    path of the browser playback proxy for an original (may not exist yet)
+    """
+    proxy_dir = Path(os.getenv("DATA_DIR", "/data")) / "playback_proxies"
+    return proxy_dir / (Path(input_path).stem + "_web.mp4")
+
+
+def is_playback_proxy_ready(input_path: str) -> bool:
+    """
+    True if a complete playback proxy exists and is newer than the source
+    
+    proxies are written to a .part file and renamed on success, so an
+    existing proxy path is never a half-written file
+    """
+    proxy_path = get_playback_proxy_path(input_path)
+    try:
+        if not proxy_path.exists() or proxy_path.stat().st_size == 0:
+            return False
+        return proxy_path.stat().st_mtime >= Path(input_path).stat().st_mtime
+    except OSError:
+        return False
 
 
 def generate_playback_proxy(
     input_path: str,
-    max_height: int = 1080
+    max_height: int = 1080,
+    on_progress: Optional[Callable[[float], None]] = None,
+    media_info: Optional[dict] = None
 ) -> str:
     """
     Generate browser-compatible proxy for smooth web playback.
     Always converts to H.264/AAC in MP4 container for browser compatibility.
     Scales down to max_height if larger.
+    With cached media_info no probe is run, and sources that are already
+    browser-safe H.264 are remuxed instead of re-encoded.
     
     Returns: path to proxy
     """
@@ -75,11 +119,11 @@ def generate_playback_proxy(
     
     # Always generate proxy with browser-compatible format
     # Even if resolution is OK, codec might not be (e.g. ProRes, HEVC in .mov)
-    proxy_filename = input_path_obj.stem + "_web.mp4"
-    proxy_dir = Path(os.getenv("DATA_DIR", "/data")) / "playback_proxies"
-    proxy_dir.mkdir(exist_ok=True)
+    proxy_path = get_playback_proxy_path(input_path)
+    proxy_path.parent.mkdir(exist_ok=True)
     
-    proxy_path = proxy_dir / proxy_filename
+    # ffmpeg writes here first; renamed into place only once complete
+    partial_path = proxy_path.with_name(proxy_path.stem + ".part.mp4")
     
     # Check cache
     if proxy_path.exists():
@@ -94,59 +138,57 @@ def generate_playback_proxy(
     
     print(f"Generating web-compatible playback proxy: {proxy_path}")
     
-    # Check original resolution to decide if we need to scale
-    probe_cmd = [
-        "ffprobe", "-v", "error",
-        "-select_streams", "v:0",
-        "-show_entries", "stream=height",
-        "-of", "csv=p=0",
-        str(input_path)
-    ]
+    if media_info:
+        remux, scale_filter = plan_playback_proxy(media_info, max_height)
+    else:
+        remux, scale_filter = False, _probe_scale_filter(input_path, max_height)
     
-    scale_filter = None
-    try:
-        result = subprocess.run(probe_cmd, capture_output=True, text=True, check=True)
-        original_height = int(result.stdout.strip())
-        if original_height > max_height:
-            scale_filter = f"scale=-2:{max_height}"
-            print(f"  Scaling from {original_height}p to {max_height}p")
-        else:
-            print(f"  Keeping original resolution ({original_height}p)")
-    except Exception as e:
-        print(f"  Could not detect resolution, will scale to {max_height}p: {e}")
-        scale_filter = f"scale=-2:{max_height}"
-    
-    # Build FFmpeg command
-    cmd = [
-        "ffmpeg",
-        "-i", str(input_path),
-    ]
-    
-    if scale_filter:
-        cmd.extend(["-vf", scale_filter])
-    
-    cmd.extend([
-        "-c:v", "libx264",           # H.264 video (universally supported)
-        "-profile:v", "high",        # H.264 high profile
-        "-level", "4.0",             # H.264 level 4.0 (widely supported)
-        "-preset", "veryfast",       # faster encoding (changed from "medium")
-        "-crf", "23",                # quality (18=visually lossless, 23=good, 28=acceptable)
-        "-pix_fmt", "yuv420p",       # pixel format for compatibility
-        "-c:a", "aac",               # AAC audio (universally supported)
-        "-b:a", "128k",              # audio bitrate
-        "-ar", "48000",              # audio sample rate
-        "-movflags", "+faststart",   # enable progressive streaming
-        "-y",                        # overwrite output
-        str(proxy_path)
-    ])
+    if remux:
+        print(f"  Source is browser-safe {media_info['video_codec']} ({media_info['height']}p), remuxing")
+        cmd = [
+            "ffmpeg",
+            "-i", str(input_path),
+            "-map", "0:v:0", "-map", "0:a:0?",
+            "-c", "copy",
+            "-movflags", "+faststart",
+            "-y",
+            str(partial_path)
+        ]
+        kind = KIND_COPY
+    else:
+        # Build FFmpeg command
+        cmd = [
+            "ffmpeg",
+            "-i", str(input_path),
+        ]
+        
+        if scale_filter:
+            cmd.extend(["-vf", scale_filter])
+        
+        cmd.extend([
+            "-c:v", "libx264",           # H.264 video (universally supported)
+            "-profile:v", "high",        # H.264 high profile
+            "-level", "4.0",             # H.264 level 4.0 (widely supported)
+            "-preset", "veryfast",       # faster encoding (changed from "medium")
+            "-crf", "23",                # quality (18=visually lossless, 23=good, 28=acceptable)
+            "-pix_fmt", "yuv420p",       # pixel format for compatibility
+            "-c:a", "aac",               # AAC audio (universally supported)
+            "-b:a", "128k",              # audio bitrate
+            "-ar", "48000",              # audio sample rate
+            "-movflags", "+faststart",   # enable progressive streaming
+            "-y",                        # overwrite output
+            str(partial_path)
+        ])
+        kind = KIND_ENCODE
     
     try:
         print(f"Running FFmpeg command: {' '.join(cmd)}")
-        result = subprocess.run(cmd, check=True, capture_output=True, text=True, timeout=900)  # 15 minutes
-        print(f"✅ Playback proxy generated: {proxy_path}")
+        result = ffmpeg_runner.run(cmd, kind=kind, on_progress=on_progress, timeout=900)  # 15 minutes
         
         # Verify the output file exists and has size > 0
-        if proxy_path.exists() and proxy_path.stat().st_size > 0:
+        if partial_path.exists() and partial_path.stat().st_size > 0:
+            os.replace(partial_path, proxy_path)
+            print(f"✅ Playback proxy generated: {proxy_path}")
             print(f"   File size: {proxy_path.stat().st_size} bytes")
             return str(proxy_path)
         else:
@@ -154,7 +196,8 @@ def generate_playback_proxy(
             raise Exception("Proxy file generation produced empty file")
             
     except subprocess.TimeoutExpired:
-        print(f"❌ FFmpeg timeout after 300 seconds")
+        print(f"❌ FFmpeg timeout after 900 seconds")
+        _remove_partial(partial_path)
         raise Exception("Video conversion timed out")
         
     except subprocess.CalledProcessError as e:
@@ -163,6 +206,132 @@ def generate_playback_proxy(
         print(f"   Return code: {e.returncode}")
         print(f"   stdout: {e.stdout}")
         print(f"   stderr: {e.stderr}")
+        _remove_partial(partial_path)
         raise Exception(f"FFmpeg failed: {e.stderr}")
+    
+    except BaseException:
+        # job cancelled / rq job timeout
+        _remove_partial(partial_path)
+        raise
 
 
+def plan_playback_proxy(media_info: dict, max_height: int) -> tuple:
+    """
+    decide how to build a playback proxy from cached media info
+
+    returns: (remux, scale_filter) - remux=True means stream copy is enough
+    """
+    # scaling happens after autorotation, so compare the displayed height
+    height = media_info["height"]
+    if media_info.get("rotation") in (90, 270):
+        height = media_info["width"]
+    
+    scale_filter = f"scale=-2:{max_height}" if height > max_height else None
+    
+    remux = (
+        scale_filter is None
+        and media_info.get("video_codec") == "h264"
+        and media_info.get("video_profile") in BROWSER_SAFE_PROFILES
+        and media_info.get("pix_fmt") in BROWSER_SAFE_PIX_FMTS
+        and (not media_info.get("has_audio") or media_info.get("audio_codec") == "aac")
+        and any(f in (media_info.get("format_name") or "") for f in ("mp4", "mov"))
+    )
+    return remux, scale_filter
+
+
+def _probe_scale_filter(input_path: str, max_height: int) -> Optional[str]:
+    """fallback when no media info is cached: probe the height"""
+    probe_cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=height",
+        "-of", "csv=p=0",
+        str(input_path)
+    ]
+    
+    try:
+        result = subprocess.run(probe_cmd, capture_output=True, text=True, check=True)
+        original_height = int(result.stdout.strip())
+        if original_height > max_height:
+            print(f"  Scaling from {original_height}p to {max_height}p")
+            return f"scale=-2:{max_height}"
+        print(f"  Keeping original resolution ({original_height}p)")
+        return None
+    except Exception as e:
+        print(f"  Could not detect resolution, will scale to {max_height}p: {e}")
+        return f"scale=-2:{max_height}"
+
+
+def _remove_partial(path: Path):
+    """best-effort removal of a half-written output"""
+    try:
+        if path.exists():
+            path.unlink()
+    except OSError as e:
+        print(f"could not remove partial output {path}: {e}")
+
+
+def mp4_layout(path) -> Optional[dict]:
+    """
+    byte layout of an mp4's top-level boxes: {"size", "metadata": [(first, last)], "mdat": (first, last)}
+
+    metadata is everything a player needs before it can seek (ftyp, moov, ...);
+    ranges are inclusive, like an http Range header
+    """
+    try:
+        size = os.path.getsize(path)
+        metadata, mdat = [], None
+        with open(path, "rb") as f:
+            offset = 0
+            while offset + 8 <= size:
+                f.seek(offset)
+                box_size, box_type = struct.unpack(">I4s", f.read(8))
+                if box_size == 1:
+                    box_size = struct.unpack(">Q", f.read(8))[0]
+                elif box_size == 0:
+                    box_size = size - offset
+                if box_size < 8:
+                    return None
+                box = (offset, min(offset + box_size, size) - 1)
+                if box_type == b"mdat":
+                    mdat = box
+                else:
+                    metadata.append(box)
+                offset += box_size
+    except (OSError, struct.error):
+        return None
+    if mdat is None:
+        return None
+    return {"size": size, "metadata": metadata, "mdat": mdat}
+
+
+def warm_byte_ranges(path, duration_ms: int, start_ms: int, end_ms: int, margin: float = 0.25) -> List[Tuple[int, int]]:
+    """
+    byte ranges of a playback proxy to fetch ahead so [start_ms, end_ms] plays at once
+
+    the metadata boxes exactly, plus the stretch of mdat the window should
+    fall in. proxies interleave audio and video, so that stretch is estimated
+    from the window's share of the duration, padded by margin of its length
+    on each side
+    """
+    layout = mp4_layout(path)
+    if layout is None or duration_ms <= 0:
+        return []
+
+    mdat_first, mdat_last = layout["mdat"]
+    span = mdat_last - mdat_first + 1
+    lo = max(0, start_ms) / duration_ms
+    hi = min(duration_ms, end_ms) / duration_ms
+    pad = (hi - lo) * margin
+    media = (
+        mdat_first + int(span * max(0.0, lo - pad)),
+        mdat_first + min(span - 1, int(span * min(1.0, hi + pad))),
+    )
+
+    merged = []
+    for first, last in sorted(layout["metadata"] + [media]):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
@@ -0,0 +1,393 @@
+import subprocess
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.ffmpeg_runner import ffmpeg_runner, KIND_ENCODE, KIND_COPY
+from app.video.frame_index import FrameIndex
+
+
+# ffprobe codec_name -> encoder used to rebuild boundary GOPs in the same codec
+ENCODERS = {
+    "h264": "libx264",
+    "hevc": "libx265",
+}
+
+# ffprobe profile names -> encoder -profile:v values
+PROFILES = {
+    "h264": {
+        "Baseline": "baseline",
+        "Constrained Baseline": "baseline",
+        "Main": "main",
+        "High": "high",
+        "High 10": "high10",
+        "High 4:2:2": "high422",
+        "High 4:4:4 Predictive": "high444",
+    },
+    "hevc": {
+        "Main": "main",
+        "Main 10": "main10",
+    },
+}
+
+# seek offsets (seconds), well under one frame even at 240fps:
+# stream copy seeks to the keyframe at/before -ss, so nudge past the keyframe
+# pts to survive rounding; re-encodes start at the first frame >= -ss, so
+# nudge before the keyframe pts instead
+COPY_SEEK_BIAS = 0.001
+ENCODE_SEEK_BIAS = -0.0005
+
+
+def probe_video_stream(input_path: str) -> dict:
+    """codec parameters of the first video stream (codec, profile, pix_fmt, level, rotation) + audio presence"""
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_entries", "stream=codec_type,codec_name,profile,pix_fmt,level:stream_tags=rotate:stream_side_data=rotation",
+        "-of", "json",
+        input_path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    streams = json.loads(result.stdout).get("streams", [])
+    video_streams = [s for s in streams if s.get("codec_type") == "video"]
+    if not video_streams:
+        raise ValueError(f"no video stream in {input_path}")
+
+    stream = video_streams[0]
+    # clockwise degrees, same convention as the legacy rotate tag
+    # (display matrix side data is counter-clockwise, hence the sign flip)
+    rotation = int(stream.get("tags", {}).get("rotate", 0) or 0)
+    for side_data in stream.get("side_data_list", []):
+        if "rotation" in side_data:
+            rotation = (-int(side_data["rotation"])) % 360
+
+    return {
+        "codec_name": stream.get("codec_name"),
+        "profile": stream.get("profile"),
+        "pix_fmt": stream.get("pix_fmt"),
+        "level": stream.get("level"),
+        "rotation": rotation,
+        "has_audio": any(s.get("codec_type") == "audio" for s in streams),
+    }
+
+
+def _encoder_args(stream: dict) -> list:
+    """encoder settings matching the source so re-encoded GOPs join the copied ones"""
+    codec = stream["codec_name"]
+    args = ["-c:v", ENCODERS.get(codec, "libx264"), "-preset", "veryfast", "-crf", "16"]
+
+    profile = PROFILES.get(codec, {}).get(stream.get("profile"))
+    if profile:
+        args += ["-profile:v", profile]
+    if stream.get("pix_fmt"):
+        args += ["-pix_fmt", stream["pix_fmt"]]
+    if codec == "h264" and stream.get("level") and int(stream["level"]) > 0:
+        level = int(stream["level"])
+        args += ["-level", f"{level // 10}.{level % 10}"]
+
+    return args
+
+
+# annex b nal unit types of the parameter sets a decoder configures itself from
+PARAMETER_SET_NALS = {
+    "h264": {7, 8},  # sps, pps
+    "hevc": {32, 33, 34},  # vps, sps, pps
+}
+
+# (input_path, mtime, encoder args) -> whether boundary encodes reproduce the source's parameter sets
+_compatibility = {}
+
+
+def _nal_type(codec: str, nal: bytes) -> int:
+    return (nal[0] >> 1) & 0x3f if codec == "hevc" else nal[0] & 0x1f
+
+
+def parameter_sets(codec: str, annexb: bytes) -> set:
+    """the sps/pps (and hevc vps) nal units in an annex b elementary stream"""
+    found = set()
+    for chunk in annexb.split(b"\x00\x00\x01"):
+        # a 4-byte start code leaves a zero on the previous chunk; trailing zeros aren't payload
+        nal = chunk.rstrip(b"\x00")
+        if nal and _nal_type(codec, nal) in PARAMETER_SET_NALS[codec]:
+            found.add(nal)
+    return found
+
+
+def _first_frame_annexb(input_path: str, seek_sec: float, codec: str, encoder_args: Optional[list] = None) -> bytes:
+    """one frame at seek_sec as an annex b elementary stream, stream copied or encoded with encoder_args"""
+    # a copy carries the source's parameter sets from its mp4 extradata, the bsf puts them in-band
+    codec_args = encoder_args or ["-c:v", "copy", "-bsf:v", f"{codec}_mp4toannexb"]
+    cmd = [
+        "ffmpeg", "-v", "error", "-noautorotate", "-ss", f"{seek_sec:.6f}", "-i", input_path,
+        "-map", "0:v:0", "-frames:v", "1", *codec_args,
+        "-f", codec, "pipe:1"
+    ]
+    return ffmpeg_runner.run(cmd, kind=KIND_ENCODE, text=False, timeout=120).stdout
+
+
+def boundary_encode_compatible(input_path: str, stream: dict, index: FrameIndex) -> bool:
+    """
+    whether re-encoded boundary GOPs can share one track with copied ones
+
+    an mp4 track has one avcC/hvcC, so the parameter sets the encoder writes
+    must be byte-for-byte the source's, or players decode the copied middle
+    with the wrong ones. checked once per source by encoding a single frame
+    and comparing against the source's own (cached per file + settings)
+    """
+    codec = stream["codec_name"]
+    if codec not in ENCODERS:
+        return False
+
+    encoder_args = _encoder_args(stream)
+    try:
+        cache_key = (input_path, os.path.getmtime(input_path), tuple(encoder_args))
+    except OSError:
+        cache_key = None
+    if cache_key in _compatibility:
+        return _compatibility[cache_key]
+
+    first_key = index.keyframe_at_or_after(0.0)
+    seek = first_key[0] if first_key else 0.0
+    try:
+        source = parameter_sets(codec, _first_frame_annexb(input_path, seek + COPY_SEEK_BIAS, codec))
+        encoded = parameter_sets(codec, _first_frame_annexb(input_path, seek, codec, encoder_args))
+        compatible = bool(source) and source == encoded
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+        print(f"[SMART CUT] could not compare parameter sets for {input_path}: {e}")
+        compatible = False
+
+    if not compatible:
+        fallback = "re-encoding whole clips" if settings.SMART_CUT_REENCODE_ON_MISMATCH else "stream copying from keyframes"
+        print(f"[SMART CUT] boundary encodes of {input_path} don't match the source's parameter sets, {fallback}")
+    if cache_key is not None:
+        _compatibility[cache_key] = compatible
+    return compatible
+
+
+def _piece_input(input_path: str, mode: str, seek_sec: float) -> list:
+    """input options for one piece; each piece seeks on its own so only its GOPs are read"""
+    if mode == "copy":
+        return ["-ss", f"{seek_sec + COPY_SEEK_BIAS:.6f}", "-i", input_path]
+    # keep pixels as stored, like the copied GOPs
+    return ["-noautorotate", "-ss", f"{max(seek_sec, 0):.6f}", "-i", input_path]
+
+
+def _piece_output(input_idx: int, mode: str, frames: int, stream: dict, out_path: str) -> list:
+    """output options writing `frames` video frames of one piece to an mpegts part"""
+    codec_args = ["-c:v", "copy"] if mode == "copy" else _encoder_args(stream)
+    return [
+        "-map", f"{input_idx}:v:0",
+        "-frames:v", str(frames),
+        *codec_args,
+        "-an",
+        "-f", "mpegts",
+        out_path
+    ]
+
+
+def _count_inputs(args: list) -> int:
+    """index the next "-i" will get in an ffmpeg argument list"""
+    return sum(1 for a in args if a == "-i")
+
+
+def plan_smart_cut(index: FrameIndex, start_sec: float, end_sec: float) -> list:
+    """
+    split [start, end) into re-encoded boundary pieces and a copied middle
+
+    returns: list of (mode, start_sec, frame_count) with mode "encode" or "copy";
+    a clip with no keyframe inside it is a single "encode" piece
+    """
+    first_key = index.keyframe_at_or_after(start_sec + ENCODE_SEEK_BIAS)
+    if first_key is None or first_key[0] >= end_sec:
+        return [("encode", start_sec, index.frames_between(start_sec, end_sec))]
+
+    k1 = first_key[0]
+    k2 = index.keyframe_at_or_before(end_sec)[0]
+    if index.frames_between(k2, end_sec) == 0:
+        # end lands exactly on a keyframe; that GOP belongs to the next clip
+        previous = index.keyframes_between(k1, k2)
+        k2 = float(previous[-1]) if len(previous) else k1
+
+    pieces = [
+        ("encode", start_sec, index.frames_between(start_sec, k1)),
+        ("copy", k1, index.frames_between(k1, k2)),
+        ("encode", k2, index.frames_between(k2, end_sec)),
+    ]
+    return [p for p in pieces if p[2] > 0]
+
+
+def _plan_cuts(ranges: List[Tuple[float, float]], index: FrameIndex, stream: dict, copy_ok: bool) -> list:
+    """
+    pieces per range; when boundary encodes can't join copied GOPs (copy_ok
+    False) a clip spanning a keyframe is one stream copy from the keyframe at
+    or before its start, like CLIP_RENDER_MODE=copy (or one accurate
+    re-encode with SMART_CUT_REENCODE_ON_MISMATCH)
+    """
+    plans = []
+    for start_sec, end_sec in ranges:
+        pieces = plan_smart_cut(index, start_sec, end_sec)
+        if not pieces:
+            raise ValueError(f"no frames between {start_sec:.3f}s and {end_sec:.3f}s")
+        if not copy_ok and len(pieces) > 1:
+            if settings.SMART_CUT_REENCODE_ON_MISMATCH:
+                pieces = [("encode", start_sec, index.frames_between(start_sec, end_sec))]
+            else:
+                key = index.keyframe_at_or_before(start_sec + COPY_SEEK_BIAS)[0]
+                pieces = [("copy", key, index.frames_between(key, end_sec))]
+        plans.append(pieces)
+    return plans
+
+
+@contextmanager
+def smart_cut_parts(
+    input_path: str,
+    ranges: List[Tuple[float, float]],
+    index: FrameIndex,
+    stream: Optional[dict] = None,
+    work_root: Optional[str] = None
+):
+    """
+    cut the pieces of several clips from one original into a temp dir
+
+    per clip, [start, first keyframe) and [last keyframe, end) are re-encoded
+    with the source codec/profile/pix_fmt/level and everything between is
+    stream copied, if those encodes reproduce the source's parameter sets
+    (boundary_encode_compatible); otherwise each clip is stream copied from
+    the keyframe at or before its start (see _plan_cuts).
+    all pieces (and the audio ranges) of all clips come out of a single
+    ffmpeg run, one process per batch instead of per clip. that run still
+    opens the original once per piece (one input-seeked -i each), but every
+    input only reads its own range's GOPs, never the whole file.
+
+    yields one dict per range (list_path, audio_path, pieces); the temp dir
+    is removed on exit, so mux/stream the clips inside the with block
+    """
+    stream = stream or probe_video_stream(input_path)
+    has_audio = stream.get("has_audio", True)
+    plans = _plan_cuts(ranges, index, stream, boundary_encode_compatible(input_path, stream, index))
+
+    work_dir = tempfile.mkdtemp(prefix="smartcut_", dir=work_root)
+    try:
+        inputs, outputs = [], []
+        parts = []
+        for c, ((start_sec, end_sec), pieces) in enumerate(zip(ranges, plans)):
+            part_paths = []
+            for i, (mode, piece_start, frames) in enumerate(pieces):
+                part_path = os.path.join(work_dir, f"clip_{c:03d}_part_{i:02d}.ts")
+                seek = piece_start if (mode == "copy" or i == 0) else piece_start + ENCODE_SEEK_BIAS
+                input_idx = _count_inputs(inputs)
+                inputs += _piece_input(input_path, mode, seek)
+                outputs += _piece_output(input_idx, mode, frames, stream, part_path)
+                part_paths.append(part_path)
+
+            list_path = os.path.join(work_dir, f"clip_{c:03d}.txt")
+            with open(list_path, "w") as f:
+                for part_path in part_paths:
+                    f.write(f"file '{part_path}'\n")
+
+            audio_path = None
+            if has_audio:
+                # from where the video starts: a keyframe-aligned copy starts before start_sec
+                audio_start = min(start_sec, pieces[0][1])
+                audio_path = os.path.join(work_dir, f"clip_{c:03d}_audio.mka")
+                input_idx = _count_inputs(inputs)
+                inputs += ["-ss", f"{audio_start:.6f}", "-t", f"{end_sec - audio_start:.6f}", "-i", input_path]
+                outputs += ["-map", f"{input_idx}:a:0", "-vn", "-c:a", "copy", "-f", "matroska", audio_path]
+
+            parts.append({"list_path": list_path, "audio_path": audio_path, "pieces": pieces, "stream": stream})
+
+        ffmpeg_runner.run(["ffmpeg", "-v", "error", "-y", *inputs, *outputs], kind=KIND_ENCODE)
+        yield parts
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _mux_io(part: dict, first_input_idx: int) -> Tuple[list, list]:
+    """(input args, output args minus the target) joining one clip's pieces + audio"""
+    stream = part["stream"]
+    inputs = []
+    if stream.get("rotation"):
+        # display matrix on the copied stream (the rotate metadata tag is ignored by current ffmpeg);
+        # -display_rotation is counter-clockwise, stream["rotation"] clockwise
+        inputs += ["-display_rotation", str((360 - stream["rotation"]) % 360)]
+    inputs += ["-f", "concat", "-safe", "0", "-i", part["list_path"]]
+    outputs = ["-map", f"{first_input_idx}:v:0"]
+    if part["audio_path"]:
+        inputs += ["-i", part["audio_path"]]
+        outputs += ["-map", f"{first_input_idx + 1}:a:0"]
+    outputs += ["-c", "copy"]
+    if stream["codec_name"] == "hevc":
+        outputs += ["-tag:v", "hvc1"]
+    return inputs, outputs
+
+
+def summarize_part(part: dict) -> dict:
+    """how many frames of a clip were copied vs re-encoded"""
+    pieces = part["pieces"]
+    return {
+        "mode": "smart",
+        "copied_frames": sum(frames for mode, _, frames in pieces if mode == "copy"),
+        "encoded_frames": sum(frames for mode, _, frames in pieces if mode == "encode"),
+        "pieces": len(pieces),
+    }
+
+
+def open_fragmented_stream(part: dict) -> subprocess.Popen:
+    """
+    mux one clip as fragmented MP4 to stdout
+
+    fragmented output needs no seek back to write the moov, so it can go
+    straight into an upload without ever landing on disk
+    """
+    inputs, outputs = _mux_io(part, 0)
+    cmd = [
+        "ffmpeg", "-v", "error",
+        *inputs, *outputs,
+        "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+        "-f", "mp4", "pipe:1"
+    ]
+    return ffmpeg_runner.popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def render_smart_cuts(
+    input_path: str,
+    cuts: List[Tuple[str, float, float]],
+    index: FrameIndex,
+    stream: Optional[dict] = None
+) -> List[dict]:
+    """
+    frame-accurate render of several clips from one original to files
+
+    cuts: list of (output_path, start_sec, end_sec)
+
+    pieces are cut by smart_cut_parts (one ffmpeg run, each piece seeking to
+    and reading only its own range), then a
+    second run joins each clip's pieces with the concat demuxer and muxes its
+    audio, again one ffmpeg for the whole batch
+
+    returns: per-cut summary of how many frames were copied vs re-encoded
+    """
+    if not cuts:
+        return []
+
+    ranges = [(start_sec, end_sec) for _, start_sec, end_sec in cuts]
+    work_root = os.path.dirname(cuts[0][0]) or None
+
+    with smart_cut_parts(input_path, ranges, index, stream, work_root) as parts:
+        inputs, outputs = [], []
+        for (output_path, _, _), part in zip(cuts, parts):
+            part_inputs, part_outputs = _mux_io(part, _count_inputs(inputs))
+            inputs += part_inputs
+            outputs += [*part_outputs, "-movflags", "+faststart", output_path]
+
+        ffmpeg_runner.run(["ffmpeg", "-v", "error", "-y", *inputs, *outputs], kind=KIND_COPY)
+
+    summaries = []
+    for (output_path, _, _), part in zip(cuts, parts):
+        summary = summarize_part(part)
+        print(f"[SMART CUT] {output_path}: {summary['copied_frames']} frames copied, {summary['encoded_frames']} re-encoded")
+        summaries.append(summary)
+    return summaries
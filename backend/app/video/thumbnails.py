@@ -0,0 +1,222 @@
+import subprocess
+import hashlib
+import json
+import math
+import os
+import shutil
+from pathlib import Path
+from typing import Optional
+
+from app.core.config import settings
+from app.services.ffmpeg_runner import ffmpeg_runner, KIND_DECODE
+
+
+# bump when any rendering parameter changes so old cache entries are ignored
+THUMBNAIL_VERSION = 1
+
+SPRITE_INTERVAL_SEC = 2.0
+SPRITE_TILE_WIDTH = 160
+SPRITE_COLUMNS = 10
+SPRITE_ROWS = 10
+POSTER_WIDTH = 480
+
+
+def thumbnail_cache_key(*parts) -> str:
+    """content-addressed cache key built from the source hash and render params"""
+    raw = "|".join(str(p) for p in parts)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def video_thumbnail_key(file_hash: str) -> str:
+    return thumbnail_cache_key(
+        "video", file_hash, THUMBNAIL_VERSION,
+        SPRITE_INTERVAL_SEC, SPRITE_TILE_WIDTH, SPRITE_COLUMNS, SPRITE_ROWS, POSTER_WIDTH
+    )
+
+
+def clip_thumbnail_key(file_hash: str, start_ms: int, end_ms: int) -> str:
+    return thumbnail_cache_key("clip", file_hash, start_ms, end_ms, THUMBNAIL_VERSION, POSTER_WIDTH)
+
+
+def get_thumbnail_dir(key: str) -> Path:
+    """cache directory for a key, sharded on the first two hex chars"""
+    return Path(settings.THUMBNAILS_DIR) / key[:2] / key
+
+
+def load_manifest(key: str) -> Optional[dict]:
+    """manifest of a finished cache entry, or None if it hasn't been built"""
+    manifest_path = get_thumbnail_dir(key) / "manifest.json"
+    if not manifest_path.exists():
+        return None
+    try:
+        return json.loads(manifest_path.read_text())
+    except Exception as e:
+        print(f"[THUMBS] unreadable manifest {manifest_path}: {e}")
+        return None
+
+
+def _analysis_proxy_path(input_path: str) -> Path:
+    """480p analysis proxy written by generate_proxy_video, if one exists"""
+    return Path(os.getenv("DATA_DIR", "/data")) / "proxies" / (Path(input_path).stem + "_proxy.mp4")
+
+
+def _publish(tmp_dir: Path, final_dir: Path, manifest: dict):
+    """write the manifest last and move the whole entry into place in one rename"""
+    (tmp_dir / "manifest.json").write_text(json.dumps(manifest))
+    final_dir.parent.mkdir(parents=True, exist_ok=True)
+    if final_dir.exists():
+        # another build won the race, keep its output
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return
+    os.replace(tmp_dir, final_dir)
+
+
+def build_sprite_vtt(count: int, duration_sec: float, tile_width: int, tile_height: int, sprite_names: list) -> str:
+    """WebVTT index mapping each interval to its tile (media fragment #xywh)"""
+    per_sheet = SPRITE_COLUMNS * SPRITE_ROWS
+    lines = ["WEBVTT", ""]
+
+    def ts(sec: float) -> str:
+        ms = int(round(sec * 1000))
+        h, rem = divmod(ms, 3600_000)
+        m, rem = divmod(rem, 60_000)
+        s, ms = divmod(rem, 1000)
+        return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}"
+
+    for i in range(count):
+        start = i * SPRITE_INTERVAL_SEC
+        end = min((i + 1) * SPRITE_INTERVAL_SEC, duration_sec)
+        sheet, idx = divmod(i, per_sheet)
+        if sheet >= len(sprite_names):
+            break
+        x = (idx % SPRITE_COLUMNS) * tile_width
+        y = (idx // SPRITE_COLUMNS) * tile_height
+        lines.append(f"{ts(start)} --> {ts(end)}")
+        lines.append(f"{sprite_names[sheet]}#xywh={x},{y},{tile_width},{tile_height}")
+        lines.append("")
+
+    return "\n".join(lines)
+
+
+def generate_video_thumbnails(input_path: str, file_hash: str, duration_ms: int) -> dict:
+    """
+    extract poster frame + scrub sprite sheets + WebVTT index for a video
+
+    one decode: the (low-res analysis proxy if present, else original) stream
+    is split into a poster branch and a fixed-interval tile branch in a single
+    ffmpeg filter graph
+
+    returns: manifest dict
+    """
+    key = video_thumbnail_key(file_hash)
+    existing = load_manifest(key)
+    if existing:
+        return existing
+
+    source = _analysis_proxy_path(input_path)
+    source_path = str(source) if source.exists() else input_path
+
+    duration_sec = max(duration_ms / 1000.0, 0.001)
+    poster_sec = duration_sec * 0.1
+    count = max(1, math.ceil(duration_sec / SPRITE_INTERVAL_SEC))
+
+    final_dir = get_thumbnail_dir(key)
+    tmp_dir = final_dir.with_name(f"{key}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    filter_graph = (
+        f"[0:v]split=2[a][b];"
+        f"[a]fps=1/{SPRITE_INTERVAL_SEC},scale={SPRITE_TILE_WIDTH}:-2,"
+        f"tile={SPRITE_COLUMNS}x{SPRITE_ROWS}[sheets];"
+        f"[b]trim=start={poster_sec:.3f},scale={POSTER_WIDTH}:-2[poster]"
+    )
+
+    cmd = [
+        "ffmpeg", "-v", "error", "-y",
+        "-i", source_path,
+        "-filter_complex", filter_graph,
+        "-map", "[poster]", "-frames:v", "1", "-q:v", "3", str(tmp_dir / "poster.jpg"),
+        "-map", "[sheets]", "-q:v", "5", str(tmp_dir / "sprite_%03d.jpg"),
+    ]
+
+    print(f"[THUMBS] generating thumbnails for {input_path} from {source_path}")
+    try:
+        ffmpeg_runner.run(cmd, kind=KIND_DECODE)
+    except subprocess.CalledProcessError as e:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        print(f"[THUMBS] ffmpeg error: {e.stderr}")
+        raise
+
+    sprite_names = sorted(p.name for p in tmp_dir.glob("sprite_*.jpg"))
+    if not sprite_names:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise Exception(f"no sprite sheets produced for {input_path}")
+
+    # tile filter pads every sheet to the full grid, so any sheet gives the tile size
+    import cv2
+    sheet = cv2.imread(str(tmp_dir / sprite_names[0]))
+    tile_width = sheet.shape[1] // SPRITE_COLUMNS
+    tile_height = sheet.shape[0] // SPRITE_ROWS
+
+    (tmp_dir / "sprites.vtt").write_text(
+        build_sprite_vtt(count, duration_sec, tile_width, tile_height, sprite_names)
+    )
+
+    manifest = {
+        "key": key,
+        "poster": "poster.jpg" if (tmp_dir / "poster.jpg").exists() else None,
+        "vtt": "sprites.vtt",
+        "sprites": sprite_names,
+        "interval_sec": SPRITE_INTERVAL_SEC,
+        "tile_width": tile_width,
+        "tile_height": tile_height,
+        "columns": SPRITE_COLUMNS,
+        "rows": SPRITE_ROWS,
+        "count": count,
+    }
+    _publish(tmp_dir, final_dir, manifest)
+    print(f"[THUMBS] ✅ {len(sprite_names)} sprite sheets, {count} tiles -> {final_dir}")
+    return load_manifest(key) or manifest
+
+
+def generate_clip_poster(input_path: str, file_hash: str, start_ms: int, end_ms: int) -> dict:
+    """
+    extract a single poster frame from the middle of a clip range
+
+    returns: manifest dict
+    """
+    key = clip_thumbnail_key(file_hash, start_ms, end_ms)
+    existing = load_manifest(key)
+    if existing:
+        return existing
+
+    mid_sec = (start_ms + (end_ms - start_ms) / 2) / 1000.0
+
+    final_dir = get_thumbnail_dir(key)
+    tmp_dir = final_dir.with_name(f"{key}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    cmd = [
+        "ffmpeg", "-v", "error",
+        "-ss", f"{mid_sec:.3f}",
+        "-i", input_path,
+        "-frames:v", "1",
+        "-vf", f"scale={POSTER_WIDTH}:-2",
+        "-q:v", "3",
+        "-an",
+        "-y",
+        str(tmp_dir / "poster.jpg")
+    ]
+
+    try:
+        ffmpeg_runner.run(cmd, kind=KIND_DECODE)
+    except subprocess.CalledProcessError as e:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        print(f"[THUMBS] ffmpeg error: {e.stderr}")
+        raise
+
+    manifest = {"key": key, "poster": "poster.jpg"}
+    _publish(tmp_dir, final_dir, manifest)
+    return load_manifest(key) or manifest
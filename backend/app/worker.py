@@ -1,324 +1,544 @@
 from app.core.db import engine
 from sqlmodel import Session, select
 from app.models import OriginalFile, CandidateSegment, FinalClip, Person, Trick
-from app.services.ffmpeg import get_video_metadata
+from app.services.ffmpeg import metadata_from_media_info
 from app.services.drive import drive_service
 from app.services.drive_sync import drive_sync
 from app.services.job_tracker import start_job, complete_job, fail_job, update_job_progress
 from app.services.log_publisher import publish_log
+from app.services.proxy_coordinator import proxy_coordinator
+from app.services.ffmpeg_runner import ffmpeg_runner, job_progress, KIND_COPY
+from app.services.admission import admission, cpu_count, available_memory_mb, download_bytes, read_proc_int
+from app.core.errors import is_transient, TransientError
 from app.core.config import settings
 import os
+import signal
 import subprocess
+import time
 from datetime import datetime
+from uuid import UUID
 from rq import get_current_job
 
 def analyze_original_file(file_id):
+    """
+    submit a file to the analysis scheduler (see services/analysis_pipeline)
+
+    kept as a job so analyses queued before the split still run
+    """
+    from app.services.analysis_pipeline import enqueue_analysis
+    
+    current_job = get_current_job()
+    if current_job:
+        start_job(current_job.id)
+    enqueue_analysis(UUID(str(file_id)))
+    if current_job:
+        complete_job(current_job.id)
+
+def _source_stream(original: OriginalFile):
+    """codec params for smart cut from the cached media info (None -> smart cut probes)"""
+    try:
+        from app.video.media_info import get_media_info, video_stream_params
+        media = get_media_info(original.id, original.stored_path)
+        return video_stream_params(media) if media else None
+    except Exception as e:
+        print(f"warning: media info unavailable for {original.id}: {e}")
+        return None
+
+def _render_clips(original: OriginalFile, clips: list) -> dict:
+    """
+    render clips of one original to FINAL_CLIPS_DIR
+
+    smart mode renders every clip in one ffmpeg pass over the original
+    returns: {clip.id: output_path}
+    """
+    outputs = {clip.id: os.path.join(settings.FINAL_CLIPS_DIR, clip.filename) for clip in clips}
+    
+    # smart cut: exact trim points, only the boundary GOPs are re-encoded
+    from app.video.frame_index import get_frame_index
+    index = get_frame_index(original.id, original.stored_path) if settings.CLIP_RENDER_MODE == "smart" else None
+    
+    if index is not None:
+        from app.video.smart_cut import render_smart_cuts
+        cuts = [(outputs[clip.id], clip.start_ms / 1000.0, clip.end_ms / 1000.0) for clip in clips]
+        summaries = render_smart_cuts(original.stored_path, cuts, index, _source_stream(original))
+        print(f"rendered {len(clips)} clip(s) with smart cut: {summaries}")
+        return outputs
+    
+    for clip in clips:
+        start_sec = clip.start_ms / 1000.0
+        duration_sec = (clip.end_ms - clip.start_ms) / 1000.0
+        
+        # render clip using ffmpeg (keyframe-aligned stream copy)
+        cmd = [
+            "ffmpeg",
+            "-ss", str(start_sec),
+            "-i", original.stored_path,
+            "-t", str(duration_sec),
+            "-c", "copy",
+            "-y",
+            outputs[clip.id]
+        ]
+        print(f"rendering clip: {' '.join(cmd)}")
+        ffmpeg_runner.run(cmd, kind=KIND_COPY)
+    return outputs
+
+def _drive_target(session: Session, clip: FinalClip) -> dict:
+    """drive folder parts for a clip: year / date_session / personTricks / trick"""
+    person = session.get(Person, clip.person_id) if clip.person_id else None
+    trick = session.get(Trick, clip.trick_id) if clip.trick_id else None
+    
+    return {
+        'year': clip.date.strftime("%Y"),
+        'date_description': f"{clip.date.strftime('%Y-%m-%d')}_{clip.session_name}",
+        'person_slug': person.slug if person else "BROLL",
+        'trick_name': trick.name if trick else "BROLL",
+    }
+
+def _record_upload(session: Session, clip: FinalClip, original: OriginalFile, drive_result: dict):
+    """store the drive location on the clip and queue its poster"""
+    if not drive_result:
+        print("⚠️ drive upload skipped (not configured)")
+        raise Exception("drive service not configured")
+    
+    clip.drive_file_id = drive_result['drive_file_id']
+    clip.drive_url = drive_result['drive_url']
+    clip.is_uploaded_to_drive = True
+    session.add(clip)
+    session.commit()
+    publish_log('worker', 'SUCCESS', f'🎉 clip uploaded to drive successfully!', {
+        'drive_file_id': drive_result['drive_file_id'][:20] + '...',
+        'filename': clip.filename
+    })
+    print(f"✅ uploaded to drive successfully!")
+    print(f"   file id: {drive_result['drive_file_id']}")
+    print(f"   url: {drive_result['drive_url']}")
+    
+    # poster frame for the clip library (original is guaranteed local right now)
+    try:
+        from app.services.thumbnail_service import thumbnail_service
+        thumbnail_service.request_clip_poster(clip, original)
+    except Exception as e:
+        print(f"warning: could not queue clip poster: {e}")
+
+def _upload_rendered_clip(session: Session, clip: FinalClip, original: OriginalFile, output_path: str):
+    """upload a rendered clip to drive, record it on the clip and drop the local copy"""
+    target = _drive_target(session, clip)
+    
+    # verify file exists before upload
+    if not os.path.exists(output_path):
+        raise Exception(f"rendered file not found: {output_path}")
+    
+    file_size_mb = os.path.getsize(output_path) / (1024 * 1024)
+    publish_log('worker', 'INFO', f'☁️  uploading to drive: {clip.filename} ({file_size_mb:.2f} MB)', {
+        'filename': clip.filename,
+        'size_mb': round(file_size_mb, 2),
+        'year': target['year'],
+        'person': target['person_slug'],
+        'trick': target['trick_name']
+    })
+    print(f"uploading clip to drive: {clip.filename} ({file_size_mb:.2f} MB)")
+    print(f"  year: {target['year']}")
+    print(f"  date: {target['date_description']}")
+    print(f"  person: {target['person_slug']}")
+    print(f"  trick: {target['trick_name']}")
+    
+    # upload to drive with OAuth
+    drive_result = drive_service.upload_file(
+        local_path=output_path,
+        filename=clip.filename,
+        db_session=session,
+        **target
+    )
+    _record_upload(session, clip, original, drive_result)
+    
+    # delete local file to save VM storage
+    try:
+        os.remove(output_path)
+        print(f"deleted local file: {output_path}")
+    except Exception as e:
+        print(f"warning: could not delete local file: {e}")
+
+def _stream_to_drive(session: Session, clip: FinalClip, original: OriginalFile, proc: subprocess.Popen):
+    """
+    upload ffmpeg's fragmented MP4 stdout straight to drive, no local clip file
+
+    the upload is only finalized once ffmpeg exited cleanly, so a failed
+    render leaves an abandoned resumable session rather than a broken clip
+    """
+    target = _drive_target(session, clip)
+    publish_log('worker', 'INFO', f'☁️  streaming to drive: {clip.filename}', {
+        'filename': clip.filename,
+        'year': target['year'],
+        'person': target['person_slug'],
+        'trick': target['trick_name']
+    })
+    
+    def check_ffmpeg():
+        if proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, "ffmpeg", stderr=proc.stderr.read().decode(errors="replace"))
+    
+    try:
+        drive_result = drive_service.upload_stream(
+            proc.stdout,
+            filename=clip.filename,
+            db_session=session,
+            before_last_chunk=check_ffmpeg,
+            **target
+        )
+        if drive_result is not None:
+            check_ffmpeg()
+    except Exception:
+        # an upload that died because ffmpeg did should report ffmpeg's error
+        if proc.poll() not in (None, 0):
+            check_ffmpeg()
+        raise
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+    
+    _record_upload(session, clip, original, drive_result)
+
+def _stream_clips_to_drive(session: Session, original: OriginalFile, clips: list, on_clip_done=None) -> list:
+    """
+    render clips of one original and stream each straight into a drive upload
+
+    smart cut pieces for the whole batch are still cut in one pass (small temp
+    parts), then each clip is muxed to a pipe while it uploads
+    returns: list of ("filename: error", exception) for clips that failed
+    """
+    from app.video.frame_index import get_frame_index
+    index = get_frame_index(original.id, original.stored_path) if settings.CLIP_RENDER_MODE == "smart" else None
+    
+    failed = []
+    
+    def stream_one(i, clip, open_proc):
+        try:
+            _stream_to_drive(session, clip, original, open_proc())
+        except Exception as e:
+            session.rollback()
+            print(f"error streaming {clip.filename}: {e}")
+            failed.append((f"{clip.filename}: {getattr(e, 'stderr', None) or e}", e))
+        if on_clip_done:
+            on_clip_done(i)
+    
+    if index is not None:
+        from app.video.smart_cut import smart_cut_parts, open_fragmented_stream, summarize_part
+        ranges = [(clip.start_ms / 1000.0, clip.end_ms / 1000.0) for clip in clips]
+        stream = _source_stream(original)
+        with smart_cut_parts(original.stored_path, ranges, index, stream, work_root=settings.FINAL_CLIPS_DIR) as parts:
+            for i, (clip, part) in enumerate(zip(clips, parts)):
+                print(f"streaming {clip.filename} with smart cut: {summarize_part(part)}")
+                stream_one(i, clip, lambda part=part: open_fragmented_stream(part))
+        return failed
+    
+    for i, clip in enumerate(clips):
+        # keyframe-aligned stream copy, fragmented so it can be piped
+        cmd = [
+            "ffmpeg", "-v", "error",
+            "-ss", str(clip.start_ms / 1000.0),
+            "-i", original.stored_path,
+            "-t", str((clip.end_ms - clip.start_ms) / 1000.0),
+            "-c", "copy",
+            "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+            "-f", "mp4", "pipe:1"
+        ]
+        print(f"streaming clip: {' '.join(cmd)}")
+        stream_one(i, clip, lambda cmd=cmd: ffmpeg_runner.popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE))
+    return failed
+
+def _copy_cached_clips(session: Session, original: OriginalFile, clips: list) -> list:
+    """
+    render cache: clips whose clip_hash was already uploaded get a drive-side copy
+
+    returns: the clips that still need rendering (no cached copy, or the copy failed)
+    """
+    from app.services.render_cache import compute_clip_hash, find_rendered_clip
+    
+    remaining = []
+    for clip in clips:
+        if not clip.clip_hash:
+            clip.clip_hash = compute_clip_hash(original.file_hash, clip.start_ms, clip.end_ms)
+            session.add(clip)
+            session.commit()
+        
+        source = find_rendered_clip(session, clip.clip_hash, exclude_id=clip.id)
+        if not source:
+            remaining.append(clip)
+            continue
+        
+        try:
+            print(f"[RENDER CACHE] {clip.filename}: reusing render of {source.filename}")
+            drive_result = drive_service.copy_file(
+                source.drive_file_id,
+                filename=clip.filename,
+                db_session=session,
+                **_drive_target(session, clip)
+            )
+            _record_upload(session, clip, original, drive_result)
+        except Exception as e:
+            # e.g. the cached file was removed from drive: just render again
+            session.rollback()
+            print(f"[RENDER CACHE] copy failed for {clip.filename}, rendering instead: {e}")
+            remaining.append(clip)
+    return remaining
+
+def _deliver_clips(session: Session, original: OriginalFile, clips: list, on_clip_done=None) -> list:
+    """
+    get clips of one original onto drive: cached copies first, then one render batch
+
+    identical clips inside the batch render once; the rest copy that upload
+    returns: list of ("filename: error", exception) for clips that failed
+    """
+    to_render = []
+    repeats = []
+    seen_hashes = set()
+    for clip in _copy_cached_clips(session, original, clips):
+        (repeats if clip.clip_hash in seen_hashes else to_render).append(clip)
+        seen_hashes.add(clip.clip_hash)
+    
+    if to_render:
+        failed = _render_and_upload(session, original, to_render, on_clip_done)
+    else:
+        failed = []
+    
+    if repeats:
+        # second pass hits the renders uploaded above; leftovers render normally
+        leftovers = _copy_cached_clips(session, original, repeats)
+        if leftovers:
+            failed += _render_and_upload(session, original, leftovers)
+    return failed
+
+def _render_and_upload(session: Session, original: OriginalFile, clips: list, on_clip_done=None) -> list:
+    """render + upload clips (streamed or via FINAL_CLIPS_DIR); returns failures"""
+    if settings.CLIP_UPLOAD_MODE == "stream":
+        return _stream_clips_to_drive(session, original, clips, on_clip_done=on_clip_done)
+    
+    outputs = _render_clips(original, clips)
+    publish_log('worker', 'SUCCESS', f'✅ {len(clips)} clip(s) rendered successfully')
+    
+    failed = []
+    for i, clip in enumerate(clips):
+        try:
+            _upload_rendered_clip(session, clip, original, outputs[clip.id])
+        except Exception as e:
+            session.rollback()
+            print(f"error uploading {clip.filename}: {e}")
+            failed.append((f"{clip.filename}: {e}", e))
+        if on_clip_done:
+            on_clip_done(i)
+    return failed
+
+def render_and_upload_clip(final_clip_id):
+    """render + upload a single clip (save_clip now batches via render_clip_batch)"""
     # get current RQ job for tracking
     current_job = get_current_job()
     
     with Session(engine) as session:
-        file = session.get(OriginalFile, file_id)
-        if not file:
-            return
-        
         try:
             # track job start
             if current_job:
                 start_job(current_job.id)
-            
-            # update status to analyzing
-            file.processing_status = "analyzing"
-            file.analysis_progress_percent = 10
-            session.add(file)
-            session.commit()
-            
-            if current_job:
                 update_job_progress(current_job.id, 10)
             
-            # check if new detection pipeline is enabled
-            # always use stage 1 detection (motion + audio)
-            from app.detection.config import DetectionConfig
-            config = DetectionConfig()
-            
-            publish_log('worker', 'INFO', f'🎬 starting analysis: {file.original_filename}')
-            print(f"[DETECTION] starting stage 1 detection for {file.original_filename}")
-            
-            # generate proxy video for efficient analysis
-            from app.video.proxy_utils import generate_proxy_video, generate_playback_proxy
-            publish_log('worker', 'INFO', '🔄 generating analysis proxy (720p)...')
-            proxy_path = generate_proxy_video(file.stored_path)
+            clip = session.get(FinalClip, final_clip_id)
+            if not clip:
+                print(f"FinalClip {final_clip_id} not found")
+                return
+                
+            original = clip.original_file
+            duration_sec = (clip.end_ms - clip.start_ms) / 1000.0
             
-            # ALSO generate playback proxy now (so it's ready for sorting)
-            publish_log('worker', 'INFO', '🎥 pre-generating playback proxy for web...')
-            print(f"[DETECTION] pre-generating playback proxy for web...")
-            try:
-                playback_proxy = generate_playback_proxy(file.stored_path, max_height=1080)
-                publish_log('worker', 'SUCCESS', f'✅ playback proxy ready: {os.path.basename(playback_proxy)}')
-                print(f"[DETECTION] ✅ playback proxy ready: {playback_proxy}")
-            except Exception as e:
-                publish_log('worker', 'WARNING', f'⚠️  playback proxy generation failed: {str(e)}')
-                print(f"[DETECTION] ⚠️ playback proxy generation failed: {e}")
+            publish_log('worker', 'INFO', f'🎬 rendering clip: {clip.filename} ({duration_sec:.1f}s)')
+            failed = _deliver_clips(session, original, [clip])
+            if failed:
+                message, error = failed[0]
+                raise Exception(message) from error
             
+            # track job completion
+            if current_job:
+                complete_job(current_job.id)
+                
+        except subprocess.CalledProcessError as e:
+            print(f"error rendering clip: {e.stderr}")
+            if current_job:
+                fail_job(current_job.id, f"ffmpeg error: {e.stderr}")
+            raise
+        except Exception as e:
+            print(f"error in render/upload: {e}")
+            if current_job:
+                fail_job(current_job.id, str(e))
+            raise
+
+def render_clip_batch(original_file_id_str: str):
+    """
+    render every pending clip of one original from a single ffmpeg pass, then upload each
+
+    scheduled by render_coordinator on the first save for an original, a
+    short quiet window out so a sorting burst lands in the same batch
+    """
+    from app.services.render_coordinator import render_coordinator
+    
+    current_job = get_current_job()
+    original_file_id = UUID(original_file_id_str)
+    
+    with Session(engine) as session:
+        try:
             if current_job:
-                update_job_progress(current_job.id, 20)
+                start_job(current_job.id)
             
-            # stage 1: motion + audio analysis
-            from app.detection.stage1_motion import compute_motion_energy_timeseries
-            from app.detection.stage1_audio import compute_audio_energy_timeseries
-            from app.detection.stage1_candidates import find_candidate_windows
+            # a retry renders the batch the first attempt claimed (clips
+            # already uploaded are skipped below)
+            if current_job and "clip_ids" in current_job.meta:
+                clip_ids = [UUID(c) for c in current_job.meta["clip_ids"]]
+            else:
+                wait = render_coordinator.quiet_in(original_file_id)
+                if wait > 0:
+                    # the sorter is still saving from this video: look again
+                    # later rather than sleep in an interactive worker
+                    render_coordinator.schedule_batch(original_file_id, wait)
+                    if current_job:
+                        complete_job(current_job.id)
+                    return
+                clip_ids = render_coordinator.take_batch(original_file_id)
+                if current_job:
+                    current_job.meta["clip_ids"] = [str(c) for c in clip_ids]
+                    current_job.save_meta()
             
-            publish_log('worker', 'INFO', '📊 analyzing motion patterns (ORB keypoints + homography)...')
-            motion_times, motion_energy = compute_motion_energy_timeseries(proxy_path)
+            clips = [session.get(FinalClip, clip_id) for clip_id in clip_ids]
+            clips = [c for c in clips if c and not c.is_uploaded_to_drive]
+            if not clips:
+                print(f"[RENDER] nothing pending for original {original_file_id}")
+                if current_job:
+                    complete_job(current_job.id)
+                return
             
+            original = session.get(OriginalFile, original_file_id)
+            publish_log('worker', 'INFO', f'🎬 rendering {len(clips)} clip(s) from {original.original_filename}')
             if current_job:
-                update_job_progress(current_job.id, 40)
-            
-            publish_log('worker', 'INFO', '🔊 analyzing audio energy (impact detection)...')
-            audio_times, audio_energy = compute_audio_energy_timeseries(proxy_path)
+                update_job_progress(current_job.id, 10)
             
-            if current_job:
-                update_job_progress(current_job.id, 50)
+            def clip_done(i):
+                if current_job:
+                    update_job_progress(current_job.id, 10 + int(85 * (i + 1) / len(clips)))
             
-            candidate_windows = find_candidate_windows(
-                motion_times, motion_energy,
-                audio_times, audio_energy,
-                config
-            )
+            # one clip's upload failing shouldn't hold back the rest of the batch
+            failed = _deliver_clips(session, original, clips, on_clip_done=clip_done)
             
-            publish_log('worker', 'SUCCESS', f'✅ stage 1 complete: found {len(candidate_windows)} candidate windows')
-            print(f"[DETECTION] stage 1 produced {len(candidate_windows)} windows")
+            if failed:
+                message = f"{len(failed)}/{len(clips)} uploads failed: " + "; ".join(m for m, _ in failed)
+                # worth a retry of the batch only if every clip failed transiently
+                if all(is_transient(e) for _, e in failed):
+                    raise TransientError(message)
+                raise Exception(message)
             
-            # stage 2: ml scoring (if enabled and model available)
-            if config.use_ml_stage2:
-                from app.detection import get_highlight_model
-                
-                highlight_model = get_highlight_model()
+            if current_job:
+                complete_job(current_job.id)
                 
-                if highlight_model:
-                    print(f"[DETECTION] running stage 2 ml scoring...")
-                    
-                    filtered_windows = []
-                    for window in candidate_windows:
-                        # score with ml model
-                        ml_score = highlight_model.score_clip(
-                            proxy_path,
-                            window.start_sec,
-                            window.end_sec
-                        )
-                        
-                        # combine scores: weighted average
-                        final_score = (
-                            config.ml_weight * ml_score +
-                            config.stage1_weight * window.combined_score
-                        )
-                        
-                        # filter by ml threshold
-                        if final_score >= config.ml_threshold:
-                            window.ml_score = ml_score
-                            window.final_score = final_score
-                            filtered_windows.append(window)
-                    
-                    print(f"[DETECTION] stage 2 filtered to {len(filtered_windows)} windows")
-                    candidate_windows = filtered_windows
-                else:
-                    print(f"[DETECTION] ml model not available, using stage 1 only")
-            
-            # convert to segments format
-            segments_with_scores = [
-                (int(w.start_sec * 1000), int(w.end_sec * 1000), 
-                 getattr(w, 'final_score', w.combined_score))
-                for w in candidate_windows
-            ]
-            
-            file.analysis_progress_percent = 70
-            session.add(file)
-            session.commit()
-            
+        except subprocess.CalledProcessError as e:
+            print(f"error rendering batch: {e.stderr}")
             if current_job:
-                update_job_progress(current_job.id, 70)
-            
-            # create candidate segments with confidence scores
-            publish_log('worker', 'INFO', f'💾 saving {len(segments_with_scores)} segments to database...')
-            print(f"creating {len(segments_with_scores)} candidate segments in database")
+                fail_job(current_job.id, f"ffmpeg error: {e.stderr}")
+            raise
+        except Exception as e:
+            print(f"error in batch render/upload: {e}")
+            if current_job:
+                fail_job(current_job.id, str(e))
+            raise
+
+def generate_proxy_for_file(file_id_str: str):
+    """background worker job to generate a playback proxy for a single file"""
+    current_job = get_current_job()
+    
+    with Session(engine) as session:
+        file = session.get(OriginalFile, UUID(file_id_str))
+        if not file or not os.path.exists(file.stored_path):
+            # nothing to build from; without this /media would answer 202 until the marker expired
+            reason = f"file {file_id_str} not found" if not file else f"original file not found: {file.stored_path}"
+            print(f"[PROXY] {reason}")
+            proxy_coordinator.abandon(file_id_str, reason)
+            if current_job:
+                fail_job(current_job.id, reason)
+            return
+        
+        try:
+            if current_job:
+                start_job(current_job.id)
             
-            # determine detection method based on what was used
-            if config.use_ml_stage2:
-                detection_method = "motion_audio_ml"
-            else:
-                detection_method = "motion_audio_stage1"
-            
-            for start, end, confidence in segments_with_scores:
-                # ensure all values are python native types (not numpy)
-                seg = CandidateSegment(
-                    original_file_id=file.id,
-                    start_ms=int(start),
-                    end_ms=int(end),
-                    confidence_score=float(confidence),
-                    detection_method=detection_method
-                )
-                session.add(seg)
-            
-            print(f"segments added to session, committing...")
-            
-            # mark as completed
-            file.processing_status = "completed"
-            file.analysis_progress_percent = 100
-            session.add(file)
-            session.commit()
-            publish_log('worker', 'SUCCESS', f'🎉 analysis complete: {file.original_filename} - {len(segments_with_scores)} segments ready for sorting')
-            print(f"analyzed file {file_id}: found {len(segments_with_scores)} segments")
+            print(f"[PROXY] Generating playback proxy for: {file.original_filename}")
+            proxy_path = proxy_coordinator.build(
+                file.id, file.stored_path, max_height=1080,
+                on_progress=job_progress(current_job.id, 0, 99) if current_job else None
+            )
+            print(f"[PROXY] ✅ Success: {proxy_path}")
             
-            # track job completion
             if current_job:
                 complete_job(current_job.id)
-            
-            # if file came from drive (has drive_file_id), move to processed folder
-            if hasattr(file, 'drive_file_id') and file.drive_file_id:
-                print(f"moving raw video to processed folder in drive")
-                drive_sync.move_to_processed_folder(
-                    file.drive_file_id,
-                    file.original_filename,
-                    file.recorded_at
-                )
-            
-            # NOTE: do NOT delete original file here, it is needed for sorting
-            # cleanup will happen via StorageManager LRU eviction
-            
         except Exception as e:
-            # mark as failed
-            file.processing_status = "failed"
-            session.add(file)
-            session.commit()
-            print(f"error analyzing file {file_id}: {e}")
-            
-            # track job failure
+            print(f"[PROXY] ❌ Failed for {file.original_filename}: {e}")
+            import traceback
+            traceback.print_exc()
             if current_job:
                 fail_job(current_job.id, str(e))
             raise
 
-def render_and_upload_clip(final_clip_id):
-    # get current RQ job for tracking
+def generate_thumbnails_for_file(file_id_str: str):
+    """background worker job to build poster + scrub sprites for an original"""
+    from app.video.thumbnails import generate_video_thumbnails, video_thumbnail_key
+    from app.services.thumbnail_service import thumbnail_service
     current_job = get_current_job()
     
     with Session(engine) as session:
+        file = session.get(OriginalFile, UUID(file_id_str))
+        if not file:
+            print(f"File {file_id_str} not found")
+            return
+        
         try:
-            # track job start
             if current_job:
                 start_job(current_job.id)
-                update_job_progress(current_job.id, 10)
-            
-            clip = session.get(FinalClip, final_clip_id)
-            if not clip:
-                print(f"FinalClip {final_clip_id} not found")
-                return
-                
-            original = clip.original_file
-            
-            start_sec = clip.start_ms / 1000.0
-            duration_sec = (clip.end_ms - clip.start_ms) / 1000.0
-            
-            output_path = os.path.join(settings.FINAL_CLIPS_DIR, clip.filename)
             
-            # render clip using ffmpeg
-            cmd = [
-                "ffmpeg",
-                "-ss", str(start_sec),
-                "-i", original.stored_path,
-                "-t", str(duration_sec),
-                "-c", "copy",
-                "-y",
-                output_path
-            ]
-            
-            publish_log('worker', 'INFO', f'🎬 rendering clip: {clip.filename} ({duration_sec:.1f}s)')
-            print(f"rendering clip: {' '.join(cmd)}")
-            subprocess.run(cmd, check=True, capture_output=True)
-            publish_log('worker', 'SUCCESS', f'✅ clip rendered successfully')
-            print(f"rendered to {output_path}")
+            manifest = generate_video_thumbnails(file.stored_path, file.file_hash, file.duration_ms)
+            print(f"[THUMBS] ✅ thumbnails ready for {file.original_filename}: {manifest['key']}")
             
             if current_job:
-                update_job_progress(current_job.id, 50)
-            
-            # upload to google drive
-            year = clip.date.strftime("%Y")
-            date_description = f"{clip.date.strftime('%Y-%m-%d')}_{clip.session_name}"
-            
-            person = session.get(Person, clip.person_id) if clip.person_id else None
-            trick = session.get(Trick, clip.trick_id) if clip.trick_id else None
-            
-            person_slug = person.slug if person else "BROLL"
-            trick_name = trick.name if trick else "BROLL"
-            
-            # verify file exists before upload
-            if not os.path.exists(output_path):
-                raise Exception(f"rendered file not found: {output_path}")
-            
-            file_size_mb = os.path.getsize(output_path) / (1024 * 1024)
-            publish_log('worker', 'INFO', f'☁️  uploading to drive: {clip.filename} ({file_size_mb:.2f} MB)', {
-                'filename': clip.filename,
-                'size_mb': round(file_size_mb, 2),
-                'year': year,
-                'person': person_slug,
-                'trick': trick_name
-            })
-            print(f"uploading clip to drive: {clip.filename} ({file_size_mb:.2f} MB)")
-            print(f"  year: {year}")
-            print(f"  date: {date_description}")
-            print(f"  person: {person_slug}")
-            print(f"  trick: {trick_name}")
-            
-            # upload to drive with OAuth
-            drive_result = drive_service.upload_file(
-                local_path=output_path,
-                year=year,
-                date_description=date_description,
-                person_slug=person_slug,
-                trick_name=trick_name,
-                filename=clip.filename,
-                db_session=session
-            )
-            
+                complete_job(current_job.id)
+        except Exception as e:
+            print(f"[THUMBS] ❌ failed for {file.original_filename}: {e}")
             if current_job:
-                update_job_progress(current_job.id, 90)
-            
-            if drive_result:
-                clip.drive_file_id = drive_result['drive_file_id']
-                clip.drive_url = drive_result['drive_url']
-                clip.is_uploaded_to_drive = True
-                session.add(clip)
-                session.commit()
-                publish_log('worker', 'SUCCESS', f'🎉 clip uploaded to drive successfully!', {
-                    'drive_file_id': drive_result['drive_file_id'][:20] + '...',
-                    'filename': clip.filename
-                })
-                print(f"✅ uploaded to drive successfully!")
-                print(f"   file id: {drive_result['drive_file_id']}")
-                print(f"   url: {drive_result['drive_url']}")
-                
-                # delete local file to save VM storage
-                try:
-                    os.remove(output_path)
-                    print(f"deleted local file: {output_path}")
-                except Exception as e:
-                    print(f"warning: could not delete local file: {e}")
-            else:
-                print("⚠️ drive upload skipped (not configured)")
-                raise Exception("drive service not configured")
+                fail_job(current_job.id, str(e))
+            raise
+        finally:
+            thumbnail_service.clear_pending(video_thumbnail_key(file.file_hash))
+
+def generate_thumbnail_for_clip(clip_id_str: str):
+    """background worker job to build the poster frame for a final clip"""
+    from app.video.thumbnails import generate_clip_poster, clip_thumbnail_key
+    from app.services.thumbnail_service import thumbnail_service
+    current_job = get_current_job()
+    
+    with Session(engine) as session:
+        clip = session.get(FinalClip, UUID(clip_id_str))
+        if not clip:
+            print(f"FinalClip {clip_id_str} not found")
+            return
+        
+        original = clip.original_file
+        try:
+            if current_job:
+                start_job(current_job.id)
+            
+            generate_clip_poster(original.stored_path, original.file_hash, clip.start_ms, clip.end_ms)
             
-            # track job completion
             if current_job:
                 complete_job(current_job.id)
-                
-        except subprocess.CalledProcessError as e:
-            print(f"error rendering clip: {e.stderr}")
-            if current_job:
-                fail_job(current_job.id, f"ffmpeg error: {e.stderr}")
-            raise
         except Exception as e:
-            print(f"error in render/upload: {e}")
+            print(f"[THUMBS] ❌ clip poster failed for {clip.filename}: {e}")
             if current_job:
                 fail_job(current_job.id, str(e))
             raise
+        finally:
+            thumbnail_service.clear_pending(clip_thumbnail_key(original.file_hash, clip.start_ms, clip.end_ms))
 
 def download_and_process_from_drive(drive_file_id: str, filename: str, file_size: int):
     """download video from drive dump folder and queue for analysis"""
@@ -344,6 +564,10 @@ def download_and_process_from_drive(drive_file_id: str, filename: str, file_size
             
             if existing:
                 print(f"video already downloaded: {filename}")
+                if existing.processing_status == "pending":
+                    # an earlier attempt died between registering it and queueing the analysis
+                    from app.services.analysis_pipeline import enqueue_analysis
+                    enqueue_analysis(existing.id)
                 if current_job:
                     complete_job(current_job.id)
                 return
@@ -364,8 +588,10 @@ def download_and_process_from_drive(drive_file_id: str, filename: str, file_size
             if current_job:
                 update_job_progress(current_job.id, 40)
             
-            # extract metadata
-            meta = get_video_metadata(dest_path)
+            # extract metadata: one probe covers streams, codecs and GOP structure
+            from app.video.media_info import probe_media, store_media_info
+            media, frame_index = probe_media(dest_path)
+            meta = metadata_from_media_info(media)
             
             # compute file hash for deduplication
             sha256_hash = hashlib.sha256()
@@ -402,6 +628,7 @@ def download_and_process_from_drive(drive_file_id: str, filename: str, file_size
             session.add(db_file)
             session.commit()
             session.refresh(db_file)
+            store_media_info(session, db_file.id, media, frame_index)
             
             publish_log('worker', 'SUCCESS', f'✅ video registered in database: {filename}')
             print(f"downloaded and registered: {filename}")
@@ -409,10 +636,12 @@ def download_and_process_from_drive(drive_file_id: str, filename: str, file_size
             if current_job:
                 update_job_progress(current_job.id, 60)
             
-            # queue analysis with extended timeout (video analysis takes time)
-            from app.services.queue import enqueue_job
-            enqueue_job(analyze_original_file, db_file.id, file_id=db_file.id, timeout='2h')
-            publish_log('worker', 'INFO', f'📋 queued analysis job for: {filename}')
+            # hand it to the analysis scheduler (shortest predicted job first)
+            from app.services.analysis_pipeline import enqueue_analysis
+            queued = enqueue_analysis(db_file.id)
+            if queued:
+                eta = f", predicted {queued['predicted']['total_seconds'] / 60:.0f} min"
+                publish_log('worker', 'INFO', f'📋 queued analysis for: {filename} (position {queued["position"]}{eta})')
             
             if current_job:
                 complete_job(current_job.id)
@@ -427,7 +656,7 @@ def download_and_process_from_drive(drive_file_id: str, filename: str, file_size
 def drive_sync_poller():
     """background worker that polls drive every 2 minutes"""
     import time
-    from app.services.queue import enqueue_job, queue
+    from app.services.queue import enqueue_unique
     from app.services.log_publisher import publish_log
     
     publish_log('drive-sync', 'INFO', '🔄 Drive sync poller started')
@@ -438,6 +667,13 @@ def drive_sync_poller():
             publish_log('drive-sync', 'INFO', '📡 Polling Drive dump folder...')
             print("📡 Polling Drive dump folder...")
             
+            # safety net: start analyses whose slot was freed by a worker that died
+            try:
+                from app.services.analysis_pipeline import dispatch_analyses
+                dispatch_analyses()
+            except Exception as e:
+                print(f"⚠️  analysis dispatch failed: {e}")
+            
             videos = drive_sync.get_download_queue()
             
             if videos:
@@ -448,24 +684,20 @@ def drive_sync_poller():
                 print(f"✅ Found {len(videos)} new videos, queuing downloads")
                 
                 for video in videos:
-                    # check if job already queued
-                    drive_file_id = video['id']
-                    existing_job_queued = False
+                    # one SET NX per video: skips downloads already queued or running
+                    job = enqueue_unique(
+                        download_and_process_from_drive,
+                        video['id'],
+                        video['id'],
+                        video['name'],
+                        int(video.get('size', 0)),
+                        timeout='2h',
+                        reserve_bytes=download_bytes(int(video.get('size', 0)))
+                    )
                     
-                    for job in queue.jobs:
-                        if job.args and len(job.args) > 0 and job.args[0] == drive_file_id:
-                            print(f"  ⏭️  Job already queued for {video['name']}, skipping")
-                            existing_job_queued = True
-                            break
-                    
-                    if not existing_job_queued:
-                        enqueue_job(
-                            download_and_process_from_drive,
-                            video['id'],
-                            video['name'],
-                            int(video.get('size', 0)),
-                            timeout='2h'
-                        )
+                    if job is None:
+                        print(f"  ⏭️  Job already queued for {video['name']}, skipping")
+                    else:
                         publish_log('drive-sync', 'INFO', f'📥 Queued download: {video["name"]}', {
                             'filename': video['name'],
                             'size_gb': round(int(video.get('size', 0)) / (1024**3), 2)
@@ -490,14 +722,230 @@ def drive_sync_poller():
             time.sleep(120)
 
 
-if __name__ == "__main__":
-    from redis import Redis
-    from rq import Worker, Queue
-    
-    redis_conn = Redis.from_url(settings.REDIS_URL)
-    queue = Queue(connection=redis_conn)
-    
-    print(f"Starting RQ worker, listening on queue: {queue.name}")
-    worker = Worker([queue], connection=redis_conn)
-    worker.work()
+# --- worker pool ---
+# the container runs one supervisor that imports the heavy stuff (cv2, scipy,
+# tflite + the highlight model) once and forks N long-lived children from it.
+# children run jobs in-process (SimpleWorker), so nothing is re-imported or
+# reloaded per job; a child that grows past WORKER_MAX_RSS_MB finishes its job,
+# exits and is re-forked from the clean parent. cancelling a running job (POST
+# /api/jobs/{id}/cancel) raises JobCancelled inside it; ffmpeg_runner kills its
+# ffmpeg on the way out
+
+
+def worker_count() -> int:
+    """WORKER_CONCURRENCY, or as many jobs as the cores and free memory allow"""
+    if settings.WORKER_CONCURRENCY > 0:
+        return settings.WORKER_CONCURRENCY
+
+    # what the fixed-size workers (worker-interactive) need comes off the
+    # host first, the rest is split between the auto-sized replicas
+    replicas = max(1, settings.WORKER_REPLICAS)
+    reserved = max(0, settings.WORKER_RESERVED_JOBS)
+    cpus_per_job = max(settings.WORKER_CPUS_PER_JOB, 0.5)
+    by_cpu = int(max(0, cpu_count() - reserved * cpus_per_job) / replicas // cpus_per_job)
+    memory = available_memory_mb()
+    if memory:
+        memory = max(0, memory - reserved * settings.WORKER_MEMORY_MB_PER_JOB) // replicas
+        by_memory = memory // settings.WORKER_MEMORY_MB_PER_JOB
+    else:
+        by_memory = by_cpu
+    return max(1, min(by_cpu, by_memory))
+
+
+def preload_worker_modules(workers: int):
+    """import and initialise everything jobs need, once, before forking"""
+    import cv2
+    import numpy  # noqa: F401
+    import scipy.signal  # noqa: F401
+    import app.detection.stage1_motion  # noqa: F401
+    import app.detection.stage1_audio  # noqa: F401
+    import app.detection.stage1_candidates  # noqa: F401
+    import app.services.analysis_pipeline  # noqa: F401
+    from app.detection import get_highlight_model
+
+    # split the cores between every worker on the host so the opencv thread
+    # pools of N children x replicas (+ the reserved ones) don't fight
+    host_jobs = workers * max(1, settings.WORKER_REPLICAS) + max(0, settings.WORKER_RESERVED_JOBS)
+    threads = max(1, cpu_count() // host_jobs)
+    cv2.setNumThreads(threads)
+
+    model = get_highlight_model()
+    print(f"[WORKER] preloaded modules, cv2 threads per worker: {threads}, highlight model: {'loaded' if model else 'none'}")
+
+
+def _rss_mb() -> int:
+    """resident memory of this process"""
+    pages = read_proc_int("/proc/self/statm", 1)
+    return pages * os.sysconf("SC_PAGE_SIZE") // (1024 * 1024)
+
+
+def should_recycle() -> bool:
+    """true when this worker has grown past WORKER_MAX_RSS_MB (leaky job)"""
+    return settings.WORKER_MAX_RSS_MB > 0 and _rss_mb() > settings.WORKER_MAX_RSS_MB
+
+
+def _recycling_worker_class():
+    import rq
+    from rq import SimpleWorker
+
+    # overrides rq internals (_ordered_queues, _stop_requested, _stopped_job_id,
+    # kill_horse, dequeue_job_and_maintain_ttl's signature); pyproject pins rq
+    # to the 2.x line they match, this catches an install that doesn't
+    for name in ("dequeue_job_and_maintain_ttl", "kill_horse", "execute_job"):
+        if not hasattr(SimpleWorker, name):
+            raise RuntimeError(f"rq {rq.__version__} has no Worker.{name}, RecyclingWorker needs rq>=2.12,<3")
+
+    class RecyclingWorker(SimpleWorker):
+        """
+        runs jobs in-process, only dequeues from queues admission lets through,
+        and stops after a job that left it too big
+        """
+
+        def dequeue_job_and_maintain_ttl(self, timeout, max_idle_time=None):
+            if timeout is None:
+                # burst: one non-blocking pass over whatever is admitted
+                self._ordered_queues = admission.admitted_queues(self.queues)
+                if not self._ordered_queues:
+                    return None
+                return super().dequeue_job_and_maintain_ttl(timeout, max_idle_time)
+
+            # block in short slices so held queues are re-checked while we wait
+            idle_since = time.monotonic()
+            while True:
+                wait = settings.ADMISSION_RECHECK_SECONDS
+                if max_idle_time is not None:
+                    idle_left = max_idle_time - (time.monotonic() - idle_since)
+                    if idle_left <= 0:
+                        return None
+                    wait = max(1, min(wait, int(idle_left)))
+
+                self._ordered_queues = admission.admitted_queues(self.queues)
+                if not self._ordered_queues:
+                    self.heartbeat()
+                    time.sleep(wait)
+                    continue
+
+                result = super().dequeue_job_and_maintain_ttl(min(timeout, wait), max_idle_time=wait)
+                if result is not None:
+                    return result
+
+        _cancellable_job_id = None
 
+        def execute_job(self, job, queue):
+            self._cancellable_job_id = job.id
+            try:
+                super().execute_job(job, queue)
+            finally:
+                self._cancellable_job_id = None
+            if should_recycle():
+                print(f"[WORKER] {self.name}: rss {_rss_mb()}MB over {settings.WORKER_MAX_RSS_MB}MB after {job.id}, recycling")
+                self._stop_requested = True
+
+        def kill_horse(self, sig=signal.SIGKILL):
+            # there's no horse: rq's stop-job command (handled on the pubsub
+            # thread) ends up here, so interrupt the job in this process. the
+            # signal handler runs on the main thread and raises JobCancelled
+            # there; rq then marks the job stopped and cancels its dependents
+            if self._cancellable_job_id is not None:
+                os.kill(os.getpid(), CANCEL_SIGNAL)
+
+        def cancel_current_job(self, signum, frame):
+            job_id = self._cancellable_job_id
+            if job_id is None or job_id != self._stopped_job_id:
+                return
+            from app.core.errors import JobCancelled
+            print(f"[WORKER] {self.name}: cancelling job {job_id}")
+            raise JobCancelled(f"job {job_id} cancelled")
+
+    return RecyclingWorker
+
+
+# stop-job commands reach the job through this signal (see kill_horse above)
+CANCEL_SIGNAL = signal.SIGUSR1
+
+
+def _run_child():
+    from app.services.queue import redis_conn, worker_queues
+
+    # the parent's handlers would forward signals to our (non-existent) children
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # don't reuse the parent's sockets
+    redis_conn.connection_pool.reset()
+
+    worker = _recycling_worker_class()(worker_queues(), connection=redis_conn)
+    signal.signal(CANCEL_SIGNAL, worker.cancel_current_job)
+    # the scheduler moves retries whose backoff is up back onto their queue
+    # (one child per queue holds its lock, the others stand by)
+    worker.work(with_scheduler=True)
+
+
+def _spawn() -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _run_child()
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def run_worker_pool():
+    """supervisor: preload, fork N workers, re-fork any that exit until told to stop"""
+    from app.services.queue import worker_queues
+
+    workers = worker_count()
+    listen = worker_queues()
+    print(f"[WORKER] starting {workers} workers, listening on queues: {', '.join(q.name for q in listen)}")
+    preload_worker_modules(workers)
+
+    children = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        if stopping:
+            # second signal: cold shutdown of the children too
+            for pid in list(children):
+                os.kill(pid, signal.SIGKILL)
+            return
+        stopping = True
+        print(f"[WORKER] got signal {signum}, waiting for running jobs")
+        for pid in list(children):
+            # rq's warm shutdown: finish the current job, then exit
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        children[_spawn()] = time.monotonic()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+
+        print(f"[WORKER] worker {pid} exited ({os.waitstatus_to_exitcode(status)}), starting a new one")
+        # don't spin when children die straight away (redis down, bad config)
+        if time.monotonic() - started < 5:
+            time.sleep(5)
+        if not stopping:
+            children[_spawn()] = time.monotonic()
+
+    print("[WORKER] all workers stopped")
+
+
+if __name__ == "__main__":
+    run_worker_pool()
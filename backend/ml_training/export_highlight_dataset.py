@@ -13,6 +13,7 @@ import csv
 from sqlmodel import Session, select
 from app.core.db import engine
 from app.models import HighlightWindow, OriginalFile
+from app.services.ffmpeg_runner import ffmpeg_runner, KIND_ENCODE
 
 
 def export_dataset(output_dir: Path):
@@ -83,7 +84,7 @@ def export_dataset(output_dir: Path):
             ]
             
             try:
-                subprocess.run(cmd, check=True, capture_output=True, text=True)
+                ffmpeg_runner.run(cmd, kind=KIND_ENCODE, duration_sec=duration)
                 
                 # add to metadata
                 metadata_rows.append({
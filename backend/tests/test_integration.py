@@ -2,7 +2,7 @@ import pytest
 from fastapi.testclient import TestClient
 from app.main import app
 from app.core.db import get_session
-from sqlmodel import Session, create_engine, SQLModel
+from sqlmodel import Session, create_engine, SQLModel, select
 from sqlmodel.pool import StaticPool
 
 # create in-memory test database
@@ -91,3 +91,1381 @@ def test_storage_stats(client):
 
 
 
+
+
+def test_proxy_scheduler_follows_sort_order(session):
+    """proxy lookahead follows the order /sort/next serves videos in"""
+    from datetime import datetime
+    from app.models import OriginalFile, CandidateSegment
+    from app.services.proxy_scheduler import ProxyScheduler
+
+    def make_file(name):
+        f = OriginalFile(
+            original_filename=name, stored_path=f"/tmp/{name}", file_hash=name,
+            camera_id="CAM1", fps_label="30FPS", fps=30.0, duration_ms=60000,
+            recorded_at=datetime.utcnow(), processing_status="completed"
+        )
+        session.add(f)
+        return f
+
+    low, high, done = make_file("low.mp4"), make_file("high.mp4"), make_file("done.mp4")
+    session.add(CandidateSegment(original_file_id=low.id, start_ms=0, end_ms=1000, confidence_score=0.4))
+    session.add(CandidateSegment(original_file_id=high.id, start_ms=0, end_ms=1000, confidence_score=0.9))
+    session.add(CandidateSegment(original_file_id=done.id, start_ms=0, end_ms=1000, confidence_score=0.95, status="TRASHED"))
+    session.commit()
+
+    scheduler = ProxyScheduler(lookahead=5)
+    assert scheduler.get_upcoming_files(session, 5) == [high.id, low.id]
+    assert [f.id for f in scheduler.get_reviewed_files(session)] == [done.id]
+
+
+def test_sprite_vtt_maps_intervals_to_tiles():
+    """sprite index wraps to the next row and sheet at the grid edges"""
+    from app.video.thumbnails import build_sprite_vtt, SPRITE_COLUMNS, SPRITE_ROWS
+
+    count = SPRITE_COLUMNS * SPRITE_ROWS + 1
+    vtt = build_sprite_vtt(count, count * 2.0, 160, 90, ["sprite_001.jpg", "sprite_002.jpg"])
+    lines = vtt.splitlines()
+
+    assert lines[0] == "WEBVTT"
+    assert "sprite_001.jpg#xywh=0,0,160,90" in lines
+    assert "sprite_001.jpg#xywh=0,90,160,90" in lines
+    assert lines[-1] == "sprite_002.jpg#xywh=0,0,160,90"
+
+
+def test_thumbnail_file_rejects_bad_names(client):
+    """only known cache entry names are served"""
+    response = client.get("/api/thumbnails/" + "a" * 64 + "/..%2Fmanifest.json")
+    assert response.status_code == 404
+
+
+def test_signal_pyramid_keeps_peaks(tmp_path, monkeypatch):
+    """coarse pyramid levels keep the true max and fit the requested point budget"""
+    import numpy as np
+    from app.detection.signal_pyramid import save_signal_pyramids, load_signal_pyramid, query_pyramid
+
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    times = np.arange(10000) * 0.1
+    values = np.zeros(10000)
+    values[4321] = 1.0  # single-sample spike a [::10] stride would miss
+
+    save_signal_pyramids("file-a", {"motion": (times, values)})
+    levels = load_signal_pyramid("file-a", "motion")
+
+    full = query_pyramid(levels, max_points=200)
+    assert len(full["max"]) <= 200
+    assert max(full["max"]) == 1.0
+
+    zoomed = query_pyramid(levels, start_sec=430.0, end_sec=434.0, max_points=200)
+    assert zoomed["level"] == 0
+    assert zoomed["t0"][0] >= 430.0 and zoomed["t0"][-1] <= 434.0
+    assert load_signal_pyramid("file-a", "audio") is None
+
+
+def test_frame_index_lookups(monkeypatch):
+    """keyframe and frame lookups are binary searches over sorted pts"""
+    import subprocess
+    import numpy as np
+    from app.video import frame_index
+    from app.video.frame_index import FrameIndex
+
+    # the packet-only probe goes through the media probe's parser
+    probe = "\n".join([
+        "stream|index=1|codec_type=video",
+        "packet|stream_index=1|pts_time=0.033|dts_time=0.000|pos=4096|flags=__",
+        "packet|stream_index=1|pts_time=0.000|dts_time=-0.033|pos=1024|flags=K__",
+    ])
+    monkeypatch.setattr(frame_index.subprocess, "run", lambda cmd, **kw: subprocess.CompletedProcess(cmd, 0, probe, ""))
+    built = frame_index.build_frame_index("clip.mp4")
+    assert list(built.frame_pts) == [0.0, 0.033] and list(built.key_pos) == [1024]
+
+    frames = np.arange(0, 300) / 30.0
+    index = FrameIndex(frames, np.array([0.0, 2.0, 4.0, 6.0]), np.array([0, 1000, 2000, 3000]))
+
+    assert index.keyframe_at_or_before(3.5) == (2.0, 1000)
+    assert index.keyframe_at_or_after(3.5) == (4.0, 2000)
+    assert index.keyframe_at_or_after(9.0) is None
+    assert index.frames_between(1.0, 2.0) == 30
+    assert abs(index.frame_at_or_after(1.01) - 31 / 30.0) < 1e-9
+
+
+def test_smart_cut_plan_copies_only_inner_gops():
+    """boundary GOPs are re-encoded, whole GOPs in between are stream copied"""
+    import numpy as np
+    from app.video.frame_index import FrameIndex
+    from app.video.smart_cut import plan_smart_cut
+
+    frames = np.arange(0, 600) / 30.0  # 20s @ 30fps, keyframe every 2s
+    keys = np.arange(0, 20, 2.0)
+    index = FrameIndex(frames, keys, np.arange(len(keys)) * 1000)
+
+    plan = plan_smart_cut(index, 3.0, 9.5)
+    assert [p[0] for p in plan] == ["encode", "copy", "encode"]
+    assert plan[0][1:] == (3.0, 30)
+    assert plan[1][1:] == (4.0, 120)
+    assert plan[2][1:] == (8.0, 45)
+    assert sum(p[2] for p in plan) == index.frames_between(3.0, 9.5)
+
+    # no keyframe inside the clip: single accurate re-encode
+    assert plan_smart_cut(index, 4.1, 5.9) == [("encode", 4.1, index.frames_between(4.1, 5.9))]
+
+
+def test_smart_cut_batch_reads_original_in_one_pass(monkeypatch, tmp_path):
+    """every clip of a batch is cut in one ffmpeg run, then muxed in one more"""
+    import numpy as np
+    from app.video import smart_cut
+    from app.video.frame_index import FrameIndex
+
+    calls = []
+    monkeypatch.setattr(smart_cut.ffmpeg_runner, "run", lambda cmd, **kw: calls.append(cmd))
+    monkeypatch.setattr(smart_cut, "boundary_encode_compatible", lambda *a: True)
+
+    frames = np.arange(0, 600) / 30.0
+    keys = np.arange(0, 20, 2.0)
+    index = FrameIndex(frames, keys, np.arange(len(keys)) * 1000)
+    stream = {"codec_name": "h264", "profile": "High", "pix_fmt": "yuv420p", "level": 41, "rotation": 0, "has_audio": True}
+    cuts = [(str(tmp_path / f"clip{i}.mp4"), 1.0 + 6 * i, 5.5 + 6 * i) for i in range(3)]
+
+    summaries = smart_cut.render_smart_cuts("/videos/original.mp4", cuts, index, stream)
+
+    assert len(calls) == 2
+    cut_pass, mux_pass = calls
+    # 3 pieces + 1 audio range per clip, each seeking on its own input
+    assert cut_pass.count("-i") == 12
+    assert cut_pass.count("/videos/original.mp4") == 12
+    assert "/videos/original.mp4" not in mux_pass
+    assert [c[0] for c in cuts] == [a for a in mux_pass if a.endswith(".mp4")]
+    assert all(s["copied_frames"] > 0 and s["encoded_frames"] > 0 for s in summaries)
+
+
+def test_smart_cut_falls_back_when_parameter_sets_differ(monkeypatch, tmp_path):
+    """boundary encodes that can't share the source's avcC: clips are copied from the keyframe before them"""
+    import numpy as np
+    from app.video import smart_cut
+    from app.video.frame_index import FrameIndex
+
+    sps, pps = b"\x67\x64\x00\x28\xac", b"\x68\xee\x3c\x80"
+    stream_bytes = b"\x00\x00\x00\x01" + sps + b"\x00\x00\x01" + pps + b"\x00\x00\x01\x06sei" + b"\x00\x00\x01\x65idr"
+    assert smart_cut.parameter_sets("h264", stream_bytes) == {sps, pps}
+
+    # the source and x264 disagree on the sps: no stream copy
+    source = tmp_path / "original.mp4"
+    source.write_bytes(b"x")
+    monkeypatch.setattr(smart_cut, "_first_frame_annexb",
+                        lambda path, seek, codec, encoder_args=None: stream_bytes if encoder_args is None else stream_bytes.replace(sps, sps + b"\x01"))
+    calls = []
+    monkeypatch.setattr(smart_cut.ffmpeg_runner, "run", lambda cmd, **kw: calls.append(cmd))
+
+    frames = np.arange(0, 600) / 30.0
+    keys = np.arange(0, 20, 2.0)
+    index = FrameIndex(frames, keys, np.arange(len(keys)) * 1000)
+    stream = {"codec_name": "h264", "profile": "High", "pix_fmt": "yuv420p", "level": 41, "rotation": 90, "has_audio": False}
+    [summary] = smart_cut.render_smart_cuts(str(source), [(str(tmp_path / "clip.mp4"), 1.0, 9.5)], index, stream)
+    assert summary == {"mode": "smart", "copied_frames": index.frames_between(0.0, 9.5), "encoded_frames": 0, "pieces": 1}
+    assert "libx264" not in calls[0]
+
+    # whole-clip re-encode only when asked for
+    from app.core.config import settings
+    monkeypatch.setattr(settings, "SMART_CUT_REENCODE_ON_MISMATCH", True)
+    [summary] = smart_cut.render_smart_cuts(str(source), [(str(tmp_path / "clip.mp4"), 1.0, 9.5)], index, stream)
+    assert summary["copied_frames"] == 0 and summary["encoded_frames"] == index.frames_between(1.0, 9.5)
+
+    # rotation goes on the concat input as a display matrix
+    mux_pass = calls[-1]
+    assert mux_pass[mux_pass.index("-display_rotation") + 1] == "270"
+    assert "rotate=90" not in " ".join(mux_pass)
+
+
+def test_drive_stream_resumes_failed_chunk(monkeypatch):
+    """a failed chunk is resent from the offset drive reports, and md5 is checked"""
+    import hashlib
+    import io
+    from app.services import drive_stream
+
+    class Response:
+        def __init__(self, status_code, headers=None, body=None):
+            self.status_code = status_code
+            self.headers = headers or {}
+            self.text = ""
+            self._body = body
+
+        def json(self):
+            return self._body
+
+    payload = bytes(range(256)) * 4096 * 3  # 3 MiB
+    chunk = drive_stream.CHUNK_ALIGNMENT * 4  # 1 MiB
+
+    class FakeDrive:
+        def __init__(self):
+            self.stored = bytearray()
+            self.failed_once = False
+            self.ranges = []
+
+        def post(self, url, headers, json):
+            return Response(200, {"Location": "https://upload/session"})
+
+        def put(self, url, headers, data=None):
+            content_range = headers["Content-Range"]
+            self.ranges.append(content_range)
+            if content_range == "bytes */*":
+                return Response(308, {"Range": f"bytes=0-{len(self.stored) - 1}"} if self.stored else {})
+            if not self.failed_once and len(self.stored) == chunk:
+                # commit half the second chunk, then drop the connection
+                self.failed_once = True
+                self.stored += data[:len(data) // 2]
+                return Response(503)
+            self.stored += data
+            if not content_range.endswith("/*"):
+                md5 = hashlib.md5(bytes(self.stored)).hexdigest()
+                return Response(200, body={"id": "file123", "webViewLink": "https://drive/file123", "md5Checksum": md5})
+            return Response(308, {"Range": f"bytes=0-{len(self.stored) - 1}"})
+
+    drive = FakeDrive()
+    monkeypatch.setattr(drive_stream.time, "sleep", lambda s: None)
+    result = drive_stream.upload_stream(
+        io.BytesIO(payload), "token", {"name": "clip.mp4"}, chunk_size=chunk, http=drive
+    )
+
+    assert bytes(drive.stored) == payload
+    assert result["drive_file_id"] == "file123"
+    assert result["md5"] == hashlib.md5(payload).hexdigest()
+    assert f"bytes {chunk + chunk // 2}-{2 * chunk - 1}/*" in drive.ranges
+    assert drive.ranges[-1] == f"bytes {2 * chunk}-{3 * chunk - 1}/{3 * chunk}"
+
+    # a session that keeps answering 308 without committing anything backs off and gives up
+    class StalledDrive(FakeDrive):
+        def put(self, url, headers, data=None):
+            self.ranges.append(headers["Content-Range"])
+            return Response(308, {"Range": f"bytes=0-{chunk - 1}"})
+
+    sleeps = []
+    monkeypatch.setattr(drive_stream.time, "sleep", sleeps.append)
+    upload = drive_stream.ResumableUpload("token", {"name": "clip.mp4"}, http=StalledDrive(), max_retries=3)
+    upload.start()
+    with pytest.raises(drive_stream.DriveUploadError):
+        upload.send_chunk(payload[chunk:2 * chunk], chunk)
+    assert sleeps == [1.0, 2.0, 4.0]
+
+
+def test_render_cache_matches_same_video_only(session):
+    """clip_hash keys on source content + trim + render params, not on tags"""
+    from datetime import date
+    from uuid import uuid4
+    from app.models import FinalClip
+    from app.services.render_cache import compute_clip_hash, find_rendered_clip
+
+    key = compute_clip_hash("abc", 1000, 5000)
+    assert key == compute_clip_hash("abc", 1000, 5000)
+    assert key != compute_clip_hash("abc", 1000, 5001)
+    assert key != compute_clip_hash("abd", 1000, 5000)
+    assert key != compute_clip_hash("abc", 1000, 5000, {"mode": "copy", "version": 1})
+
+    def make_clip(name, uploaded):
+        clip = FinalClip(
+            candidate_segment_id=uuid4(), original_file_id=uuid4(), category="TRICK",
+            session_name="S1", start_ms=1000, end_ms=5000, camera_id="CAM1", fps_label="30FPS",
+            date=date(2025, 1, 1), stored_path=f"/data/final_clips/{name}", filename=name,
+            clip_hash=key, is_uploaded_to_drive=uploaded, drive_file_id="drive1" if uploaded else None
+        )
+        session.add(clip)
+        session.commit()
+        return clip
+
+    pending = make_clip("b.mp4", uploaded=False)
+    assert find_rendered_clip(session, key) is None
+
+    done = make_clip("a.mp4", uploaded=True)
+    assert find_rendered_clip(session, key, exclude_id=pending.id).id == done.id
+    assert find_rendered_clip(session, key, exclude_id=done.id) is None
+
+
+def test_ffmpeg_runner_reports_progress_and_kills_on_timeout(tmp_path):
+    """-progress blocks become fractions; a timed out run leaves no child behind"""
+    import os
+    import subprocess
+    import sys
+    import pytest
+    from app.services.ffmpeg_runner import FFmpegRunner, KIND_ENCODE
+
+    # stand-in ffmpeg: writes two progress blocks to the pipe it's given, then sleeps if asked
+    fake = tmp_path / "ffmpeg"
+    fake.write_text(
+        f"#!{sys.executable}\n"
+        "import os, sys, time\n"
+        "fd = int(sys.argv[3].split(':')[1])\n"
+        "os.write(fd, b'out_time_us=2500000\\nprogress=continue\\nout_time_us=5000000\\nprogress=continue\\n')\n"
+        "if sys.argv[4] == 'sleep':\n"
+        "    open(sys.argv[5], 'w').write(str(os.getpid()))\n"
+        "    time.sleep(30)\n"
+        "print('done')\n"
+    )
+    fake.chmod(0o755)
+
+    runner = FFmpegRunner()
+    runner.lock_dir = tmp_path / "locks"
+    seen = []
+    result = runner.run([str(fake), "run"], kind=KIND_ENCODE, duration_sec=10.0, on_progress=seen.append)
+    assert result.stdout.strip() == "done"
+    assert seen == [0.25, 0.5, 1.0]
+
+    with pytest.raises(subprocess.TimeoutExpired):
+        runner.run([str(fake), "sleep", str(tmp_path / "pid")], kind=KIND_ENCODE, timeout=1)
+    with pytest.raises(ProcessLookupError):
+        os.kill(int((tmp_path / "pid").read_text()), 0)
+
+
+def test_media_info_parses_single_probe():
+    """one compact listing yields stream params, GOP stats and the frame index"""
+    from app.video.media_info import parse_probe_output
+    from app.video.proxy_utils import plan_playback_proxy
+
+    lines = [
+        "stream|index=0|codec_name=h264|profile=High|codec_type=video|width=1920|height=1080|pix_fmt=yuv420p|level=40|avg_frame_rate=30/1|bit_rate=8000000",
+        "side_data|rotation=-90",
+        "stream|index=1|codec_name=aac|profile=LC|codec_type=audio|sample_rate=48000|channels=2|bit_rate=128000",
+        "format|format_name=mov,mp4,m4a,3gp,3g2,mj2|duration=0.400000|size=400000|bit_rate=8000000|tag:creation_time=2025-01-01T00:00:00.000000Z",
+    ]
+    # 12 frames, keyframes every 4, packets in decode order plus one audio packet
+    for i in range(12):
+        flags = "K__" if i % 4 == 0 else "___"
+        lines.append(f"packet|stream_index=0|pts_time={i / 30:.6f}|dts_time={i / 30:.6f}|pos={i * 1000}|flags={flags}")
+    lines.append("packet|stream_index=1|pts_time=0.000000|dts_time=0.000000|pos=500|flags=K__")
+
+    info, index = parse_probe_output("\n".join(lines))
+
+    assert info["video_codec"] == "h264" and info["video_profile"] == "High"
+    assert info["rotation"] == 90
+    assert info["has_audio"] and info["audio_codec"] == "aac"
+    assert info["fps"] == 30.0 and info["duration_ms"] == 400
+    assert index.frame_count == 12 and index.keyframe_count == 3
+    assert info["mean_gop_frames"] == 4.0 and info["max_gop_frames"] == 4
+
+    # portrait 1080x1920 on screen: too tall for a 1080p proxy, so it's re-encoded
+    assert plan_playback_proxy(info, 1080) == (False, "scale=-2:1080")
+    assert plan_playback_proxy({**info, "rotation": 0}, 1080) == (True, None)
+
+    # the upload handler probes synchronously, so it must run in the threadpool, not on the event loop
+    import inspect
+    from app.api.v1.upload import upload_file
+    assert not inspect.iscoroutinefunction(upload_file)
+
+
+def test_analysis_graph_wires_stage_dependencies(monkeypatch):
+    """every stage gets its own queue and waits only on its inputs"""
+    from uuid import uuid4
+    from app.services import queue as queue_module
+    from app.services.analysis_pipeline import start_analysis_graph
+
+    class FakeJob:
+        def __init__(self, stage):
+            self.id = f"job-{stage}"
+
+    calls = {}
+
+    def fake_enqueue(func, *args, queue_name=None, depends_on=None, **kwargs):
+        calls[queue_name] = {"func": func.__name__, "needs": sorted(j.id for j in depends_on or [])}
+        return FakeJob(queue_name)
+
+    monkeypatch.setattr(queue_module, "enqueue_job", fake_enqueue)
+    jobs = start_analysis_graph(uuid4())
+
+    assert set(jobs) == set(calls) and set(calls) <= set(queue_module.QUEUE_NAMES)
+    assert calls["ingest"]["needs"] == []
+    assert calls["motion"]["needs"] == ["job-analysis_proxy"]
+    assert calls["candidates"]["needs"] == ["job-audio", "job-motion"]
+    # playback proxy and audio only need the probe, so they run next to the proxy/motion chain
+    assert calls["playback_proxy"]["needs"] == calls["audio"]["needs"] == ["job-probe"]
+    assert calls["archive"]["needs"] == ["job-persist"]
+
+
+def test_lanes_route_jobs_and_serve_interactive_first(monkeypatch):
+    from app.core.config import settings
+    from app.services import queue as queue_module
+    from app.worker import render_clip_batch, download_and_process_from_drive, generate_thumbnails_for_file
+
+    assert queue_module.queue_for_job(render_clip_batch).name == "interactive"
+    assert queue_module.queue_for_job(download_and_process_from_drive).name == "download"
+    assert queue_module.queue_for_job(generate_thumbnails_for_file).name == "maintenance"
+
+    monkeypatch.setattr(settings, "WORKER_QUEUES", "")
+    monkeypatch.setattr(settings, "WORKER_LANES", "ingest, interactive")
+    assert [q.name for q in queue_module.worker_queues()] == ["interactive", "ingest", "download"]
+
+    monkeypatch.setattr(settings, "WORKER_LANES", "")
+    names = [q.name for q in queue_module.worker_queues()]
+    assert names[0] == "interactive" and set(names) == set(queue_module.QUEUE_NAMES)
+
+
+def test_enqueue_unique_skips_duplicates_until_released(monkeypatch):
+    from types import SimpleNamespace
+    from app.services import queue as queue_module
+    from app.worker import download_and_process_from_drive
+
+    class FakeRedis:
+        def __init__(self):
+            self.data = {}
+
+        def set(self, key, value, nx=False, ex=None):
+            if nx and key in self.data:
+                return None
+            self.data[key] = value.encode()
+            return True
+
+        def get(self, key):
+            return self.data.get(key)
+
+        def mget(self, keys):
+            return [self.data.get(k) for k in keys]
+
+        def delete(self, key):
+            self.data.pop(key, None)
+
+        def hset(self, key, field, value):
+            self.data.setdefault(key, {})[field.encode()] = str(value).encode()
+
+        def hdel(self, key, *fields):
+            for field in fields:
+                self.data.get(key, {}).pop(field.encode(), None)
+
+        def hgetall(self, key):
+            return dict(self.data.get(key, {}))
+
+        def pipeline(self, transaction=True):
+            redis, calls = self, []
+
+            class Pipe:
+                def __getattr__(self, name):
+                    return lambda *args, **kwargs: calls.append((name, args, kwargs))
+
+                def execute(self):
+                    return [getattr(redis, name)(*args, **kwargs) for name, args, kwargs in calls]
+            return Pipe()
+
+    enqueued = []
+
+    def fake_enqueue(func, *args, job_id=None, meta=None, **kwargs):
+        job = SimpleNamespace(id=job_id, meta=meta, retries_left=None)
+        enqueued.append(job)
+        return job
+
+    monkeypatch.setattr(queue_module, "redis_conn", FakeRedis())
+    monkeypatch.setattr(queue_module, "enqueue_job", fake_enqueue)
+
+    first = queue_module.enqueue_unique(download_and_process_from_drive, "drive-1", "drive-1", "a.mp4", 10)
+    assert first is not None
+    assert queue_module.enqueue_unique(download_and_process_from_drive, "drive-1", "drive-1", "a.mp4", 10) is None
+    assert queue_module.enqueue_unique(download_and_process_from_drive, "drive-2", "drive-2", "b.mp4", 10) is not None
+
+    # a failure with a retry pending keeps the marker, the final outcome drops it
+    first.retries_left = 1
+    queue_module._release_on_failure(first, None)
+    assert queue_module.enqueue_unique(download_and_process_from_drive, "drive-1", "drive-1", "a.mp4", 10) is None
+    queue_module._release_on_success(first, None, None)
+    assert queue_module.enqueue_unique(download_and_process_from_drive, "drive-1", "drive-1", "a.mp4", 10) is not None
+    assert len(enqueued) == 3
+
+    # downloads reserve their disk while the marker lives; admission sums the reservations, no queue scan
+    from app.services.admission import AdmissionController, DOWNLOAD_JOB
+    redis = queue_module.redis_conn
+    redis.data.clear()
+    big = queue_module.enqueue_unique(download_and_process_from_drive, "drive-3", "drive-3", "c.mp4", 100, reserve_bytes=150)
+    queue_module.enqueue_unique(download_and_process_from_drive, "drive-4", "drive-4", "d.mp4", 40, reserve_bytes=60)
+    assert queue_module.enqueue_unique(download_and_process_from_drive, "drive-3", "drive-3", "c.mp4", 100, reserve_bytes=150) is None
+    assert AdmissionController()._pending_downloads() == (2, 210)
+    assert queue_module.held_unique(DOWNLOAD_JOB, ["drive-3", "drive-5"]) == {"drive-3"}
+    queue_module._release_on_success(big, None, None)
+    assert AdmissionController()._pending_downloads() == (1, 60)
+    # a worker died without callbacks: the reservation goes with the expired marker
+    redis.delete(queue_module._unique_key(DOWNLOAD_JOB, "drive-4"))
+    assert queue_module.reserved_unique(DOWNLOAD_JOB) == {}
+
+
+def test_job_states_buffer_in_redis_and_flush_in_batches(monkeypatch):
+    from app.services import job_tracker
+    from app.models import Job
+
+    class FakeRedis:
+        def __init__(self):
+            self.hashes, self.sets = {}, {}
+
+        def pipeline(self, transaction=True):
+            redis, calls = self, []
+
+            class Pipe:
+                def __getattr__(self, name):
+                    return lambda *a, **k: calls.append((name, a, k))
+
+                def execute(self):
+                    return [getattr(redis, name)(*a, **k) for name, a, k in calls]
+            return Pipe()
+
+        def hset(self, key, mapping):
+            self.hashes.setdefault(key, {}).update({k.encode(): v.encode() for k, v in mapping.items()})
+
+        def hgetall(self, key):
+            return dict(self.hashes.get(key, {}))
+
+        def expire(self, key, ttl):
+            pass
+
+        def sadd(self, key, *members):
+            self.sets.setdefault(key, set()).update(m.encode() for m in members)
+
+        def spop(self, key, count):
+            members = self.sets.pop(key, set())
+            return list(members)
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    redis = FakeRedis()
+    monkeypatch.setattr(job_tracker, "engine", engine)
+    monkeypatch.setattr(job_tracker, "_redis", lambda: redis)
+
+    job_tracker.create_job_record("rq-1", "render_clip_batch")
+    job_tracker.start_job("rq-1")
+    for percent in (10, 40, 70):
+        job_tracker.update_job_progress("rq-1", percent)
+
+    with Session(engine) as session:
+        assert session.exec(select(Job)).one().status == "queued"  # nothing written yet
+    assert job_tracker.get_job_states(["rq-1"])["rq-1"]["progress_percent"] == "70"
+
+    assert job_tracker.flush_job_states() == 1
+    with Session(engine) as session:
+        row = session.exec(select(Job)).one()
+        assert (row.status, row.progress_percent) == ("running", 70)
+        assert row.started_at is not None
+    assert job_tracker.flush_job_states() == 0
+
+
+def test_analysis_checkpoints_and_motion_resume(tmp_path, monkeypatch):
+    """a still-valid checkpoint is reused, and motion resumes to the same signal"""
+    import cv2
+    import numpy as np
+    from types import SimpleNamespace
+    from uuid import uuid4
+    from app.core.config import settings
+    from app.detection.stage1_motion import compute_motion_energy_timeseries
+    from app.services import analysis_pipeline as pipeline
+
+    monkeypatch.setattr(settings, "DATA_DIR", str(tmp_path))
+    file = SimpleNamespace(id=uuid4(), file_hash="abc", stored_path=str(tmp_path / "orig.mp4"))
+
+    artifact = pipeline._save_series(file.id, "audio", np.arange(3.0), np.ones(3))
+    pipeline.write_checkpoint(file, "audio", artifact, {"a": 1})
+    assert pipeline.valid_checkpoint(file, "audio", {"a": 1})
+    assert pipeline.valid_checkpoint(file, "audio", {"a": 2}) is None
+    assert pipeline.valid_checkpoint(SimpleNamespace(**{**vars(file), "file_hash": "other"}), "audio", {"a": 1}) is None
+    pipeline._save_series(file.id, "audio", np.arange(3.0), np.zeros(3))  # artifact changed underneath
+    assert pipeline.valid_checkpoint(file, "audio", {"a": 1}) is None
+
+    # small mjpeg clip (every frame a keyframe) with a square moving over noise
+    path = str(tmp_path / "motion.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 30, (160, 120))
+    background = (np.random.default_rng(0).random((120, 160, 3)) * 255).astype(np.uint8)
+    for i in range(60):
+        frame = background.copy()
+        frame[40:60, i * 2:i * 2 + 20] = 255
+        writer.write(frame)
+    writer.release()
+
+    full_times, full_energy = compute_motion_energy_timeseries(path)
+
+    checkpoints = []
+    compute_motion_energy_timeseries(
+        path, checkpoint_every_sec=0,
+        on_checkpoint=lambda t, e, n: checkpoints.append({"times": t, "energy": e, "next_frame": n})
+    )
+    halfway = next(c for c in checkpoints if c["next_frame"] >= 30)
+    times, energy = compute_motion_energy_timeseries(path, resume=halfway)
+
+    assert np.allclose(times, full_times) and np.allclose(energy, full_energy)
+
+
+def test_worker_pool_sizing_and_rss_recycle(monkeypatch):
+    """auto sizing takes the tighter of cpu and memory; a worker over the rss cap stops after its job"""
+    import app.worker as worker
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "WORKER_CONCURRENCY", 0)
+    monkeypatch.setattr(settings, "WORKER_REPLICAS", 1)
+    monkeypatch.setattr(settings, "WORKER_RESERVED_JOBS", 0)
+    monkeypatch.setattr(settings, "WORKER_CPUS_PER_JOB", 2)
+    monkeypatch.setattr(settings, "WORKER_MEMORY_MB_PER_JOB", 1000)
+    monkeypatch.setattr(worker, "cpu_count", lambda: 16)
+
+    monkeypatch.setattr(worker, "available_memory_mb", lambda: 64000)
+    assert worker.worker_count() == 8  # cpu bound
+    monkeypatch.setattr(worker, "available_memory_mb", lambda: 3500)
+    assert worker.worker_count() == 3  # memory bound
+    monkeypatch.setattr(worker, "available_memory_mb", lambda: 500)
+    assert worker.worker_count() == 1  # never zero
+    monkeypatch.setattr(settings, "WORKER_REPLICAS", 2)
+    monkeypatch.setattr(worker, "available_memory_mb", lambda: 64000)
+    assert worker.worker_count() == 4  # host split between replicas
+    monkeypatch.setattr(settings, "WORKER_RESERVED_JOBS", 2)
+    assert worker.worker_count() == 3  # worker-interactive's jobs come off the host first
+    monkeypatch.setattr(settings, "WORKER_CONCURRENCY", 5)
+    assert worker.worker_count() == 5
+
+    assert worker._rss_mb() > 0
+    monkeypatch.setattr(settings, "WORKER_MAX_RSS_MB", 100)
+    monkeypatch.setattr(worker, "_rss_mb", lambda: 150)
+    assert worker.should_recycle()
+
+    # the job runs in-process, then the worker asks its loop to stop
+    from rq import SimpleWorker
+    ran = []
+    monkeypatch.setattr(SimpleWorker, "execute_job", lambda self, job, queue: ran.append(job))
+
+    class FakeJob:
+        id = "job-1"
+
+    cls = worker._recycling_worker_class()
+    w = cls.__new__(cls)
+    w._stop_requested = False
+    w.name = "w1"
+    w.execute_job(FakeJob(), None)
+    assert ran and w._stop_requested
+
+    monkeypatch.setattr(worker, "_rss_mb", lambda: 50)
+    assert not worker.should_recycle()
+
+
+def test_admission_holds_heavy_queues_and_downloads(monkeypatch, tmp_path):
+    """cheap stages always run; heavy ones wait on load/memory/disk; downloads wait on backlog and space"""
+    from types import SimpleNamespace
+    from uuid import uuid4
+    from datetime import datetime
+    from app.core.config import settings
+    from app.services.admission import AdmissionController, estimate_proxy_bytes, GB
+    from app.models import OriginalFile
+
+    monkeypatch.setattr(settings, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(settings, "ADMIT_MIN_FREE_GB", 5)
+    monkeypatch.setattr(settings, "ADMIT_DISK_HEADROOM_GB", 10)
+    monkeypatch.setattr(settings, "ADMIT_MAX_LOAD_PER_CPU", 1.5)
+    monkeypatch.setattr(settings, "ADMIT_MIN_MEMORY_MB", 1024)
+    monkeypatch.setattr(settings, "ADMIT_MAX_ANALYZING", 2)
+
+    # a 100s clip not analyzed yet: analysis proxy + playback proxy, the latter capped at the source size
+    file = OriginalFile(original_filename="a.mp4", stored_path=str(tmp_path / "a.mp4"), file_hash="h", camera_id="c",
+                        fps_label="30", fps=30, duration_ms=100_000, file_size_bytes=10_000_000, recorded_at=datetime.utcnow())
+    file.id = uuid4()
+    assert estimate_proxy_bytes(file) == 100 * 125_000 + 10_000_000
+
+    healthy = {
+        "disk_free_bytes": 100 * GB, "projected_bytes": 0, "disk_headroom_bytes": 95 * GB,
+        "load_per_cpu": 0.5, "memory_available_mb": 8000, "analyses_waiting": 0, "analyses_running": 0,
+        "files_analyzing": 0, "files_pending": 0,
+        "downloads_queued": 0, "lane_depth": {},
+    }
+    controller = AdmissionController()
+    queues = [SimpleNamespace(name=n) for n in ["interactive", "persist", "ml", "motion", "analysis_proxy", "probe", "ingest", "download", "maintenance"]]
+
+    def admitted(**changes):
+        controller._snapshot = {**healthy, **changes}
+        controller._snapshot_at = float("inf")  # keep the cached snapshot
+        return [q.name for q in controller.admitted_queues(queues)]
+
+    assert admitted() == [q.name for q in queues]
+    assert admitted(load_per_cpu=3.0) == ["interactive", "persist", "probe", "ingest", "download"]
+    assert admitted(memory_available_mb=500) == ["interactive", "persist", "probe", "ingest", "download"]
+    assert admitted(disk_headroom_bytes=2 * GB) == ["interactive", "persist", "ml", "motion", "probe", "maintenance"]
+    assert admitted(disk_free_bytes=1 * GB, disk_headroom_bytes=-4 * GB) == ["persist", "ml", "motion", "probe", "maintenance"]
+    # analysis is behind: downloads wait, the analysis graphs' own ingest stage doesn't
+    assert admitted(analyses_waiting=2) == ["interactive", "persist", "ml", "motion", "analysis_proxy", "probe", "ingest", "maintenance"]
+
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", False)
+    assert admitted(load_per_cpu=3.0) == [q.name for q in queues]
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", True)
+
+    # downloads need room for themselves + their proxies on top of the projected writes
+    monkeypatch.setattr(controller, "snapshot", lambda max_age=None: {**healthy, "disk_headroom_bytes": 12 * GB})
+    assert controller.can_download(6 * GB)[0]
+    ok, reason = controller.can_download(10 * GB)
+    assert not ok and reason.startswith("disk")
+    monkeypatch.setattr(controller, "snapshot", lambda max_age=None: {**healthy, "analyses_waiting": 2})
+    ok, reason = controller.can_download(1 * GB)
+    assert not ok and reason.startswith("analysis")
+
+
+def test_cost_model_fit_and_shortest_job_first_with_aging():
+    """the fit recovers the timing law; short clips jump a long 4K file until it has waited long enough"""
+    from app.services.cost_model import CostModel, DEFAULT_COEFFICIENTS, features
+    from app.services.analysis_pipeline import order_waiting, estimate_etas
+
+    class FakeRedis:
+        def __init__(self):
+            self.lists = {}
+
+        def pipeline(self, transaction=True):
+            return self
+
+        def lpush(self, key, value):
+            self.lists.setdefault(key, []).insert(0, value)
+
+        def ltrim(self, key, start, end):
+            self.lists[key] = self.lists.get(key, [])[start:end + 1]
+
+        def lrange(self, key, start, end):
+            return self.lists.get(key, [])[start:end + 1]
+
+        def execute(self):
+            pass
+
+    model = CostModel(redis=FakeRedis())
+    phone = {"duration_ms": 120_000, "width": 1920, "height": 1080, "fps": 30, "video_codec": "h264"}
+    big = {"duration_ms": 5_400_000, "width": 3840, "height": 2160, "fps": 240, "video_codec": "hevc"}
+    assert model.fit("analysis") == DEFAULT_COEFFICIENTS["analysis"]
+
+    # timings that follow 4 + 0.2 * duration + 0.002 * duration * decode rate
+    for i in range(12):
+        media = {**phone, "duration_ms": 30_000 * (i + 1), "fps": 30 if i % 2 else 60, "video_codec": "h264" if i % 3 else "hevc"}
+        x = features(media)
+        model.record("analysis", media, 4 + 0.2 * x[1] + 0.002 * x[2])
+    a, b, c = model.fit("analysis")
+    assert abs(a - 4) < 0.1 and abs(b - 0.2) < 0.01 and abs(c - 0.002) < 1e-4
+    assert model.predict("analysis", big) > 100 * model.predict("analysis", phone)
+
+    # the 4K file came first, but the clips are far cheaper
+    waiting = {"big": (0.0, 20000.0), "clip-1": (10.0, 60.0), "clip-2": (20.0, 45.0)}
+    assert order_waiting(waiting, now=30.0, aging=1.0) == ["clip-2", "clip-1", "big"]
+    # ...but once it has waited longer than its cost, fresh clips no longer jump it
+    assert order_waiting({"big": (0.0, 20000.0), "clip-3": (20090.0, 45.0)}, now=20100.0, aging=1.0) == ["big", "clip-3"]
+
+    # two slots: one busy for 100s more; queued files fill whichever frees first
+    etas = estimate_etas({"running": 100.0}, ["clip-2", "clip-1", "big"], {"clip-2": 45.0, "clip-1": 60.0, "big": 20000.0}, slots=2)
+    assert etas == {"running": 100.0, "clip-2": 45.0, "clip-1": 105.0, "big": 20100.0}
+
+
+def test_cancel_and_preempt_bulk_ffmpeg(monkeypatch, tmp_path):
+    """bulk ffmpeg pauses under interactive pressure (capped); a cancelled encode leaves no proxy behind"""
+    import signal
+    from app.core.errors import JobCancelled
+    from app.services.ffmpeg_runner import Preemption
+    from app.video import proxy_utils
+    from app.worker import _recycling_worker_class
+
+    class FakeProc:
+        pid = 1234
+
+        def __init__(self):
+            self.signals = []
+
+        def send_signal(self, sig):
+            self.signals.append(sig)
+
+        def poll(self):
+            return None
+
+    pressure = {"busy": True}
+    proc = FakeProc()
+    preemption = Preemption(lambda: pressure["busy"], max_pause=60)
+    assert preemption.update(proc, now=0.0) is True
+    assert preemption.update(proc, now=10.0) is True
+    pressure["busy"] = False
+    assert preemption.update(proc, now=20.0) is False
+    assert proc.signals == [signal.SIGSTOP, signal.SIGCONT]
+    assert preemption.paused_seconds(now=30.0) == 20.0
+
+    # a sorter that never stops saving can't hold a bulk encode forever
+    pressure["busy"] = True
+    assert preemption.update(proc, now=30.0) is True
+    assert preemption.update(proc, now=75.0) is False
+    assert preemption.update(proc, now=80.0) is False
+    assert preemption.paused_seconds(now=90.0) == 65.0
+    assert proc.signals == [signal.SIGSTOP, signal.SIGCONT, signal.SIGSTOP, signal.SIGCONT]
+
+    # only the job rq was told to stop gets interrupted
+    worker_class = _recycling_worker_class()
+    worker = worker_class.__new__(worker_class)
+    worker.name = "test-worker"
+    worker._cancellable_job_id, worker._stopped_job_id = "job-1", None
+    worker.cancel_current_job(signal.SIGUSR1, None)
+    worker._stopped_job_id = "job-1"
+    with pytest.raises(JobCancelled):
+        worker.cancel_current_job(signal.SIGUSR1, None)
+
+    # the encode is interrupted half way: no cached proxy, no partial
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    source = tmp_path / "clip.mp4"
+    source.write_bytes(b"video")
+
+    def interrupted_run(cmd, **kwargs):
+        with open(cmd[-1], "wb") as f:
+            f.write(b"half a proxy")
+        raise JobCancelled("job-1 cancelled")
+
+    monkeypatch.setattr(proxy_utils.ffmpeg_runner, "run", interrupted_run)
+    with pytest.raises(JobCancelled):
+        proxy_utils.generate_proxy_video(str(source))
+    assert list((tmp_path / "proxies").iterdir()) == []
+
+
+def test_retry_only_transient_errors_then_dead_letter(monkeypatch):
+    """drive 5xx / killed ffmpeg / lost db retry with backoff; anything else is dead-lettered at once"""
+    import subprocess
+    import requests
+    import sqlalchemy.exc
+    from types import SimpleNamespace
+    from app.core.errors import is_transient, DriveUploadError, JobCancelled
+    from app.services import queue as queue_module, job_tracker, dead_letter
+    from app.models import Job
+
+    def drive_error(status):
+        try:
+            raise requests.exceptions.HTTPError(response=SimpleNamespace(status_code=status, text=""))
+        except requests.exceptions.HTTPError:
+            try:
+                raise DriveUploadError(f"HTTP error uploading to Drive: {status}")
+            except DriveUploadError as e:
+                return e
+
+    assert is_transient(drive_error(503)) and is_transient(drive_error(429))
+    assert not is_transient(drive_error(404))
+    assert is_transient(subprocess.CalledProcessError(-9, "ffmpeg"))
+    assert not is_transient(subprocess.CalledProcessError(1, "ffmpeg"))
+    assert is_transient(sqlalchemy.exc.OperationalError("select 1", {}, Exception("server closed the connection")))
+    assert not is_transient(ValueError("bad trim points"))
+    assert not is_transient(JobCancelled("job-1 cancelled"))
+
+    for first, wait in zip([30, 60, 120, 240], queue_module.backoff_intervals(4, 30)):
+        assert 0.8 * first <= wait <= 1.2 * first
+    assert queue_module.retry_for("render_clip_batch").max == 4
+    assert queue_module.retry_for("some_unlisted_job") is None
+
+    class FakeRedis:
+        def __init__(self):
+            self.data, self.zsets = {}, {}
+
+        def pipeline(self, transaction=True):
+            redis, calls = self, []
+
+            class Pipe:
+                def __getattr__(self, name):
+                    return lambda *a, **k: calls.append((name, a, k))
+
+                def execute(self):
+                    return [getattr(redis, name)(*a, **k) for name, a, k in calls]
+            return Pipe()
+
+        def set(self, key, value, ex=None):
+            self.data[key] = value.encode()
+
+        def get(self, key):
+            return self.data.get(key)
+
+        def mget(self, keys):
+            return [self.data.get(k) for k in keys]
+
+        def delete(self, *keys):
+            for k in keys:
+                self.data.pop(k, None)
+
+        def zadd(self, key, mapping):
+            self.zsets.setdefault(key, {}).update(mapping)
+
+        def zremrangebyscore(self, key, low, high):
+            self.zsets[key] = {m: s for m, s in self.zsets.get(key, {}).items() if not low <= s <= high}
+
+        def zrevrange(self, key, start, end):
+            members = sorted(self.zsets.get(key, {}).items(), key=lambda ms: -ms[1])
+            return [m.encode() for m, _ in members][start:end + 1]
+
+        def zcard(self, key):
+            return len(self.zsets.get(key, {}))
+
+        def zrem(self, key, *members):
+            return sum(1 for m in members if self.zsets.get(key, {}).pop(m, None) is not None)
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Job(rq_job_id="rq-render", job_type="render_clip_batch", status="running"))
+        session.commit()
+    monkeypatch.setattr(dead_letter, "engine", engine)
+    dlq = dead_letter.DeadLetterQueue(redis=FakeRedis())
+    monkeypatch.setattr(dead_letter, "dead_letters", dlq)
+    retried = []
+    monkeypatch.setattr(job_tracker, "retry_job", lambda rq_job_id, message: retried.append(rq_job_id))
+
+    class FakeJob:
+        id, origin, args = "rq-render", "interactive", ("original-1",)
+        func_name = "app.worker.render_clip_batch"
+
+        def __init__(self):
+            self.meta, self.retries_left, self.retry_intervals = {}, 4, [30, 60, 120, 240]
+
+        def save_meta(self):
+            pass
+
+        def get_retry_interval(self):
+            return self.retry_intervals[len(self.retry_intervals) - self.retries_left]
+
+    # a drive outage: rq keeps its retry, nothing is dead-lettered
+    job = FakeJob()
+    error = drive_error(502)
+    queue_module._on_failure(job, None, type(error), error, None)
+    assert job.retries_left == 4 and retried == ["rq-render"] and dlq.count() == 0
+
+    # a bug fails the same way every time: retries dropped, parked with its error
+    error = ValueError("clip ends before it starts")
+    queue_module._on_failure(job, None, ValueError, error, None)
+    assert job.retries_left == 0
+    [entry] = dlq.entries()
+    assert (entry["job_type"], entry["error_type"], entry["attempts"], entry["transient"]) == ("render_clip_batch", "ValueError", 2, False)
+
+    # cancelled jobs never land in the dead letter queue
+    cancelled = FakeJob()
+    cancelled.id = "rq-cancelled"
+    queue_module._on_failure(cancelled, None, JobCancelled, JobCancelled("stop"), None)
+    assert dlq.count() == 1
+    assert dlq.discard(["rq-render"]) == 1 and dlq.entries() == []
+
+
+def test_sort_batch_applies_decisions_in_one_transaction(client, session, monkeypatch):
+    """a batch of swipes: one lookup per table, versions allocated in order, one render request"""
+    from datetime import datetime
+    from uuid import UUID, uuid4
+    from sqlalchemy import event
+    from app.models import CandidateSegment, FinalClip, HighlightWindow, OriginalFile, Person
+    from app.services.render_coordinator import render_coordinator
+
+    rendered = []
+    monkeypatch.setattr(render_coordinator, "request_renders", lambda clips: rendered.append([c.id for c in clips]))
+
+    file = OriginalFile(
+        original_filename="a.mp4", stored_path="/tmp/a.mp4", file_hash="batch-a",
+        camera_id="CAM1", fps_label="30FPS", fps=30.0, duration_ms=120_000,
+        recorded_at=datetime(2026, 1, 2), processing_status="completed"
+    )
+    session.add(file)
+    segments = [CandidateSegment(original_file_id=file.id, start_ms=i * 10_000, end_ms=i * 10_000 + 2000) for i in range(4)]
+    session.add_all(segments)
+    session.add(Person(display_name="Ann", slug="ann"))
+    session.commit()
+
+    def save(seg, start, person_name):
+        return {"action": "save", "segment_id": str(seg.id), "start_ms": start, "end_ms": start + 2000,
+                "category": "TRICK", "person_name": person_name, "trick_name": "kickflip", "session_name": "S1"}
+
+    statements = []
+    listener = lambda conn, cursor, statement, *a: statements.append(statement)
+    event.listen(session.get_bind(), "before_cursor_execute", listener)
+    response = client.post("/api/sort/batch", json={"decisions": [
+        save(segments[0], 0, "Ann"),
+        save(segments[1], 10_000, "Ann"),
+        save(segments[0], 0, "Ann"),  # same swipe sent twice
+        save(segments[2], 20_000, "Bob"),  # new person
+        {"action": "trash", "segment_id": str(segments[3].id)},
+        {"action": "trash", "segment_id": str(uuid4())},
+    ]})
+    event.remove(session.get_bind(), "before_cursor_execute", listener)
+    assert response.status_code == 200
+    data = response.json()
+    assert [r["status"] for r in data["results"]] == ["saved", "saved", "duplicate", "saved", "trashed", "not_found"]
+    assert data["results"][2]["clip_id"] == data["results"][0]["clip_id"]
+
+    # one lookup each, not one per decision
+    people_selects = [s for s in statements if s.lstrip().startswith("SELECT") and "FROM people" in s]
+    assert len(people_selects) == 1
+    clip_inserts = [s for s in statements if s.startswith("INSERT INTO final_clips")]
+    assert len(clip_inserts) == 1
+
+    filenames = sorted(f.split("__", 2)[2] for f in session.exec(select(FinalClip.filename)).all())
+    assert [f.split("__")[0] + "__" + f.rsplit("__", 1)[1] for f in filenames] == ["ann__v001.mp4", "ann__v002.mp4", "bob__v001.mp4"]
+    assert session.exec(select(Person).where(Person.slug == "bob")).first() is not None
+    assert len(session.exec(select(HighlightWindow).where(HighlightWindow.label == "POSITIVE")).all()) == 3
+    session.expire_all()
+    assert [session.get(CandidateSegment, s.id).status for s in segments] == ["ACCEPTED", "ACCEPTED", "ACCEPTED", "TRASHED"]
+    assert len(rendered) == 1 and len(rendered[0]) == 3
+
+    # saving it again while the first render never reached drive asks for that render again
+    again = {"decisions": [save(segments[1], 10_000, "Ann")]}
+    assert client.post("/api/sort/batch", json=again).json()["results"][0]["status"] == "duplicate"
+    assert rendered[-1] == [UUID(data["results"][1]["clip_id"])]
+    clip = session.get(FinalClip, UUID(data["results"][1]["clip_id"]))
+    clip.is_uploaded_to_drive = True
+    session.add(clip)
+    session.commit()
+    client.post("/api/sort/batch", json=again)
+    assert len(rendered) == 2
+
+    # a save needs its trim points
+    response = client.post("/api/sort/batch", json={"decisions": [{"action": "save", "segment_id": str(segments[3].id)}]})
+    assert response.status_code == 422
+
+
+def test_filename_versions_allocated_from_counters(session):
+    """versions come from a per-base counter, not a scan of existing filenames"""
+    from app.models import FilenameVersion
+    from app.services.filenames import allocate_versions, generate_filename
+
+    assert allocate_versions(session, {"base-a": 2, "base-b": 1}) == {"base-a": [1, 2], "base-b": [1]}
+    assert allocate_versions(session, {"base-a": 1}) == {"base-a": [3]}
+    # a rolled back save gives its version back
+    session.rollback()
+    assert allocate_versions(session, {"base-a": 1}) == {"base-a": [1]}
+    session.commit()
+    assert session.get(FilenameVersion, "base-a").last_version == 1
+    assert allocate_versions(session, {}) == {}
+
+    name = generate_filename("2026-01-02", "S1", "ann", "kickflip", "CAM1", "30FPS", "1080p", "16:9", version=7)
+    assert name == "2026-01-02__S1__ann__kickflip__CAM1__1080p__16x9__30FPS__v007.mp4"
+
+
+def test_sort_next_reads_maintained_review_counters(client, session):
+    """/sort/next context comes from counters kept in step with every status change"""
+    from datetime import datetime
+    from app.models import CandidateSegment, OriginalFile, VideoReviewCount
+    from app.services import review_counts
+
+    def make_video(name, n, confidence):
+        f = OriginalFile(
+            original_filename=name, stored_path=f"/tmp/{name}", file_hash=name,
+            camera_id="CAM1", fps_label="30FPS", fps=30.0, duration_ms=60000,
+            recorded_at=datetime.utcnow(), processing_status="completed"
+        )
+        session.add(f)
+        segments = [CandidateSegment(original_file_id=f.id, start_ms=i * 5000, end_ms=i * 5000 + 1000, confidence_score=confidence - i * 0.01)
+                    for i in range(n)]
+        session.add_all(segments)
+        review_counts.segments_added(session, segments)
+        return segments
+
+    a = make_video("counts-a.mp4", 3, 0.9)
+    b = make_video("counts-b.mp4", 2, 0.5)
+    session.commit()
+
+    context = client.get("/api/sort/next").json()["video_context"]
+    assert context == {
+        "current_index": 0, "total_segments": 3, "unreviewed_segments": 3, "videos_remaining": 2,
+        "segment_ids": [str(s.id) for s in a],
+    }
+
+    client.post("/api/sort/batch", json={"decisions": [{"action": "trash", "segment_id": str(s.id)} for s in a[:2]]})
+    data = client.get("/api/sort/next").json()
+    assert data["segment_id"] == str(a[2].id)
+    assert (data["video_context"]["current_index"], data["video_context"]["unreviewed_segments"]) == (2, 1)
+
+    # the last unreviewed segment of a video takes it off videos_remaining
+    client.post("/api/sort/trash", json={"segment_id": str(a[2].id)})
+    client.post(f"/api/sort/skip-video?segment_id={b[0].id}")
+    assert client.get("/api/sort/next").json() == {"message": "No more segments"}
+    assert review_counts.videos_remaining(session) == 0
+    counts = review_counts.video_counts(session, a[0].original_file_id)
+    assert (counts["total"], counts["unreviewed"], counts["trashed"]) == (3, 0, 3)
+
+    # a recount from the segments table agrees with what was maintained
+    maintained = {row.original_file_id: (row.total, row.unreviewed, row.accepted, row.trashed)
+                  for row in session.exec(select(VideoReviewCount)).all()}
+    assert review_counts.rebuild(session) == {"videos": 2, "videos_remaining": 0}
+    session.expire_all()
+    assert maintained == {row.original_file_id: (row.total, row.unreviewed, row.accepted, row.trashed)
+                          for row in session.exec(select(VideoReviewCount)).all()}
+
+
+def test_sort_next_lookahead_returns_prefetch_plan(client, session, tmp_path, monkeypatch):
+    """?lookahead=N lists the next segments in serving order with what to warm, and queues their prep"""
+    import os
+    import struct
+    from datetime import datetime
+    from types import SimpleNamespace
+    from app.models import CandidateSegment, OriginalFile
+    from app.services.proxy_coordinator import proxy_coordinator
+    from app.services.sort_prefetch import sort_prefetch
+    from app.video.proxy_utils import get_playback_proxy_path
+
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(proxy_coordinator, "redis", SimpleNamespace(hgetall=lambda key: {}))
+    prepared = []
+    monkeypatch.setattr(sort_prefetch, "prepare", lambda file_ids: prepared.extend(file_ids))
+
+    def make_file(name):
+        path = tmp_path / name
+        path.write_bytes(b"source")
+        f = OriginalFile(
+            original_filename=name, stored_path=str(path), file_hash=name,
+            camera_id="CAM1", fps_label="30FPS", fps=30.0, duration_ms=100_000,
+            recorded_at=datetime.utcnow(), processing_status="completed"
+        )
+        session.add(f)
+        return f
+
+    ready, building = make_file("ready.mp4"), make_file("building.mp4")
+    # faststart proxy: ftyp, moov, then 10000 bytes of samples
+    proxy = get_playback_proxy_path(ready.stored_path)
+    proxy.parent.mkdir(parents=True)
+    proxy.write_bytes(struct.pack(">I4s", 24, b"ftyp") + bytes(16) + struct.pack(">I4s", 100, b"moov") + bytes(92)
+                      + struct.pack(">I4s", 10_008, b"mdat") + bytes(10_000))
+    os.utime(proxy, (os.path.getmtime(ready.stored_path) + 1,) * 2)
+
+    session.add(CandidateSegment(original_file_id=ready.id, start_ms=10_000, end_ms=12_000, confidence_score=0.9))
+    after = CandidateSegment(original_file_id=ready.id, start_ms=50_000, end_ms=52_000, confidence_score=0.8)
+    later = CandidateSegment(original_file_id=building.id, start_ms=0, end_ms=1000, confidence_score=0.7)
+    session.add_all([after, later, CandidateSegment(original_file_id=building.id, start_ms=5000, end_ms=6000, confidence_score=0.1)])
+    session.commit()
+
+    assert "lookahead" not in client.get("/api/sort/next").json()
+
+    data = client.get("/api/sort/next?lookahead=2").json()
+    first, second = data["lookahead"]
+    assert (first["segment_id"], second["segment_id"]) == (str(after.id), str(later.id))
+    assert first["media_url"] == f"/api/upload/media/{ready.id}" and first["media_status"] == "ready"
+    assert first["preview_url"] == f"/api/thumbnails/video/{ready.id}"
+    # moov up front in full, then roughly 48s-54s of the 100s of samples
+    [header, samples] = first["warm_ranges"]
+    assert header == [0, 123]
+    assert 132 + 4600 < samples[0] < 132 + 4800 < 132 + 5400 < samples[1] < 132 + 5600
+    assert second["media_status"] == "missing" and second["warm_ranges"] == []
+    assert prepared == [str(ready.id), str(building.id)]
+
+
+def test_playback_proxy_requests_are_single_flight(client, session, tmp_path, monkeypatch):
+    """one build per file however many players ask; /media answers 202 until it's ready"""
+    from datetime import datetime
+    from types import SimpleNamespace
+    from app import worker
+    from app.models import OriginalFile
+    from app.services import proxy_coordinator as coordinator_module
+    from app.services.proxy_coordinator import proxy_coordinator
+
+    class FakeRedis:
+        def __init__(self):
+            self.data, self.hashes = {}, {}
+
+        def set(self, key, value, nx=False, xx=False, ex=None, keepttl=False):
+            if (nx and key in self.data) or (xx and key not in self.data):
+                return None
+            self.data[key] = value
+            return True
+
+        def get(self, key):
+            return self.data.get(key)
+
+        def delete(self, *keys):
+            for key in keys:
+                self.data.pop(key, None)
+                self.hashes.pop(key, None)
+
+        def hset(self, key, mapping):
+            self.hashes.setdefault(key, {}).update({k.encode(): v.encode() for k, v in mapping.items()})
+
+        def expire(self, key, seconds):
+            pass
+
+        def hgetall(self, key):
+            return self.hashes.get(key, {})
+
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(proxy_coordinator, "redis", FakeRedis())
+    enqueued = []
+
+    def fake_enqueue(func, *args, queue_name=None, **kwargs):
+        enqueued.append((func.__name__, args, queue_name))
+        return SimpleNamespace(id=f"job-{len(enqueued)}")
+    monkeypatch.setattr(coordinator_module, "enqueue_job", fake_enqueue)
+    moved = []
+    monkeypatch.setattr(coordinator_module, "move_to_queue", lambda job_id, name: moved.append((job_id, name)) or True)
+
+    source = tmp_path / "a.mp4"
+    source.write_bytes(b"source")
+    file = OriginalFile(original_filename="a.mp4", stored_path=str(source), file_hash="proxy-a", camera_id="CAM1",
+                        fps_label="30FPS", fps=30.0, duration_ms=1000, recorded_at=datetime.utcnow())
+    session.add(file)
+    session.commit()
+
+    for _ in range(3):
+        response = client.get(f"/api/upload/media/{file.id}")
+        assert response.status_code == 202
+        assert response.headers["retry-after"] == "5"
+        assert response.json()["status"] == "queued" and response.json()["job_id"] == "job-1"
+    # a player is waiting on it: interactive lane
+    assert enqueued == [("generate_proxy_for_file", (str(file.id),), "interactive")]
+
+    # background builds (scheduler, prefetch) stay off the interactive lane...
+    from app.services.queue import queue_for_job
+    assert queue_for_job(worker.generate_proxy_for_file).name == "playback_proxy"
+    other = tmp_path / "b.mp4"
+    other.write_bytes(b"source")
+    proxy_coordinator.request_proxy("file-b", str(other))
+    assert enqueued[-1] == ("generate_proxy_for_file", ("file-b",), None)
+    # ...until someone asks to play that video
+    proxy_coordinator.request_proxy("file-b", str(other), interactive=True)
+    assert moved[-1] == ("job-2", "interactive") and len(enqueued) == 2
+    enqueued.pop()
+
+    # the original vanished before the job ran: the build fails instead of sitting "queued"
+    source.unlink()
+    monkeypatch.setattr(worker, "engine", session.get_bind())
+    worker.generate_proxy_for_file(str(file.id))
+    assert proxy_coordinator.get_status(file.id, str(source))["status"] == "failed"
+    source.write_bytes(b"source")
+    assert proxy_coordinator.request_proxy(file.id, str(source))["status"] == "queued"
+    assert len(enqueued) == 2
+
+
+def test_render_batch_debounces_with_scheduled_jobs(monkeypatch):
+    """a burst of saves reschedules the batch job instead of sleeping in the worker"""
+    import time
+    from types import SimpleNamespace
+    from uuid import uuid4
+    from app import worker
+    from app.core.config import settings
+    from app.services import render_coordinator as coordinator_module
+    from app.services.render_coordinator import RenderCoordinator
+
+    class FakeRedis:
+        def __init__(self):
+            self.data = {}
+
+        def pipeline(self, transaction=True):
+            redis, calls = self, []
+
+            class Pipe:
+                def __getattr__(self, name):
+                    return lambda *args, **kwargs: calls.append((name, args, kwargs))
+
+                def execute(self):
+                    return [getattr(redis, name)(*args, **kwargs) for name, args, kwargs in calls]
+            return Pipe()
+
+        def rpush(self, key, *values):
+            self.data.setdefault(key, []).extend(values)
+
+        def expire(self, key, seconds):
+            pass
+
+        def set(self, key, value, nx=False, ex=None):
+            if nx and key in self.data:
+                return None
+            self.data[key] = value
+            return True
+
+        def mget(self, keys):
+            return [self.data.get(k) for k in keys]
+
+        def lrange(self, key, start, end):
+            return list(self.data.get(key, []))
+
+        def delete(self, *keys):
+            for key in keys:
+                self.data.pop(key, None)
+
+    coordinator = RenderCoordinator(redis=FakeRedis())
+    monkeypatch.setattr(coordinator_module, "render_coordinator", coordinator)
+    scheduled = []
+
+    def fake_enqueue(func, *args, delay=None, **kwargs):
+        scheduled.append((func.__name__, delay))
+        return SimpleNamespace(id=f"job-{len(scheduled)}")
+    monkeypatch.setattr(coordinator_module, "enqueue_job", fake_enqueue)
+    monkeypatch.setattr(worker, "get_current_job", lambda: None)
+
+    original_id = uuid4()
+    clips = [SimpleNamespace(id=uuid4(), original_file_id=original_id) for _ in range(3)]
+    assert coordinator.request_renders(clips[:2]) == ["job-1"]
+    assert coordinator.request_renders(clips[2:]) == []
+    assert scheduled == [("render_clip_batch", settings.RENDER_BATCH_WINDOW_SECONDS)]
+
+    # the job fires while clips are still arriving: it schedules itself for the rest of the window
+    worker.render_clip_batch(str(original_id))
+    assert len(scheduled) == 2 and 0 < scheduled[1][1] <= settings.RENDER_BATCH_WINDOW_SECONDS
+    assert coordinator.redis.data[coordinator._pending_key(original_id)]
+
+    # a sorter that never pauses is capped by the max wait since the first clip
+    coordinator.redis.data[coordinator._first_key(original_id)] = str(time.time() - settings.RENDER_BATCH_MAX_WAIT_SECONDS)
+    assert coordinator.quiet_in(original_id) == 0
+    assert coordinator.take_batch(original_id) == [c.id for c in clips]
+    assert coordinator.request_renders(clips[:1]) == ["job-3"]
+
+
+def test_failed_stage_cancels_rest_of_graph(session, monkeypatch):
+    """a stage failing for good cancels its never-started dependents instead of leaving them deferred"""
+    from datetime import datetime
+    from app.models import Job, OriginalFile
+    from app.services import analysis_pipeline as pipeline
+    from app.services import queue as queue_module
+
+    file = OriginalFile(original_filename="a.mp4", stored_path="/tmp/a.mp4", file_hash="graph-a", camera_id="CAM1",
+                        fps_label="30FPS", fps=30.0, duration_ms=1000, recorded_at=datetime.utcnow(),
+                        processing_status="analyzing")
+    session.add(file)
+    rq_status = {"rq-motion": "started", "rq-playback": "started", "rq-candidates": "deferred", "rq-ml": "deferred", "rq-ingest": None}
+    session.add_all(Job(rq_job_id=rq_id, job_type=f"analysis_{rq_id[3:]}", status="queued", file_id=file.id) for rq_id in rq_status)
+    session.commit()
+
+    cancelled = []
+
+    def fake_cancel(rq_job_id, stop_running=True):
+        status = rq_status[rq_job_id]
+        if status is None or (status == "started" and not stop_running):
+            return None
+        cancelled.append(rq_job_id)
+        return status
+    monkeypatch.setattr(queue_module, "cancel_rq_job", fake_cancel)
+    monkeypatch.setattr(pipeline, "engine", session.get_bind())
+    monkeypatch.setattr(pipeline, "publish_log", lambda *a, **k: None)
+    finished = []
+    monkeypatch.setattr(pipeline, "_finish_analysis", finished.append)
+
+    def work(session, file, current_job):
+        raise ValueError("no video stream")
+
+    with pytest.raises(ValueError):
+        pipeline._run_stage(file.id, "motion", work)
+
+    # running siblings keep going; only the stages that would never start are cancelled
+    assert sorted(cancelled) == ["rq-candidates", "rq-ml"]
+    assert finished == [file.id]
+    session.expire_all()
+    assert session.get(OriginalFile, file.id).processing_status == "failed"
+
+
+def test_stage_timeout_retries_only_after_partial_progress(session, tmp_path, monkeypatch):
+    """a job timeout is retried when the stage saved partial progress (the retry resumes), not otherwise"""
+    from datetime import datetime
+    from types import SimpleNamespace
+    import numpy as np
+    from rq.timeouts import JobTimeoutException
+    from app.core.config import settings
+    from app.core.errors import TransientError, is_transient
+    from app.models import OriginalFile
+    from app.services import analysis_pipeline as pipeline
+    from app.services import queue as queue_module
+
+    monkeypatch.setattr(settings, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(pipeline, "engine", session.get_bind())
+    monkeypatch.setattr(pipeline, "get_current_job", lambda: SimpleNamespace(id="rq-motion", retries_left=2))
+    for name in ("start_job", "fail_job", "complete_job", "publish_log", "_finish_analysis"):
+        monkeypatch.setattr(pipeline, name, lambda *a, **k: None)
+    monkeypatch.setattr(queue_module, "cancel_rq_job", lambda *a, **k: None)
+
+    file = OriginalFile(original_filename="long.mp4", stored_path="/tmp/long.mp4", file_hash="timeout-a", camera_id="CAM1",
+                        fps_label="30FPS", fps=30.0, duration_ms=1000, recorded_at=datetime.utcnow(),
+                        processing_status="analyzing")
+    session.add(file)
+    session.commit()
+    params = lambda file: {"proxy": "p"}
+
+    def slow_work(session, file, current_job):
+        path = pipeline._save_series(file.id, "motion.partial", np.arange(3.0), np.ones(3), next_frame=90)
+        pipeline.write_checkpoint(file, "motion.partial", path, params(file))
+        raise JobTimeoutException("Task exceeded maximum timeout value (7200 seconds)")
+
+    with pytest.raises(TransientError) as raised:
+        pipeline._run_stage(file.id, "motion", slow_work, params)
+    assert is_transient(raised.value) and isinstance(raised.value.__cause__, JobTimeoutException)
+    session.expire_all()
+    assert session.get(OriginalFile, file.id).processing_status == "analyzing"
+
+    # timed out again without getting past the last partial: not worth another try
+    def stuck_work(session, file, current_job):
+        raise JobTimeoutException("Task exceeded maximum timeout value (7200 seconds)")
+
+    with pytest.raises(JobTimeoutException):
+        pipeline._run_stage(file.id, "motion", stuck_work, params)
+    session.expire_all()
+    assert session.get(OriginalFile, file.id).processing_status == "failed"
@@ -38,7 +38,7 @@ gcloud compute ssh ${REMOTE_USER}@${REMOTE_HOST} --zone=${ZONE} --command="
 echo "🔨 rebuilding containers..."
 gcloud compute ssh ${REMOTE_USER}@${REMOTE_HOST} --zone=${ZONE} --command="
     cd ${REMOTE_DIR}/deploy
-    docker compose up -d --build --no-deps backend frontend worker
+    docker compose up -d --build --no-deps backend frontend worker worker-interactive
 "
 
 # step 4: verify services are running
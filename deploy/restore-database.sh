@@ -40,7 +40,7 @@ fi
 
 # stop services that use the database
 echo "stopping services..."
-docker compose stop backend worker
+docker compose stop backend worker worker-interactive
 
 # restore database
 echo "restoring database..."
@@ -48,7 +48,7 @@ docker compose exec -T db psql -U trickyclip trickyclip < "$SQL_FILE"
 
 # restart services
 echo "restarting services..."
-docker compose up -d backend worker
+docker compose up -d backend worker worker-interactive
 
 # cleanup temp file
 if [ -f "/tmp/restore.sql" ]; then
@@ -22,7 +22,7 @@ gcloud compute ssh ${REMOTE_USER}@${REMOTE_HOST} --zone=${ZONE} --command="
 echo "🔄 restarting services..."
 gcloud compute ssh ${REMOTE_USER}@${REMOTE_HOST} --zone=${ZONE} --command="
     cd ${REMOTE_DIR}/deploy
-    docker compose restart backend frontend worker
+    docker compose restart backend frontend worker worker-interactive
 "
 
 # step 3: verify services
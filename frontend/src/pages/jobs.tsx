@@ -25,6 +25,27 @@ interface SystemStats {
   containers: Record<string, string>;
 }
 
+interface AnalysisQueueEntry {
+  file_id: string;
+  filename: string | null;
+  status: 'running' | 'waiting';
+  position: number;
+  predicted_seconds: number;
+  eta_seconds: number;
+  analysis_progress_percent: number;
+}
+
+interface DeadLetter {
+  rq_job_id: string;
+  job_type: string;
+  error_type: string;
+  error: string;
+  attempts: number;
+  transient: boolean;
+  failed_at: number;
+  file_id: string | null;
+}
+
 interface Job {
   id: string;
   job_type: string;
@@ -41,6 +62,8 @@ export default function MissionControlPage() {
   const [logs, setLogs] = useState<LogEntry[]>([]);
   const [stats, setStats] = useState<SystemStats | null>(null);
   const [jobs, setJobs] = useState<any>(null);
+  const [analysisQueue, setAnalysisQueue] = useState<AnalysisQueueEntry[]>([]);
+  const [deadLetters, setDeadLetters] = useState<{ count: number; entries: DeadLetter[] }>({ count: 0, entries: [] });
   const [nextPollSeconds, setNextPollSeconds] = useState<number>(120);
   const [filter, setFilter] = useState<string>('all');
   const [autoScroll, setAutoScroll] = useState(true);
@@ -167,10 +190,14 @@ export default function MissionControlPage() {
     const interval = setInterval(() => {
       fetchJobs();
       fetchStats();
+      fetchAnalysisQueue();
+      fetchDeadLetters();
     }, 2000);
     
     fetchJobs();
     fetchStats();
+    fetchAnalysisQueue();
+    fetchDeadLetters();
     
     return () => clearInterval(interval);
   }, []);
@@ -184,6 +211,64 @@ export default function MissionControlPage() {
     }
   };
 
+  const fetchAnalysisQueue = async () => {
+    try {
+      const res = await axios.get('/api/jobs/analysis-queue');
+      setAnalysisQueue(res.data);
+    } catch (e) {
+      console.error('error fetching analysis queue:', e);
+    }
+  };
+
+  const fetchDeadLetters = async () => {
+    try {
+      const res = await axios.get('/api/jobs/dead-letter?limit=20');
+      setDeadLetters(res.data);
+    } catch (e) {
+      console.error('error fetching dead letters:', e);
+    }
+  };
+
+  const replayDeadLetters = async (ids?: string[]) => {
+    try {
+      await axios.post('/api/jobs/dead-letter/replay', { ids: ids ?? null });
+      fetchDeadLetters();
+      fetchJobs();
+    } catch (e) {
+      console.error('error replaying dead letters:', e);
+    }
+  };
+
+  const cancelJob = async (jobId: string) => {
+    try {
+      await axios.post(`/api/jobs/${jobId}/cancel`);
+      fetchJobs();
+      fetchAnalysisQueue();
+    } catch (e) {
+      console.error('error cancelling job:', e);
+    }
+  };
+
+  const cancelAnalysis = async (fileId: string) => {
+    try {
+      await axios.post(`/api/jobs/analysis-queue/${fileId}/cancel`);
+      fetchJobs();
+      fetchAnalysisQueue();
+    } catch (e) {
+      console.error('error cancelling analysis:', e);
+    }
+  };
+
+  const cancelWaitingAnalyses = async () => {
+    if (!window.confirm('cancel every analysis that has not started yet?')) return;
+    try {
+      await axios.post('/api/jobs/analysis-queue/cancel-waiting');
+      fetchAnalysisQueue();
+    } catch (e) {
+      console.error('error cancelling waiting analyses:', e);
+    }
+  };
+
   const fetchStats = async () => {
     try {
       const res = await axios.get('/api/admin/system-stats');
@@ -236,6 +321,13 @@ export default function MissionControlPage() {
     return `${hours}h ${minutes % 60}m`;
   };
 
+  const formatEta = (seconds: number) => {
+    if (seconds < 60) return '<1m';
+    const minutes = Math.round(seconds / 60);
+    if (minutes < 60) return `~${minutes}m`;
+    return `~${Math.floor(minutes / 60)}h ${minutes % 60}m`;
+  };
+
   const allJobs = jobs ? [
     ...(jobs.running || []),
     ...(jobs.queued || []),
@@ -249,6 +341,7 @@ export default function MissionControlPage() {
       'queued': 'bg-yellow-500/20 text-yellow-400 border-yellow-500',
       'completed': 'bg-green-500/20 text-green-400 border-green-500',
       'failed': 'bg-red-500/20 text-red-400 border-red-500',
+      'cancelled': 'bg-gray-500/20 text-gray-400 border-gray-500',
     };
     return badges[status as keyof typeof badges] || 'bg-gray-500/20 text-gray-400 border-gray-500';
   };
@@ -347,6 +440,66 @@ export default function MissionControlPage() {
             </h2>
           </div>
           
+          {analysisQueue.length > 0 && (
+            <div className="p-4 border-b border-gray-800 space-y-2">
+              <div className="text-xs text-gray-500 uppercase tracking-wider font-mono flex items-center justify-between">
+                <span>analysis queue · shortest first</span>
+                {analysisQueue.some((entry) => entry.status === 'waiting') && (
+                  <button onClick={cancelWaitingAnalyses} className="text-gray-500 hover:text-red-400 normal-case">
+                    cancel waiting
+                  </button>
+                )}
+              </div>
+              {analysisQueue.map((entry) => (
+                <div key={entry.file_id} className="flex items-center justify-between text-xs font-mono">
+                  <span className="truncate flex-1 text-gray-300" title={entry.filename || entry.file_id}>
+                    {entry.status === 'running' ? '▶' : `#${entry.position}`} {entry.filename || entry.file_id.substring(0, 12)}
+                  </span>
+                  <span className={`ml-2 ${entry.status === 'running' ? 'text-blue-400' : 'text-yellow-400'}`}>
+                    ready {formatEta(entry.eta_seconds)}
+                  </span>
+                  <button
+                    onClick={() => cancelAnalysis(entry.file_id)}
+                    className="ml-2 text-gray-600 hover:text-red-400"
+                    title="cancel analysis"
+                  >
+                    ✕
+                  </button>
+                </div>
+              ))}
+            </div>
+          )}
+
+          {deadLetters.count > 0 && (
+            <div className="p-4 border-b border-gray-800 space-y-2">
+              <div className="text-xs text-gray-500 uppercase tracking-wider font-mono flex items-center justify-between">
+                <span>dead letter · {deadLetters.count} failed for good</span>
+                <button onClick={() => replayDeadLetters()} className="text-gray-500 hover:text-green-400 normal-case">
+                  replay all
+                </button>
+              </div>
+              {deadLetters.entries.map((entry) => (
+                <div key={entry.rq_job_id} className="text-xs font-mono">
+                  <div className="flex items-center justify-between">
+                    <span className="truncate flex-1 text-gray-300">
+                      {entry.job_type.replace(/_/g, ' ')} · {entry.attempts}x
+                    </span>
+                    <button
+                      onClick={() => replayDeadLetters([entry.rq_job_id])}
+                      className="ml-2 text-gray-600 hover:text-green-400"
+                      title="replay"
+                    >
+                      ↻
+                    </button>
+                  </div>
+                  <div className="text-red-400 truncate" title={entry.error}>
+                    {entry.error_type}: {entry.error}
+                  </div>
+                </div>
+              ))}
+            </div>
+          )}
+
           <div className="p-4 space-y-3">
             {allJobs.length === 0 && (
               <div className="text-center text-gray-600 py-12">
@@ -375,8 +528,18 @@ export default function MissionControlPage() {
                       {new Date(job.created_at).toLocaleTimeString()}
                     </div>
                   </div>
-                  <div className={`px-2 py-1 rounded text-xs font-mono uppercase border ${getStatusBadge(job.status)}`}>
-                    {job.status}
+                  <div className="flex items-center gap-2">
+                    {(job.status === 'running' || job.status === 'queued') && (
+                      <button
+                        onClick={() => cancelJob(job.id)}
+                        className="px-2 py-1 rounded text-xs font-mono uppercase border border-gray-700 text-gray-500 hover:text-red-400 hover:border-red-700"
+                      >
+                        cancel
+                      </button>
+                    )}
+                    <div className={`px-2 py-1 rounded text-xs font-mono uppercase border ${getStatusBadge(job.status)}`}>
+                      {job.status}
+                    </div>
                   </div>
                 </div>
 
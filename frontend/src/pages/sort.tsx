@@ -21,6 +21,15 @@ interface Segment {
   };
 }
 
+interface LookaheadEntry {
+  segment_id: string;
+  original_file_id: string;
+  media_url: string;
+  media_status: string;
+  warm_ranges: [number, number][];
+  poster_url: string | null;
+}
+
 interface Person {
   id: string;
   display_name: string;
@@ -40,6 +49,7 @@ export default function SortPage() {
   const [range, setRange] = useState<[number, number]>([0, 0]);
   const videoRef = useRef<HTMLVideoElement>(null);
   const timelineRef = useRef<HTMLDivElement>(null);
+  const warmedRanges = useRef<Set<string>>(new Set());
   const [isDragging, setIsDragging] = useState<'start' | 'end' | 'region' | null>(null);
   const [dragStartPos, setDragStartPos] = useState<{x: number, rangeStart: number, rangeEnd: number} | null>(null);
   const [isPlaying, setIsPlaying] = useState(false);
@@ -205,10 +215,24 @@ export default function SortPage() {
     }
   };
 
+  // fetch what the upcoming segments need while this one plays, so the next swipe starts at once
+  const prefetchUpcoming = (upcoming: LookaheadEntry[]) => {
+    for (const entry of upcoming) {
+      if (entry.poster_url) new Image().src = entry.poster_url;
+      if (entry.media_status !== 'ready') continue;
+      for (const [first, last] of entry.warm_ranges) {
+        const key = `${entry.original_file_id}:${first}-${last}`;
+        if (warmedRanges.current.has(key)) continue;
+        warmedRanges.current.add(key);
+        fetch(entry.media_url, { headers: { Range: `bytes=${first}-${last}` } }).catch(() => {});
+      }
+    }
+  };
+
   const fetchNext = async () => {
     setLoading(true);
     try {
-      const res = await axios.get('/api/sort/next');
+      const res = await axios.get('/api/sort/next?lookahead=3');
       if (!res || !res.data) {
         console.warn('Empty response from /api/sort/next');
         setSegment(null);
@@ -220,6 +244,7 @@ export default function SortPage() {
         setSegment(null);
       } else {
         setSegment(res.data);
+        if (res.data.lookahead) prefetchUpcoming(res.data.lookahead);
         // add 2s buffer
         const bufferMs = 2000;
         const start = Math.max(0, res.data.start_ms - bufferMs);
@@ -8,6 +8,7 @@ interface UploadProgress {
   status: string;
   fileId?: string;
   jobId?: string;
+  etaSeconds?: number | null;
   error?: string;
 }
 
@@ -55,7 +56,8 @@ export default function UploadPage() {
       updateProgress(index, { 
         progress: 100,
         status: 'complete',
-        fileId: response.data.id
+        fileId: response.data.id,
+        etaSeconds: response.data.analysis_eta_seconds
       });
       
     } catch (error: any) {
@@ -171,7 +173,12 @@ export default function UploadPage() {
                   <div className="flex justify-between items-start mb-2">
                     <div className="flex-1 min-w-0">
                       <div className="font-semibold truncate">{item.filename}</div>
-                      <div className="text-xs text-gray-500 mt-1 capitalize">{item.status}</div>
+                      <div className="text-xs text-gray-500 mt-1 capitalize">
+                        {item.status}
+                        {item.status === 'complete' && item.etaSeconds != null && (
+                          <span className="normal-case"> · ready to sort in ~{Math.max(1, Math.round(item.etaSeconds / 60))} min</span>
+                        )}
+                      </div>
                     </div>
                     <div className="text-sm font-semibold ml-4">
                       {item.progress}%